@@ -0,0 +1,330 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created offline benchmark for PDFProcessor.extract against a local Gemini stand-in
+- 002 - AI - Added the inline request threshold and reported inline parts
+- 003 - AI - Added the count_tokens planning switch
+- 004 - AI - Scaled back only the time spent waiting on the API and reported local work separately
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import random
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+import fitz
+import logfire
+from fake_gemini import FakeGemini, FakeGeminiConfig, LatencyModel
+
+from reader.keys import KeyScheduler
+from reader.pdf import DEFAULT_PROMPT_EN, PROCESSING_FAILED, ChunkResult, PDFProcessor, is_failed_chunk
+from reader.scheduler import FairScheduler
+
+
+def make_pdf(pages: int, image_ratio: float, seed: int) -> bytes:
+    # Text-only pages can take the local fast path; pages with an image always go to the model
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(
+            fitz.Rect(72, 72, 540, 400),
+            f"Section {number + 1}. " + "The quick brown fox jumps over the lazy dog. " * 20,
+            fontsize=10,
+        )
+        if rng.random() < image_ratio:
+            pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), 0)
+            pixmap.clear_with(rng.randrange(256))
+            page.insert_image(fitz.Rect(72, 420, 300, 650), pixmap=pixmap)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def covered_s(intervals: List[Tuple[float, float]], started_at: float, finished_at: float) -> float:
+    # Length of the union of the intervals inside [started_at, finished_at]
+    total = 0.0
+    end = started_at
+    for start, stop in sorted(intervals):
+        start, stop = max(start, end), min(stop, finished_at)
+        if stop > start:
+            total += stop - start
+            end = stop
+    return total
+
+
+# The document being extracted, for the calls the processor makes before it hands out the owner
+current_document: ContextVar[str] = ContextVar("current_document", default="")
+
+
+class ApiClock:
+    """
+    Turns measured time back into real-world seconds.
+
+    Only waits on the API run faster than real time: the fake's calls and the processor's timers are scaled, while
+    planning and rendering run at full speed. A chunk is waiting on the API from the moment its pages are rendered
+    until its text comes back, so that part of a document's time is scaled back and the rest is local work.
+    """
+
+    def __init__(self, time_scale: float):
+        self.time_scale = time_scale
+        self.api_intervals: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+
+    def record(self, owner: str, started_at: float) -> None:
+        self.api_intervals[owner].append((started_at, time.monotonic()))
+
+    def split(self, started_at: float, finished_at: float, owner: Optional[str] = None) -> Tuple[float, float]:
+        """Returns (real-world seconds, local seconds) for one owner, or for all of them."""
+        if owner is None:
+            intervals = [interval for owned in self.api_intervals.values() for interval in owned]
+        else:
+            intervals = self.api_intervals[owner]
+        api_s = covered_s(intervals, started_at, finished_at)
+        local_s = finished_at - started_at - api_s
+        return local_s + api_s / self.time_scale, local_s
+
+    def instrument(self, processor: PDFProcessor) -> None:
+        process_pdf_chunk = processor.process_pdf_chunk
+        measure_token_scale = processor._measure_token_scale
+
+        async def timed_chunk(chunk, prompt, hedge_budget=None, owner="default", render=None):
+            if chunk.local_text is not None:
+                return await process_pdf_chunk(chunk, prompt, hedge_budget, owner, render)
+            api_started_at = time.monotonic()
+
+            async def timed_render():
+                nonlocal api_started_at
+                rendered = await render()
+                api_started_at = time.monotonic()
+                return rendered
+
+            try:
+                return await process_pdf_chunk(chunk, prompt, hedge_budget, owner, render and timed_render)
+            finally:
+                self.record(owner, api_started_at)
+
+        async def timed_token_scale(*args, **kwargs):
+            api_started_at = time.monotonic()
+            try:
+                return await measure_token_scale(*args, **kwargs)
+            finally:
+                self.record(current_document.get(), api_started_at)
+
+        processor.process_pdf_chunk = timed_chunk
+        processor._measure_token_scale = timed_token_scale
+
+
+def build_processor(args: argparse.Namespace, fake: FakeGemini) -> PDFProcessor:
+    # Every duration the processor waits on is scaled with the fake, so results stay comparable at any time scale
+    scale = args.time_scale
+    processor = PDFProcessor(api_keys=[f"bench-key-{i:02d}" for i in range(args.keys)], client_factory=fake.client)
+    processor.cache = None
+    processor.chunk_size = args.chunk_size
+    processor.adaptive_chunking = not args.fixed_chunks
+    processor.text_fast_path = not args.force_llm
+    processor.max_concurrent_tasks = args.concurrency
+    processor.chunk_scheduler = FairScheduler(args.concurrency)
+    processor.key_requests_per_minute = args.scheduler_rpm / scale
+    processor.key_scheduler = KeyScheduler(
+        processor.api_keys,
+        requests_per_minute=processor.key_requests_per_minute,
+        circuit_open_s=30 * scale,
+        rate_limit_cooldown_s=20 * scale,
+    )
+    processor.hedge_requests = args.hedge
+    processor.chunk_timeout_s = args.chunk_timeout * scale
+    processor.api_call_timeout_s = args.call_timeout * scale
+    processor.retry_delay_s = args.retry_delay * scale
+    processor.retry_backoff = args.retry_backoff
+    processor.max_retry_delay_s = args.max_retry_delay * scale
+    processor.inline_max_bytes = args.inline_max_kb * 1024
+    processor.count_tokens = args.count_tokens
+    return processor
+
+
+async def run_document(processor: PDFProcessor, clock: ApiClock, name: str, pages: int, data: bytes) -> Dict[str, Any]:
+    current_document.set(name)
+    started_at = time.monotonic()
+    chunks = 0
+    failed_chunks = 0
+    result = PROCESSING_FAILED
+
+    async for item in processor.extract(io.BytesIO(data), DEFAULT_PROMPT_EN, stream=True, owner=name):
+        if isinstance(item, ChunkResult):
+            chunks += 1
+            failed_chunks += is_failed_chunk(item.text)
+        elif isinstance(item, str):
+            result = item
+
+    latency_s, local_s = clock.split(started_at, time.monotonic(), owner=name)
+    return {
+        "name": name,
+        "pages": pages,
+        "latency_s": latency_s,
+        "local_s": local_s,
+        "chunks": chunks,
+        "failed_chunks": failed_chunks,
+        "failed": result == PROCESSING_FAILED,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    fake = FakeGemini(
+        FakeGeminiConfig(
+            upload_latency=LatencyModel(median_s=args.upload_latency, sigma=0.3),
+            generate_latency=LatencyModel(
+                median_s=args.generate_latency, sigma=args.latency_sigma, per_page_s=args.per_page_latency
+            ),
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            hang_rate=args.hang_rate,
+            key_rpm=args.key_rpm,
+            time_scale=args.time_scale,
+            seed=args.seed,
+        )
+    )
+    processor = build_processor(args, fake)
+    clock = ApiClock(args.time_scale)
+    clock.instrument(processor)
+
+    documents = []
+    for size in args.sizes:
+        for copy in range(args.docs_per_size):
+            data = make_pdf(size, args.image_ratio, seed=args.seed + size * 1000 + copy)
+            documents.append((f"{size}p-{copy}", size, data))
+
+    # Documents arrive together, like a burst of uploads, and share one processor as the web app does
+    started_at = time.monotonic()
+    runs = await asyncio.gather(*(run_document(processor, clock, name, pages, data) for name, pages, data in documents))
+    wall_s, wall_local_s = clock.split(started_at, time.monotonic())
+
+    processor.close()
+
+    latencies = [run["latency_s"] for run in runs]
+    total_pages = sum(run["pages"] for run in runs)
+    by_size = {}
+    for size in args.sizes:
+        size_latencies = [run["latency_s"] for run in runs if run["pages"] == size]
+        by_size[size] = {
+            "p50_s": percentile(size_latencies, 0.5),
+            "p95_s": percentile(size_latencies, 0.95),
+            "p99_s": percentile(size_latencies, 0.99),
+        }
+
+    return {
+        "documents": len(runs),
+        "pages": total_pages,
+        "wall_s": wall_s,
+        "docs_per_min": len(runs) / wall_s * 60 if wall_s else 0.0,
+        "p50_s": percentile(latencies, 0.5),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "local_p50_s": percentile([run["local_s"] for run in runs], 0.5),
+        "wall_local_s": wall_local_s,
+        "by_size": by_size,
+        "chunks": sum(run["chunks"] for run in runs),
+        "failed_chunks": sum(run["failed_chunks"] for run in runs),
+        "failed_documents": sum(run["failed"] for run in runs),
+        "generate_calls": fake.stats.generates,
+        "upload_calls": fake.stats.uploads,
+        "inline_parts": fake.stats.inline_parts,
+        "calls_per_page": fake.stats.generates / total_pages if total_pages else 0.0,
+        "rate_limited": fake.stats.rate_limited,
+        "server_errors": fake.stats.errors,
+        "hangs": fake.stats.hangs,
+        "calls_by_key": fake.stats.calls_by_key,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"documents        {report['documents']} ({report['pages']} pages) in {report['wall_s']:.1f}s")
+    print(f"throughput       {report['docs_per_min']:.2f} docs/min")
+    print(f"latency          p50 {report['p50_s']:.1f}s  p95 {report['p95_s']:.1f}s  p99 {report['p99_s']:.1f}s")
+    for size, stats in report["by_size"].items():
+        print(f"  {size:>4} pages    p50 {stats['p50_s']:.1f}s  p95 {stats['p95_s']:.1f}s  p99 {stats['p99_s']:.1f}s")
+    print(
+        f"local work       p50 {report['local_p50_s']:.2f}s per document, "
+        f"{report['wall_local_s']:.2f}s of wall time (not scaled)"
+    )
+    print(f"chunks           {report['chunks']} ({report['failed_chunks']} failed)")
+    print(f"failed documents {report['failed_documents']}")
+    print(
+        f"api calls        {report['generate_calls']} generate, {report['upload_calls']} upload, "
+        f"{report['inline_parts']} inline, "
+        f"{report['calls_per_page']:.2f} generate calls per page"
+    )
+    print(
+        f"api errors       {report['rate_limited']} rate limited, {report['server_errors']} server errors, "
+        f"{report['hangs']} hangs"
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction against a local Gemini stand-in")
+
+    workload = parser.add_argument_group("workload")
+    workload.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 80], help="pages per synthetic document")
+    workload.add_argument("--docs-per-size", type=int, default=3)
+    workload.add_argument("--image-ratio", type=float, default=0.5, help="share of pages that carry an image")
+    workload.add_argument("--seed", type=int, default=0)
+
+    fake = parser.add_argument_group("fake api (seconds are real-world seconds before --time-scale)")
+    fake.add_argument("--keys", type=int, default=4)
+    fake.add_argument("--key-rpm", type=float, default=15, help="per-key generate quota before 429s")
+    fake.add_argument("--upload-latency", type=float, default=0.3, help="median upload latency")
+    fake.add_argument("--generate-latency", type=float, default=2.0, help="median generate latency per call")
+    fake.add_argument("--per-page-latency", type=float, default=1.0, help="extra generate latency per page")
+    fake.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread of generate latency")
+    fake.add_argument("--error-rate", type=float, default=0.02)
+    fake.add_argument("--rate-limit-rate", type=float, default=0.01, help="spurious 429s on top of the quota")
+    fake.add_argument("--hang-rate", type=float, default=0.0)
+    fake.add_argument("--time-scale", type=float, default=0.05, help="run this much faster than real time")
+
+    processor = parser.add_argument_group("processor")
+    processor.add_argument("--chunk-size", type=int, default=2)
+    processor.add_argument("--fixed-chunks", action="store_true", help="disable adaptive chunk sizing")
+    processor.add_argument("--force-llm", action="store_true", help="disable the local text fast path")
+    processor.add_argument("--concurrency", type=int, default=6)
+    processor.add_argument(
+        "--scheduler-rpm", type=float, default=15, help="requests per minute the key scheduler allows"
+    )
+    processor.add_argument("--hedge", action="store_true")
+    processor.add_argument("--count-tokens", action="store_true", help="calibrate chunk planning with count_tokens")
+    processor.add_argument("--chunk-timeout", type=float, default=180)
+    processor.add_argument("--call-timeout", type=float, default=60)
+    processor.add_argument("--retry-delay", type=float, default=0.5)
+    processor.add_argument("--retry-backoff", type=float, default=1.5)
+    processor.add_argument("--max-retry-delay", type=float, default=5.0)
+    processor.add_argument(
+        "--inline-max-kb", type=int, default=4096, help="send chunks up to this size inline; 0 uploads every chunk"
+    )
+
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logfire.configure(send_to_logfire=False, console=False)
+
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created local stand-in for the Gemini files and models endpoints with latency, error and quota models
+- 002 - AI - Accepted inline PDF byte parts alongside uploaded file handles
+- 003 - AI - Added count_tokens with a characters-per-token approximation
+"""
+
+import asyncio
+import itertools
+import math
+import random
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, List
+
+import fitz
+from google.genai import errors
+from pydantic import BaseModel, Field
+
+
+class LatencyModel(BaseModel):
+    # Log-normal around the median; sigma 0.5 puts p99 at roughly 3x the median
+    median_s: float
+    sigma: float = 0.5
+    per_page_s: float = 0.0
+
+    def sample(self, rng: random.Random, pages: int) -> float:
+        return rng.lognormvariate(math.log(self.median_s), self.sigma) + self.per_page_s * pages
+
+
+class FakeGeminiConfig(BaseModel):
+    upload_latency: LatencyModel = Field(default_factory=lambda: LatencyModel(median_s=0.3, sigma=0.3))
+    generate_latency: LatencyModel = Field(default_factory=lambda: LatencyModel(median_s=2.0, per_page_s=1.0))
+    # Fractions of generate calls that fail with a 5xx, a spurious 429, or never answer at all
+    error_rate: float = 0.02
+    rate_limit_rate: float = 0.01
+    hang_rate: float = 0.0
+    # Per-key quota on generate calls; anything beyond it in a sliding minute gets a 429
+    key_rpm: float = 15
+    output_chars_per_page: int = 1500
+    # Multiplies every latency and the quota window so long scenarios can run in a fraction of the time
+    time_scale: float = 1.0
+    seed: int = 0
+
+
+class FakeGeminiStats(BaseModel):
+    uploads: int = 0
+    generates: int = 0
+    inline_parts: int = 0
+    successes: int = 0
+    rate_limited: int = 0
+    errors: int = 0
+    hangs: int = 0
+    calls_by_key: Dict[str, int] = Field(default_factory=dict)
+
+
+def _page_count(data: bytes) -> int:
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return doc.page_count
+
+
+def _api_error(code: int, status: str, message: str) -> errors.APIError:
+    response_json = {"error": {"code": code, "status": status, "message": message}}
+    if code >= 500:
+        return errors.ServerError(code, response_json)
+    return errors.ClientError(code, response_json)
+
+
+class FakeGemini:
+    def __init__(self, config: FakeGeminiConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.stats = FakeGeminiStats()
+        self.recent_calls: Dict[str, Deque[float]] = defaultdict(deque)
+        self._file_ids = itertools.count()
+
+    def client(self, api_key: str) -> Any:
+        # Only the surface PDFProcessor touches: files.upload plus models.generate_content and count_tokens
+        async def upload(file: Any, config: Any = None) -> Any:
+            return await self.upload(api_key, file)
+
+        async def generate_content(model: str, contents: List[Any], config: Any = None) -> Any:
+            return await self.generate_content(api_key, contents)
+
+        async def count_tokens(model: str, contents: Any, config: Any = None) -> Any:
+            await self._sleep(0.1)
+            return SimpleNamespace(total_tokens=len(str(contents)) // 4)
+
+        return SimpleNamespace(
+            aio=SimpleNamespace(
+                files=SimpleNamespace(upload=upload),
+                models=SimpleNamespace(generate_content=generate_content, count_tokens=count_tokens),
+            )
+        )
+
+    async def _sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds * self.config.time_scale)
+
+    def _take_quota(self, api_key: str) -> bool:
+        now = time.monotonic()
+        window_s = 60 * self.config.time_scale
+        calls = self.recent_calls[api_key]
+        while calls and now - calls[0] > window_s:
+            calls.popleft()
+        if len(calls) >= self.config.key_rpm:
+            return False
+        calls.append(now)
+        return True
+
+    async def upload(self, api_key: str, file: Any) -> Any:
+        data = file.read()
+        pages = _page_count(data)
+
+        self.stats.uploads += 1
+        await self._sleep(self.config.upload_latency.sample(self.rng, pages))
+        return SimpleNamespace(name=f"files/bench-{next(self._file_ids)}", size_bytes=len(data), page_count=pages)
+
+    def _part_pages(self, part: Any) -> int:
+        inline_data = getattr(part, "inline_data", None)
+        if inline_data is not None:
+            self.stats.inline_parts += 1
+            return _page_count(inline_data.data)
+        return getattr(part, "page_count", 1)
+
+    async def generate_content(self, api_key: str, contents: List[Any]) -> Any:
+        pages = sum(self._part_pages(part) for part in contents)
+        self.stats.generates += 1
+        self.stats.calls_by_key[api_key] = self.stats.calls_by_key.get(api_key, 0) + 1
+
+        if not self._take_quota(api_key):
+            self.stats.rate_limited += 1
+            await self._sleep(0.05)
+            raise _api_error(429, "RESOURCE_EXHAUSTED", "Quota exceeded for this key")
+
+        roll = self.rng.random()
+        if roll < self.config.rate_limit_rate:
+            self.stats.rate_limited += 1
+            await self._sleep(0.05)
+            raise _api_error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted")
+        roll -= self.config.rate_limit_rate
+
+        if roll < self.config.error_rate:
+            self.stats.errors += 1
+            await self._sleep(self.config.generate_latency.sample(self.rng, 0) / 2)
+            raise _api_error(503, "UNAVAILABLE", "The model is overloaded")
+        roll -= self.config.error_rate
+
+        if roll < self.config.hang_rate:
+            self.stats.hangs += 1
+            # Left to the client's own timeout, as with a real stalled connection
+            await asyncio.Event().wait()
+
+        await self._sleep(self.config.generate_latency.sample(self.rng, pages))
+        self.stats.successes += 1
+        body = "Lorem ipsum dolor sit amet. " * (self.config.output_chars_per_page // 28)
+        text = "\n\n".join(f"### Page {page + 1}\n\n{body}" for page in range(pages))
+        return SimpleNamespace(text=text)
@@ -9,38 +9,69 @@
 - 006 - AI - Improved user experience by separating file upload from processing
 - 007 - AI - Simplified request/response models by removing PDFUploadResponse
 - 008 - AI - Improved file handling and button state management
+- 009 - AI - Exposed in-order partial results while a task is still processing
+- 010 - AI - Switched to the process-wide shared PDFProcessor instead of one per task
+- 011 - AI - Scheduled chunks fairly per task and showed each task's queued chunk count
+- 012 - AI - Streamed uploads to disk in fixed-size chunks with an on-the-fly SHA-256 and a size limit
+- 013 - AI - Coalesced identical extraction requests onto in-flight tasks and reused recent results
+- 014 - AI - Moved tasks into a pluggable persistent store and kept uploads in a dedicated, periodically swept directory
+- 015 - AI - Pushed task progress over Server-Sent Events, keeping status polling as a fallback
+- 016 - AI - Added retrying only the failed chunks of a finished task and splicing them into its result
+- 017 - AI - Added queue execution mode that hands extraction to separate worker processes
+- 018 - AI - Added Prometheus-format /metrics with stage latencies, key stats, queue depth and active tasks
+- 019 - AI - Loaded finished results in lazily revealed chunk sections, gzip-compressed, with a streaming download
+- 020 - AI - Added a cancel button and endpoint, and cancelled tasks nobody has watched for READER_ABANDON_AFTER_S
+- 021 - AI - Turned away new documents with 429 and Retry-After when the page backlog would not drain in time
+- 022 - AI - Answered uploads with a malformed Content-Length with 400 instead of failing with 500
+- 023 - AI - Coalesced requests on the hash computed at upload instead of one supplied by the client
+- 024 - AI - Rejected temp file names that resolve outside the upload directory
+- 025 - AI - Streamed only newly finished chunks to the page instead of resending every partial result
+- 026 - AI - Checked the configured store backend for queue mode instead of the store's type
+- 027 - AI - Identified each page following a task so one page's cancel leaves the task running for the others
+- 028 - AI - Let a document turned away by admission keep its place across its retries
 """
 
 import asyncio
+import hashlib
 import os
 import time
 import urllib.parse
 import uuid
-from enum import Enum
 from tempfile import NamedTemporaryFile
-from typing import Dict, Optional
+from typing import List, Optional, Tuple
 
+import fitz
 import logfire
 from fasthtml.common import *
 from pydantic import BaseModel, Field
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
 
+from reader.admission import AdmissionController
 from reader.config import configure_logfire
-from reader.pdf import DEFAULT_PROMPT_CN, DEFAULT_PROMPT_EN, PDFProcessor
-
-
-class TaskStatus(Enum):
-    PROCESSING = "processing"
-    COMPLETED = "completed"
-    ERROR = "error"
-
-
-class Task(BaseModel):
-    status: TaskStatus = Field(default=TaskStatus.PROCESSING)
-    original_filename: str
-    temp_filename: str
-    result: Optional[str] = None
-    error: Optional[str] = None
-    progress: int = Field(default=0)
+from reader.jobs import JobKind, JobQueue
+from reader.metrics import REGISTRY
+from reader.pdf import PROCESSING_FAILED, ChunkResult, get_pdf_processor, get_prompt
+from reader.store import Task, TaskStatus, create_task_store, task_db_path, task_store_backend
+from reader.tasks import UPLOAD_DIR, TaskManager
+from reader.worker import run_extraction, run_retry
+
+UPLOAD_READ_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("READER_MAX_UPLOAD_MB", "200")) * 1024 * 1024
+RESULT_REUSE_TTL_S = int(os.environ.get("READER_RESULT_REUSE_TTL_S", "3600"))
+TASK_TTL_S = int(os.environ.get("READER_TASK_TTL_S", str(24 * 3600)))
+MAX_RESULT_MB = int(os.environ.get("READER_MAX_RESULT_MB", "1024"))
+# Processing tasks with no status poll or event stream for this long are cancelled; 0 disables
+ABANDON_AFTER_S = float(os.environ.get("READER_ABANDON_AFTER_S", "120"))
+# New documents are turned away while the pages ahead of them would take longer than this; 0 admits everything
+ADMISSION_MAX_WAIT_S = float(os.environ.get("READER_ADMISSION_MAX_WAIT_S", "600"))
+# Throughput assumed until completed tasks have been measured
+ADMISSION_PAGES_PER_S = float(os.environ.get("READER_ADMISSION_PAGES_PER_S", "1.0"))
+UPLOAD_NOT_FOUND = "Error: Temporary file not found. Please try uploading again."
+# Chunks per lazily loaded section request; 2-page chunks make this about 20 pages
+RESULT_PAGE_CHUNKS = 10
+# "inline" runs extraction in this process; "queue" hands it to `python -m reader.worker` processes
+EXECUTION_MODE = os.environ.get("READER_EXECUTION", "inline")
 
 
 class PDFRequest(BaseModel):
@@ -49,49 +80,103 @@ class PDFRequest(BaseModel):
     language: str = Field(default="cn", pattern="^(cn|en)$")
 
 
-class TaskManager:
-    def __init__(self):
-        self.tasks: Dict[str, Task] = {}
+def make_dedup_key(content_hash: str, prompt: str) -> str:
+    return hashlib.sha256(f"{content_hash}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def count_pages(path: str) -> int:
+    try:
+        with fitz.open(path) as doc:
+            return doc.page_count
+    except Exception as e:
+        # Extraction reports unreadable files itself; admission just treats them as empty
+        logfire.warn(f"Could not count pages of {path}: {str(e)}")
+        return 0
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while data := f.read(UPLOAD_READ_SIZE):
+            digest.update(data)
+    return digest.hexdigest()
 
-    def add_task(self, task_id: str, original_filename: str, temp_filename: str) -> Task:
-        # Clean up previous temp file if it exists
-        if task_id in self.tasks and os.path.exists(self.tasks[task_id].temp_filename):
+
+class UploadSizeLimitMiddleware:
+    # Reject oversized uploads from Content-Length before the multipart body is read at all
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/api/pdf/upload":
+            content_length = dict(scope["headers"]).get(b"content-length")
             try:
-                os.remove(self.tasks[task_id].temp_filename)
-            except Exception as e:
-                logfire.error(f"Failed to remove old temp file: {str(e)}")
-
-        task = Task(original_filename=original_filename, temp_filename=temp_filename, progress=0)
-        self.tasks[task_id] = task
-        return task
-
-    def update_progress(self, task_id: str, progress: int) -> None:
-        if task_id in self.tasks:
-            self.tasks[task_id].progress = progress
-
-    def set_completed(self, task_id: str, result: str) -> None:
-        if task_id in self.tasks:
-            self.tasks[task_id].status = TaskStatus.COMPLETED
-            self.tasks[task_id].result = result
-            self.tasks[task_id].progress = 100
-
-    def set_error(self, task_id: str, error: str) -> None:
-        if task_id in self.tasks:
-            self.tasks[task_id].status = TaskStatus.ERROR
-            self.tasks[task_id].error = error
-
-    def get_task(self, task_id: str) -> Optional[Task]:
-        return self.tasks.get(task_id)
-
-    def is_processing(self, temp_filename: str) -> bool:
-        return any(
-            task.status == TaskStatus.PROCESSING and task.temp_filename == temp_filename for task in self.tasks.values()
-        )
+                declared_bytes = int(content_length) if content_length else None
+            except ValueError:
+                response = JSONResponse({"success": False, "error": "Invalid Content-Length header"}, status_code=400)
+                await response(scope, receive, send)
+                return
+            # Allow some room for the multipart envelope around the file itself
+            if declared_bytes is not None and declared_bytes > MAX_UPLOAD_BYTES + 64 * 1024:
+                await upload_too_large()(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def upload_too_large() -> JSONResponse:
+    max_upload_mb = MAX_UPLOAD_BYTES // (1024 * 1024)
+    return JSONResponse({"success": False, "error": f"File exceeds the {max_upload_mb} MB limit"}, status_code=413)
 
 
 configure_logfire()
 
-task_manager = TaskManager()
+if EXECUTION_MODE == "queue" and task_store_backend() != "sqlite":
+    raise ValueError("READER_EXECUTION=queue needs READER_TASK_STORE=sqlite to share tasks with the workers")
+
+task_store = create_task_store()
+job_queue: Optional[JobQueue] = None
+
+if EXECUTION_MODE == "queue":
+    job_queue = JobQueue(task_db_path())
+elif EXECUTION_MODE != "inline":
+    raise ValueError(f"Unknown READER_EXECUTION mode: {EXECUTION_MODE}")
+
+task_manager = TaskManager(
+    task_store,
+    UPLOAD_DIR,
+    reuse_ttl_s=RESULT_REUSE_TTL_S,
+    task_ttl_s=TASK_TTL_S,
+    max_result_bytes=MAX_RESULT_MB * 1024 * 1024,
+    poll_interval_s=1.0 if job_queue else None,
+    abandon_after_s=ABANDON_AFTER_S,
+)
+
+if job_queue is None:
+    task_manager.fail_interrupted()
+else:
+    REGISTRY.gauge("reader_jobs_queued", "Extraction jobs waiting for a worker", function=job_queue.queued_count)
+
+REGISTRY.gauge("reader_tasks_processing", "Tasks currently being extracted", function=task_manager.processing_count)
+
+# Page counts live in the shared store, so in queue mode this measures the worker pool as a whole
+admission = AdmissionController(
+    task_manager.page_stats, max_wait_s=ADMISSION_MAX_WAIT_S, initial_pages_per_s=ADMISSION_PAGES_PER_S
+)
+admission.register_metrics(REGISTRY)
+
+
+async def start_task_eviction() -> None:
+    asyncio.create_task(task_manager.run_eviction())
+
+
+async def start_task_reaper() -> None:
+    if ABANDON_AFTER_S > 0:
+        asyncio.create_task(task_manager.run_reaper())
+
+
+async def start_admission_sampler() -> None:
+    if ADMISSION_MAX_WAIT_S > 0:
+        asyncio.create_task(admission.run_sampler())
 
 
 def get_version() -> str:
@@ -106,7 +191,11 @@ app, rt = fast_app(
         Link(rel="stylesheet", href=f"/static/css/styles.css?v={get_version()}", type="text/css"),
         Script(src=f"/static/js/file-input.js?v={get_version()}"),
         Script(src=f"/static/js/clipboard.js?v={get_version()}"),
+        Script(src="https://cdn.jsdelivr.net/npm/htmx-ext-sse@2.2.2/sse.js"),
     ),
+    # GZip skips text/event-stream, so the SSE progress stream is left uncompressed
+    middleware=(Middleware(UploadSizeLimitMiddleware), Middleware(GZipMiddleware, minimum_size=1024)),
+    on_startup=[start_task_eviction, start_task_reaper, start_admission_sampler],
 )
 
 
@@ -178,30 +267,58 @@ def home() -> FT:
 
 @rt("/api/pdf/upload")
 async def upload_pdf(pdf_file: UploadFile):
+    temp_filename = None
     try:
-        with NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            temp_file.write(await pdf_file.read())
-
-        return {"success": True, "temp_filename": temp_file.name, "original_filename": pdf_file.filename}
+        if pdf_file.size is not None and pdf_file.size > MAX_UPLOAD_BYTES:
+            return upload_too_large()
+
+        digest = hashlib.sha256()
+        size_bytes = 0
+
+        # Copy in fixed-size pieces so a large upload never sits in memory in one buffer
+        with NamedTemporaryFile(delete=False, suffix=".pdf", dir=UPLOAD_DIR) as temp_file:
+            temp_filename = temp_file.name
+            while data := await pdf_file.read(UPLOAD_READ_SIZE):
+                size_bytes += len(data)
+                if size_bytes > MAX_UPLOAD_BYTES:
+                    break
+                digest.update(data)
+                await asyncio.to_thread(temp_file.write, data)
+
+        if size_bytes > MAX_UPLOAD_BYTES:
+            os.remove(temp_filename)
+            return upload_too_large()
+
+        # Kept on the server, so a client cannot claim another document's hash to join its task
+        task_manager.remember_upload(temp_filename, digest.hexdigest())
+        return {
+            "success": True,
+            "temp_filename": temp_filename,
+            "original_filename": pdf_file.filename,
+            "size_bytes": size_bytes,
+        }
     except Exception as e:
         logfire.error(f"/api/pdf/upload: {str(e)}")
+        if temp_filename and os.path.exists(temp_filename):
+            os.remove(temp_filename)
         return {"success": False, "error": str(e)}
 
 
 @rt("/api/pdf/extract")
 async def extract_pdf(request: PDFRequest):
     try:
-        if not os.path.exists(request.temp_filename):
-            return Div("Error: Temporary file not found. Please try uploading again.", cls="error")
+        temp_filename = task_manager.resolve_upload(request.temp_filename)
+        if temp_filename is None or not os.path.exists(temp_filename):
+            return Div(UPLOAD_NOT_FOUND, cls="error")
 
         # Check if the file is already being processed
-        if task_manager.is_processing(request.temp_filename):
+        if task_manager.is_processing(temp_filename):
             return Div(
                 "Error: This file is already being processed. Please wait for the current process to complete.",
                 cls="error",
             )
 
-        encoded_temp_filename = urllib.parse.quote(request.temp_filename)
+        encoded_temp_filename = urllib.parse.quote(temp_filename)
         encoded_original_filename = urllib.parse.quote(request.original_filename)
         encoded_language = urllib.parse.quote(request.language)
 
@@ -221,85 +338,175 @@ async def extract_pdf(request: PDFRequest):
 
 @rt("/api/pdf/process")
 async def process_pdf(request: PDFRequest):
-    temp_filename = urllib.parse.unquote(request.temp_filename)
+    temp_filename = task_manager.resolve_upload(urllib.parse.unquote(request.temp_filename))
+    if temp_filename is None or not os.path.exists(temp_filename):
+        return Div(Script("enableExtractButton();"), Div(UPLOAD_NOT_FOUND, cls="error"))
+
     original_filename = urllib.parse.unquote(request.original_filename)
     language = urllib.parse.unquote(request.language)
+    # Uploads from before a restart are hashed again rather than trusting anything the client sends
+    content_hash = task_manager.upload_hash(temp_filename) or await asyncio.to_thread(hash_file, temp_filename)
+    dedup_key = make_dedup_key(content_hash, get_prompt(language))
+    pages = await asyncio.to_thread(count_pages, temp_filename)
+
+    # Attach to an identical in-flight task, or hand back a recent result, instead of extracting again.
+    # There is no await between this lookup and add_task, so simultaneous requests cannot both miss.
+    existing_task_id = task_manager.find_reusable(dedup_key)
+    if existing_task_id:
+        logfire.info(f"/api/pdf/process: reusing task {existing_task_id} for {original_filename}")
+        task_id = existing_task_id
+    else:
+        retry_after_s = admission.check(pages, key=dedup_key)
+        if retry_after_s is not None:
+            return render_busy(request, retry_after_s)
+
+        task_id = str(uuid.uuid4())
+        task_manager.add_task(task_id, original_filename, temp_filename, content_hash, dedup_key, language, pages)
+        if job_queue:
+            job_queue.enqueue(task_id, JobKind.EXTRACT)
+        else:
+            run = asyncio.create_task(run_extraction(task_manager, task_id, temp_filename, original_filename, language))
+            task_manager.track(task_id, run)
+
+    return render_task_container(task_id)
+
+
+def render_busy(request: PDFRequest, retry_after_s: float) -> HTMLResponse:
+    # The page retries by itself, so a busy server queues the request client-side instead of dropping it
+    query = urllib.parse.urlencode(
+        {
+            "temp_filename": request.temp_filename,
+            "original_filename": request.original_filename,
+            "language": request.language,
+        }
+    )
+    start_at = time.strftime("%H:%M:%S", time.localtime(time.time() + retry_after_s))
+    busy = Div(
+        Script("updateProcessingStatus('Waiting', 0);"),
+        Div(
+            f"服务繁忙：前面还有约 {admission.backlog_pages:.0f} 页待处理，预计 {start_at} 开始，届时将自动重试",
+            cls="queue-status",
+        ),
+        Div(
+            hx_get=f"/api/pdf/process?{query}",
+            hx_trigger=f"load delay:{retry_after_s:.0f}s",
+            hx_target="#extraction-result",
+        ),
+    )
+    return HTMLResponse(to_xml(busy), status_code=429, headers={"Retry-After": f"{retry_after_s:.0f}"})
+
 
-    task_id = str(uuid.uuid4())
-    task_manager.add_task(task_id, original_filename, temp_filename)
-    asyncio.create_task(process_pdf_background(task_id, temp_filename, original_filename, language))
+def render_task_container(task_id: str) -> FT:
+    task = task_manager.get_task(task_id)
+    if task is None or task.status != TaskStatus.PROCESSING:
+        return render_task_done(task_id, task)
 
+    # Requests coalesced onto one task each get their own id, so a cancel only stops the task once all have left
+    subscriber = task_manager.subscribe(task_id)
     return Div(
-        Script("updateProcessingStatus('Processing', 0);"),
+        Script(f"updateProcessingStatus('Processing', {task.progress});"),
         Div(
+            Div(id="task-progress", sse_swap="status,done", hx_swap="innerHTML"),
+            Div(id="task-partial", cls="result partial"),
             id="result-container",
-            hx_get=f"/api/tasks/{task_id}/status",
-            hx_trigger="every 1s",
+            hx_ext="sse",
+            sse_connect=f"/api/tasks/{task_id}/events?subscriber={subscriber}",
+            sse_close="done",
+            # Fall back to polling the status endpoint if the event stream cannot be used
+            hx_get=f"/api/tasks/{task_id}/status?subscriber={subscriber}",
+            hx_trigger="htmx:sseError once",
             hx_swap="outerHTML",
         ),
     )
 
 
-async def process_pdf_background(
-    task_id: str,
-    temp_filename: str,
-    original_filename: str,
-    language: str = "cn",
-) -> None:
-    with logfire.span(f"/process-pdf: {original_filename}"):
-        try:
-            pdf_processor = PDFProcessor()
-            prompt = DEFAULT_PROMPT_EN if language == "en" else DEFAULT_PROMPT_CN
+def render_task_progress(task_id: str, task: Task, subscriber: str) -> tuple:
+    # Chunk queues live in the worker processes in queue mode
+    queued_chunks = get_pdf_processor().chunk_scheduler.queue_depth(task_id) if job_queue is None else 0
+    queue_status = Div(f"排队中：{queued_chunks} 个分块", cls="queue-status") if queued_chunks else ""
+    cancel_button = Div(
+        Button(
+            "取消",
+            cls="copy-btn cancel-btn",
+            hx_post=f"/api/tasks/{task_id}/cancel?subscriber={subscriber}",
+            hx_target="#results",
+        ),
+        cls="copy-btn-container",
+    )
+    return Script(f"updateProcessingStatus('Processing', {task.progress});"), cancel_button, queue_status
 
-            with open(temp_filename, "rb") as pdf_file:
-                async for progress in pdf_processor.extract(pdf_file, prompt):
-                    if isinstance(progress, int):
-                        task_manager.update_progress(task_id, progress)
-                    else:
-                        task_manager.set_completed(task_id, progress)
 
-        except Exception as e:
-            logfire.error(f"/process-pdf: {str(e)}")
-            task_manager.set_error(task_id, str(e))
+def load_partial(task_id: str, start: int) -> Tuple[List[FT], int]:
+    """
+    Render the chunks finished since start, up to the first one still missing, and return the index after them.
 
+    Only the new chunks are read, so each update costs what was just extracted rather than the whole result.
+    """
+    sections = []
+    end = start
+    for chunk in task_manager.get_chunks(task_id, start):
+        if chunk.index != end:
+            break
+        if chunk.text.strip():
+            sections.append(render_result_section(chunk))
+        end += 1
+    return sections, end
+
+
+def render_partial(sections: List[FT], start: int) -> FT:
+    if start and not sections:
+        return ""
+    # The first message of a connection replaces the sections so a reconnect does not duplicate them
+    return Div(*sections, id="task-partial", hx_swap_oob="innerHTML" if start == 0 else "beforeend")
+
+
+def clear_partial() -> FT:
+    return Div(id="task-partial", hx_swap_oob="true")
 
-@rt("/api/tasks/{task_id}/status")
-async def check_status(task_id: str):
-    task = task_manager.get_task(task_id)
 
+def render_task_done(task_id: str, task: Optional[Task]) -> FT:
     if not task:
         return Div(
             Script("enableExtractButton();"),
             Div("The task does not exist or has expired", cls="error"),
         )
 
-    if task.status == TaskStatus.PROCESSING:
-        return Div(
-            Script(f"updateProcessingStatus('Processing', {task.progress});"),
-            Div(
-                id="result-container",
-                hx_get=f"/api/tasks/{task_id}/status",
-                hx_trigger="every 1s",
-                hx_swap="outerHTML",
-            ),
-        )
+    if task.status == TaskStatus.COMPLETED:
+        result_id = f"pdf-result-{task_id[:8]}"
+        download_url = f"/api/tasks/{task_id}/download"
 
-    elif task.status == TaskStatus.COMPLETED:
-        result = task.result
-        result_id = "pdf-result-" + str(hash(result))[1:8]
+        retry_button = (
+            Button(
+                f"重试失败的分块（{task.failed_chunks}）",
+                cls="copy-btn retry-btn",
+                hx_post=f"/api/tasks/{task_id}/retry",
+                hx_target="#results",
+            )
+            if task.failed_chunks
+            else ""
+        )
 
         return Div(
             Script("enableExtractButton();"),
             Div(
+                retry_button,
+                A("下载 Markdown", href=download_url, cls="copy-btn download-btn"),
                 Button(
                     Div("复制文本", style="display: inline-flex; align-items: center; gap: 0.35rem;"),
                     id=f"copy-btn-{result_id}",
                     cls="copy-btn",
-                    onclick=f"copyToClipboard('{result_id}')",
+                    # Only the sections scrolled into view are on the page, so copy from the full download
+                    onclick=f"copyFromUrl('{download_url}', 'copy-btn-{result_id}')",
                 ),
                 cls="copy-btn-container",
             ),
-            Div(result, id=result_id, cls="result"),
+            Div(render_section_loader(task_id, 0), id=result_id, cls="result"),
+        )
+
+    elif task.status == TaskStatus.CANCELLED:
+        return Div(
+            Script("enableExtractButton();"),
+            Div(f"Task cancelled: {task.error}", cls="error"),
         )
 
     else:  # Error case
@@ -309,10 +516,140 @@ async def check_status(task_id: str):
         )
 
 
+def render_result_section(chunk: ChunkResult) -> FT:
+    return Div(chunk.text, cls="result-section", data_pages=f"{chunk.start_page + 1}-{chunk.end_page + 1}")
+
+
+def render_section_loader(task_id: str, start: int) -> FT:
+    return Div(
+        hx_get=f"/api/tasks/{task_id}/sections?start={start}",
+        hx_trigger="intersect once",
+        hx_swap="outerHTML",
+        cls="result-loader",
+    )
+
+
+@rt("/api/tasks/{task_id}/sections")
+async def task_sections(task_id: str, start: int = 0):
+    chunks = await asyncio.to_thread(task_manager.get_chunks, task_id, start, RESULT_PAGE_CHUNKS)
+    sections = [render_result_section(chunk) for chunk in chunks if chunk.text.strip()]
+
+    if len(chunks) == RESULT_PAGE_CHUNKS:
+        # The next page loads when this placeholder scrolls into view
+        sections.append(render_section_loader(task_id, chunks[-1].index + 1))
+    elif start == 0 and not sections:
+        sections.append(Div(PROCESSING_FAILED, cls="result-section"))
+
+    return tuple(sections)
+
+
+@rt("/api/tasks/{task_id}/download")
+async def download_result(task_id: str):
+    task = task_manager.get_task(task_id)
+    if not task or task.status != TaskStatus.COMPLETED:
+        return Response("The task does not exist, has expired or is not finished", status_code=404)
+
+    filename = os.path.splitext(task.original_filename)[0] + ".md"
+    return StreamingResponse(
+        (piece.encode("utf-8") for piece in task_manager.iter_result(task_id)),
+        media_type="text/markdown; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{urllib.parse.quote(filename)}"},
+    )
+
+
+@rt("/api/tasks/{task_id}/status")
+async def check_status(task_id: str, start: Optional[int] = None, subscriber: str = ""):
+    """
+    Polling fallback for the event stream.
+
+    Without start this replaces the whole result container; each poll after that replaces only
+    #task-progress and appends the chunks finished since the previous poll.
+    """
+    task = task_manager.poll(task_id, subscriber)
+
+    if not task or task.status != TaskStatus.PROCESSING:
+        if start is None:
+            return render_task_done(task_id, task)
+        return Div(render_task_done(task_id, task), id="task-progress"), clear_partial()
+
+    sections, end = await asyncio.to_thread(load_partial, task_id, start or 0)
+    poller = Div(
+        *render_task_progress(task_id, task, subscriber),
+        id="task-progress",
+        hx_get=f"/api/tasks/{task_id}/status?start={end}&subscriber={subscriber}",
+        hx_trigger="load delay:1s",
+        hx_swap="outerHTML",
+    )
+    if start is None:
+        return Div(poller, Div(*sections, id="task-partial", cls="result partial"), id="result-container")
+    return poller, render_partial(sections, start)
+
+
+@rt("/api/tasks/{task_id}/retry", methods=["post"])
+async def retry_task(task_id: str):
+    task = task_manager.get_task(task_id)
+    temp_filename = task_manager.resolve_upload(task.temp_filename) if task else None
+    if not task or temp_filename is None or not os.path.exists(temp_filename):
+        return Div("Error: The original file is no longer available. Please upload it again.", cls="error")
+
+    failed = task_manager.start_retry(task_id)
+    if failed:
+        logfire.info(f"/api/tasks/{task_id}/retry: retrying {len(failed)} failed chunks")
+        if job_queue:
+            job_queue.enqueue(task_id, JobKind.RETRY, {"chunks": [chunk.index for chunk in failed]})
+        else:
+            task_manager.track(task_id, asyncio.create_task(run_retry(task_manager, task_id, failed, task)))
+
+    return Div(
+        Script("disableExtractButton();"),
+        render_task_container(task_id),
+        cls="processing-container",
+    )
+
+
+@rt("/api/tasks/{task_id}/cancel", methods=["post"])
+async def cancel_task(task_id: str, subscriber: str = ""):
+    if task_manager.cancel(task_id, subscriber=subscriber):
+        logfire.info(f"/api/tasks/{task_id}/cancel: cancelled by the user")
+
+    task = task_manager.get_task(task_id)
+    if task and task.status == TaskStatus.PROCESSING:
+        # Other requests for the same document are still waiting, so only this page stops following it
+        return Div(
+            Script("enableExtractButton();"),
+            Div("Task cancelled: other requests are still waiting for this result", cls="error"),
+        )
+    return render_task_done(task_id, task)
+
+
+@rt("/api/tasks/{task_id}/events")
+async def task_events(task_id: str, subscriber: str = ""):
+    async def stream():
+        start = 0
+        async for task in task_manager.watch(task_id, subscriber):
+            if task is None or task.status != TaskStatus.PROCESSING:
+                yield sse_message(Div(render_task_done(task_id, task), clear_partial()), event="done")
+            else:
+                sections, end = await asyncio.to_thread(load_partial, task_id, start)
+                yield sse_message(
+                    Div(*render_task_progress(task_id, task, subscriber), render_partial(sections, start)),
+                    event="status",
+                )
+                start = end
+
+    return EventStream(stream())
+
+
 @rt("/up")
 def up():
     return "OK"
 
 
+@rt("/metrics")
+def metrics():
+    # In queue mode the extraction stages are recorded by each worker's own --metrics-port
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 if __name__ == "__main__":
     serve()
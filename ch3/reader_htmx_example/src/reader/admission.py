@@ -0,0 +1,124 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created admission control that weighs queued pages against measured pages-per-second throughput
+- 002 - AI - Removed the unused estimated_wait_s; Retry-After comes from check()
+- 003 - AI - Aged documents that keep retrying so large ones are not starved by a steady stream of small ones
+"""
+
+import asyncio
+import math
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import logfire
+
+from reader.metrics import ADMISSION_REJECTED_TOTAL, Registry
+
+# (pages still to extract across processing tasks, pages of tasks completed after the given time)
+PageStats = Callable[[float], Tuple[float, int]]
+
+
+class AdmissionController:
+    """
+    Admit a new document only if the backlog ahead of it can drain within max_wait_s.
+
+    Throughput is the ratio of pages completed to seconds spent busy, both decayed with the same half-life,
+    so idle time does not drag the rate down and old measurements fade. A prior worth prior_s seconds at
+    initial_pages_per_s keeps the estimate sane until real completions arrive.
+
+    A document turned away keeps its place: each time it comes back under the same key, the time it has already
+    waited is added to its max_wait_s. Without that, a document too large to fit in max_wait_s would only get in
+    when the backlog happened to be empty, which a steady stream of small documents never allows.
+    """
+
+    def __init__(
+        self,
+        page_stats: PageStats,
+        max_wait_s: float = 600,
+        initial_pages_per_s: float = 1.0,
+        half_life_s: float = 300,
+        prior_s: float = 60,
+        retry_grace_s: float = 60,
+    ):
+        self.page_stats = page_stats
+        self.max_wait_s = max_wait_s
+        self.half_life_s = half_life_s
+        self.pages_done = initial_pages_per_s * prior_s
+        self.busy_s = prior_s
+        self.backlog_pages = 0.0
+        self.sampled_at = time.time()
+        # Documents turned away, by key: when they were first turned away and when they are given up on
+        self.waiting: Dict[str, Tuple[float, float]] = {}
+        # How late after its Retry-After a document may come back and keep its place
+        self.retry_grace_s = retry_grace_s
+
+    @property
+    def pages_per_s(self) -> float:
+        return self.pages_done / self.busy_s
+
+    def sample(self) -> None:
+        now = time.time()
+        backlog_pages, completed_pages = self.page_stats(self.sampled_at)
+        elapsed_s = max(now - self.sampled_at, 0.0)
+
+        # Only time with work outstanding says anything about throughput
+        if self.backlog_pages > 0 or completed_pages:
+            decay = 0.5 ** (elapsed_s / self.half_life_s)
+            self.pages_done = self.pages_done * decay + completed_pages
+            self.busy_s = self.busy_s * decay + elapsed_s
+
+        self.backlog_pages = backlog_pages
+        self.sampled_at = now
+
+    def check(self, pages: int, key: Optional[str] = None) -> Optional[float]:
+        """
+        Return None to admit a document of this many pages, or the seconds to wait before trying again.
+
+        key identifies the document across retries, so the time it has waited counts in its favour.
+        """
+        self.sample()
+        now = self.sampled_at
+        self.waiting = {waiting_key: entry for waiting_key, entry in self.waiting.items() if entry[1] >= now}
+        first_rejected_at = self.waiting.pop(key, (now, now))[0] if key else now
+        if self.max_wait_s <= 0 or self.backlog_pages <= 0:
+            # An idle service always takes the next document, however large
+            return None
+
+        allowed_s = self.max_wait_s + now - first_rejected_at
+        wait_s = (self.backlog_pages + pages) / self.pages_per_s
+        if wait_s <= allowed_s:
+            return None
+
+        ADMISSION_REJECTED_TOTAL.inc()
+        # The backlog draining and the document aging both close the gap, so this is an upper bound;
+        # once the backlog is empty any document gets in
+        retry_after_s = math.ceil(min(wait_s - allowed_s, self.backlog_pages / self.pages_per_s))
+        if key:
+            self.waiting[key] = (first_rejected_at, now + retry_after_s + self.retry_grace_s)
+        logfire.info(
+            f"Admission rejected {pages} pages: {self.backlog_pages:.0f} pages queued at "
+            f"{self.pages_per_s:.2f} pages/s, waited {now - first_rejected_at:.0f}s, retry in {retry_after_s}s"
+        )
+        return retry_after_s
+
+    def register_metrics(self, registry: Registry) -> None:
+        registry.gauge(
+            "reader_admission_backlog_pages",
+            "Pages still to extract across processing tasks",
+            function=lambda: self.backlog_pages,
+        )
+        registry.gauge(
+            "reader_admission_pages_per_second",
+            "Measured extraction throughput used for admission",
+            function=lambda: self.pages_per_s,
+        )
+
+    async def run_sampler(self, interval_s: float = 5) -> None:
+        # Regular samples keep busy time accurate between admissions
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logfire.error(f"Admission sampling failed: {str(e)}")
+            await asyncio.sleep(interval_s)
@@ -0,0 +1,125 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created disk-backed, content-addressed cache for chunk extraction results
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import logfire
+
+
+def make_cache_key(chunk_bytes: bytes, prompt: str, model_id: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(chunk_bytes).digest())
+    digest.update(hashlib.sha256(prompt.encode("utf-8")).digest())
+    digest.update(model_id.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ChunkCache:
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_age_s: float = 7 * 24 * 3600,
+    ):
+        self.cache_dir = Path(
+            cache_dir or os.environ.get("READER_CACHE_DIR") or Path(tempfile.gettempdir()) / "reader-chunk-cache"
+        )
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self._size_bytes: Optional[int] = None
+
+    def _path(self, key: str) -> Path:
+        # Two-level fan-out keeps directory listings short on large caches
+        return self.cache_dir / key[:2] / f"{key}.md"
+
+    def _entries(self):
+        for entry in self.cache_dir.glob("*/*.md"):
+            try:
+                yield entry, entry.stat()
+            except FileNotFoundError:
+                continue
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+
+        if time.time() - stat.st_mtime > self.max_age_s:
+            self._remove(path, stat.st_size)
+            return None
+
+        try:
+            text = path.read_text(encoding="utf-8")
+        except OSError as e:
+            logfire.warn(f"Failed to read cache entry {key[:12]}: {str(e)}")
+            return None
+
+        # Refresh access time so eviction drops the least recently used entries first
+        os.utime(path, (time.time(), stat.st_mtime))
+        return text
+
+    def set(self, key: str, text: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = text.encode("utf-8")
+
+        try:
+            with tempfile.NamedTemporaryFile(dir=path.parent, delete=False, suffix=".tmp") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_file.name, path)
+        except OSError as e:
+            logfire.warn(f"Failed to write cache entry {key[:12]}: {str(e)}")
+            return
+
+        if self._size_bytes is None:
+            self._size_bytes = sum(stat.st_size for _, stat in self._entries())
+        else:
+            self._size_bytes += len(data)
+
+        if self._size_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        now = time.time()
+        entries = []
+        size_bytes = 0
+
+        for path, stat in self._entries():
+            if now - stat.st_mtime > self.max_age_s:
+                self._remove(path, stat.st_size)
+                continue
+            entries.append((stat.st_atime, path, stat.st_size))
+            size_bytes += stat.st_size
+
+        # Evict down to 90% of the ceiling so we don't rescan on every write
+        target_bytes = int(self.max_bytes * 0.9)
+        evicted = 0
+        for _, path, entry_size in sorted(entries):
+            if size_bytes <= target_bytes:
+                break
+            self._remove(path, 0)
+            size_bytes -= entry_size
+            evicted += 1
+
+        self._size_bytes = size_bytes
+        if evicted:
+            logfire.info(f"Evicted {evicted} chunk cache entries, {size_bytes} bytes remaining")
+
+    def _remove(self, path: Path, size_bytes: int) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        if self._size_bytes is not None:
+            self._size_bytes = max(self._size_bytes - size_bytes, 0)
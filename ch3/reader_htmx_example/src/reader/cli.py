@@ -0,0 +1,299 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created bulk extraction command with a resumable journal and throughput report
+- 002 - AI - Journaled missing files and documents with failed chunks as failed, and kept same-named PDFs apart
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import fitz
+import logfire
+
+from reader.config import configure_logfire
+from reader.pdf import PROCESSING_FAILED, ChunkResult, get_pdf_processor, get_prompt, is_failed_chunk
+
+JOURNAL_NAME = ".reader-journal.jsonl"
+
+
+def discover_inputs(paths: List[str], manifest: Optional[str]) -> List[Tuple[Path, Path]]:
+    """Collect (pdf, root) pairs; root is the directory outputs are laid out relative to."""
+    inputs = []
+    # Single files and manifest entries share one root, so files from different directories keep them apart
+    files = []
+    for raw in paths:
+        path = Path(raw).resolve()
+        if path.is_dir():
+            inputs.extend((pdf, path) for pdf in sorted(path.rglob("*.pdf")) if pdf.is_file())
+        elif path.is_file():
+            files.append(path)
+        else:
+            raise ValueError(f"Input {raw} does not exist")
+
+    if manifest:
+        manifest_path = Path(manifest).resolve()
+        with open(manifest_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                # Relative entries are read relative to the manifest itself
+                # Missing entries are kept so they are journaled as failed rather than dropped silently
+                files.append((manifest_path.parent / line).resolve())
+
+    if files:
+        root = Path(os.path.commonpath([str(path.parent) for path in files]))
+        inputs.extend((path, root) for path in files)
+
+    seen = set()
+    unique = []
+    for pdf, root in inputs:
+        if pdf not in seen:
+            seen.add(pdf)
+            unique.append((pdf, root))
+    return unique
+
+
+def output_path(pdf: Path, root: Path, output_dir: Optional[Path]) -> Path:
+    if output_dir is None:
+        return pdf.with_suffix(".md")
+    return (output_dir / pdf.relative_to(root)).with_suffix(".md")
+
+
+def plan_outputs(inputs: List[Tuple[Path, Path]], output_dir: Optional[Path]) -> List[Tuple[Path, Path]]:
+    """
+    Pair each PDF with its output path.
+
+    PDFs from different input directories can still map to the same path; those get a short hash of
+    their source path in the name, so neither overwrites the other and reruns pick the same names.
+    """
+    outputs = [output_path(pdf, root, output_dir) for pdf, root in inputs]
+    counts: Dict[Path, int] = {}
+    for output in outputs:
+        counts[output] = counts.get(output, 0) + 1
+
+    planned = []
+    for (pdf, _), output in zip(inputs, outputs):
+        if counts[output] > 1:
+            digest = hashlib.sha256(str(pdf).encode("utf-8")).hexdigest()[:8]
+            output = output.with_name(f"{output.stem}-{digest}{output.suffix}")
+        planned.append((pdf, output))
+    return planned
+
+
+def file_signature(pdf: Path) -> Dict[str, int]:
+    stat = pdf.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class Journal:
+    """
+    Append-only JSONL record of finished documents.
+
+    The last record per path wins, so a rerun skips documents that are done and unchanged and picks up the rest.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash mid-write leaves at most one torn line at the end
+                        continue
+                    self.entries[entry["path"]] = entry
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def is_done(self, pdf: Path, output: Path) -> bool:
+        entry = self.entries.get(str(pdf))
+        if entry is None or entry["status"] != "done" or not output.exists():
+            return False
+        try:
+            signature = file_signature(pdf)
+        except OSError:
+            return False
+        # A PDF replaced since it was extracted is done again
+        return entry["size"] == signature["size"] and entry["mtime_ns"] == signature["mtime_ns"]
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        self.entries[entry["path"]] = entry
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def write_output(output: Path, text: str) -> None:
+    # Write then rename, so a crash never leaves a truncated .md that looks finished
+    output.parent.mkdir(parents=True, exist_ok=True)
+    partial = output.with_name(output.name + ".partial")
+    partial.write_text(text, encoding="utf-8")
+    os.replace(partial, output)
+
+
+async def extract_one(pdf: Path, output: Path, prompt: str) -> Dict[str, Any]:
+    started_at = time.monotonic()
+    pages = 0
+    chunks = 0
+    failed_chunks = 0
+    result = PROCESSING_FAILED
+    error = None
+    signature: Dict[str, Optional[int]] = {"size": None, "mtime_ns": None}
+    try:
+        # Taken before extracting, so a PDF replaced mid-run is extracted again on the next run
+        signature = file_signature(pdf)
+        with fitz.open(pdf) as doc:
+            pages = doc.page_count
+        with open(pdf, "rb") as pdf_file:
+            async for item in get_pdf_processor().extract(pdf_file, prompt, stream=True, owner=str(pdf)):
+                if isinstance(item, ChunkResult):
+                    chunks += 1
+                    failed_chunks += is_failed_chunk(item.text)
+                elif isinstance(item, str):
+                    result = item
+    except Exception as e:
+        logfire.error(f"Bulk extraction of {pdf} failed: {str(e)}")
+        error = str(e)
+
+    if error is None and failed_chunks:
+        # Written out, the text would carry the failure marker in place of those pages
+        error = f"{failed_chunks} of {chunks} chunks failed"
+
+    failed = error is not None or result == PROCESSING_FAILED
+    if not failed:
+        write_output(output, result)
+
+    return {
+        "path": str(pdf),
+        **signature,
+        "status": "failed" if failed else "done",
+        "output": str(output),
+        "pages": pages,
+        "chunks": chunks,
+        "failed_chunks": failed_chunks,
+        "seconds": round(time.monotonic() - started_at, 3),
+        "error": error or (PROCESSING_FAILED if failed else None),
+        "finished_at": time.time(),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    output_dir = Path(args.output_dir).resolve() if args.output_dir else None
+    inputs = discover_inputs(args.inputs, args.manifest)
+    journal_path = Path(args.journal) if args.journal else (output_dir or Path.cwd()) / JOURNAL_NAME
+    journal = Journal(journal_path)
+    prompt = get_prompt(args.language)
+
+    pending = []
+    skipped = 0
+    for pdf, output in plan_outputs(inputs, output_dir):
+        if not args.force and journal.is_done(pdf, output):
+            skipped += 1
+        else:
+            pending.append((pdf, output))
+
+    print(f"{len(inputs)} PDFs found, {skipped} already done, {len(pending)} to extract (journal: {journal_path})")
+
+    # Documents in flight only bound memory; API concurrency is capped by the shared processor's chunk scheduler
+    slots = asyncio.Semaphore(args.documents)
+    totals = {"done": 0, "failed": 0, "pages": 0, "failed_chunks": 0}
+    started_at = time.monotonic()
+
+    async def process(pdf: Path, output: Path) -> None:
+        async with slots:
+            entry = await extract_one(pdf, output, prompt)
+        journal.record(entry)
+
+        totals[entry["status"]] += 1
+        totals["failed_chunks"] += entry["failed_chunks"]
+        if entry["status"] == "done":
+            totals["pages"] += entry["pages"]
+        finished = totals["done"] + totals["failed"]
+        elapsed_min = (time.monotonic() - started_at) / 60
+        print(
+            f"[{finished}/{len(pending)}] {entry['status']:<6} {pdf.name} "
+            f"({entry['pages']} pages, {entry['seconds']:.1f}s) "
+            f"{finished / elapsed_min:.1f} docs/min, {totals['pages'] / elapsed_min:.1f} pages/min",
+            flush=True,
+        )
+
+    try:
+        await asyncio.gather(*(process(pdf, output) for pdf, output in pending))
+    finally:
+        journal.close()
+        if pending:
+            get_pdf_processor().close()
+
+    wall_s = time.monotonic() - started_at
+    return {
+        "found": len(inputs),
+        "skipped": skipped,
+        **totals,
+        "wall_s": wall_s,
+        "docs_per_min": (totals["done"] + totals["failed"]) / wall_s * 60 if wall_s else 0.0,
+        "pages_per_min": totals["pages"] / wall_s * 60 if wall_s else 0.0,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"documents        {report['done']} done, {report['failed']} failed, {report['skipped']} skipped")
+    print(f"pages            {report['pages']} ({report['failed_chunks']} failed chunks)")
+    print(f"wall time        {report['wall_s']:.1f}s")
+    print(f"throughput       {report['docs_per_min']:.2f} docs/min, {report['pages_per_min']:.1f} pages/min")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Extract many PDFs to Markdown under one shared API budget")
+    parser.add_argument("inputs", nargs="*", help="PDF files or directories, searched recursively")
+    parser.add_argument("--manifest", help="file listing one PDF path per line")
+    parser.add_argument(
+        "--output-dir", help="write .md files here, mirroring the input layout; default is beside each PDF"
+    )
+    parser.add_argument("--journal", help=f"resumable progress journal; default is {JOURNAL_NAME} in the output dir")
+    parser.add_argument("--language", choices=["cn", "en"], default="cn")
+    parser.add_argument(
+        "--documents",
+        type=int,
+        default=int(os.environ.get("READER_BULK_DOCUMENTS", "8")),
+        help="documents open at once; API calls are limited by READER_MAX_CONCURRENCY",
+    )
+    parser.add_argument("--force", action="store_true", help="re-extract documents the journal marks as done")
+    parser.add_argument("--json", action="store_true", help="print the final report as JSON")
+    args = parser.parse_args()
+    if not args.inputs and not args.manifest:
+        parser.error("give at least one input path or --manifest")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    if os.environ.get("LOGFIRE_TOKEN"):
+        configure_logfire()
+    else:
+        logfire.configure(send_to_logfire=False, console=False)
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if report["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
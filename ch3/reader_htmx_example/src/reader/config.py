@@ -1,5 +1,7 @@
 """
 ## ChangeLog
+
+- 001 - AI - Added env_flag for reading on/off settings
 """
 
 import os
@@ -13,6 +15,11 @@ import logfire
 import yaml
 
 
+def env_flag(name: str) -> bool:
+    # "0", "false" and "no" switch a setting off rather than on just by being present
+    return os.environ.get(name, "").strip().lower() not in ("", "0", "false", "no", "off")
+
+
 def get_logfire_token() -> str:
     logfire_token = os.environ.get("LOGFIRE_TOKEN")
     if not logfire_token:
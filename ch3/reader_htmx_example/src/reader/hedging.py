@@ -0,0 +1,36 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created latency tracker and per-document hedge budget for straggler chunk hedging
+"""
+
+from collections import deque
+from typing import Deque, Optional
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, min_samples: int = 10):
+        self.samples_s: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, latency_s: float) -> None:
+        self.samples_s.append(latency_s)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples_s) < self.min_samples:
+            return None
+        ordered = sorted(self.samples_s)
+        index = min(int(q * len(ordered)), len(ordered) - 1)
+        return ordered[index]
+
+
+class HedgeBudget:
+    def __init__(self, max_hedges: int):
+        self.max_hedges = max_hedges
+        self.used = 0
+
+    def try_acquire(self) -> bool:
+        if self.used >= self.max_hedges:
+            return False
+        self.used += 1
+        return True
@@ -0,0 +1,129 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created SQLite-backed job queue shared by the web process and extraction workers
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+
+class JobKind(Enum):
+    EXTRACT = "extract"
+    RETRY = "retry"
+
+
+class Job(BaseModel):
+    job_id: int
+    task_id: str
+    kind: JobKind
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    attempts: int = 0
+
+
+class JobQueue:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL,
+        worker_id TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        heartbeat_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status_job_id ON jobs (status, job_id);
+    """
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def enqueue(self, task_id: str, kind: JobKind, payload: Optional[Dict[str, Any]] = None) -> int:
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (task_id, kind, payload, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (task_id, kind.value, json.dumps(payload or {}), time.time()),
+            )
+            return cursor.lastrowid or 0
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers can never claim the same job
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY job_id LIMIT 1").fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, heartbeat_at = ? "
+                        "WHERE job_id = ?",
+                        (worker_id, time.time(), row["job_id"]),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        return Job(
+            job_id=row["job_id"],
+            task_id=row["task_id"],
+            kind=JobKind(row["kind"]),
+            payload=json.loads(row["payload"]),
+            attempts=row["attempts"] + 1,
+        )
+
+    def heartbeat(self, job_id: int) -> None:
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def finish(self, job_id: int) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def requeue_stale(self, stale_after_s: float, max_attempts: int) -> Tuple[List[int], List[str]]:
+        """
+        Hand jobs whose worker stopped sending heartbeats to another worker.
+
+        Returns the requeued job ids and the task ids of jobs dropped after max_attempts.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT job_id, task_id, attempts FROM jobs WHERE status = 'running' AND heartbeat_at < ?",
+                    (time.time() - stale_after_s,),
+                ).fetchall()
+                requeued = [row["job_id"] for row in rows if row["attempts"] < max_attempts]
+                dropped = [row for row in rows if row["attempts"] >= max_attempts]
+                self.conn.executemany(
+                    "UPDATE jobs SET status = 'queued', worker_id = NULL WHERE job_id = ?",
+                    [(job_id,) for job_id in requeued],
+                )
+                self.conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(row["job_id"],) for row in dropped])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return requeued, [row["task_id"] for row in dropped]
+
+    def queued_count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
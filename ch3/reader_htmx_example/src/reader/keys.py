@@ -0,0 +1,179 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created key-aware scheduler with per-key token buckets, load tracking and circuit breaking
+- 002 - AI - Kept request failures out of key health and let a half-open key take a single probe
+- 003 - AI - Handed out leases so only the probe itself can close or re-open a half-open key
+"""
+
+import asyncio
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, List, Optional, Set
+
+import logfire
+from pydantic import BaseModel
+
+
+class KeyOutcome(Enum):
+    SUCCESS = "success"
+    # Server or authentication errors, which count towards opening the key's circuit
+    ERROR = "error"
+    RATE_LIMITED = "rate_limited"
+    # The request itself failed, such as a bad chunk or a timeout, which says nothing about the key
+    REQUEST_FAILED = "request_failed"
+    CANCELLED = "cancelled"
+
+
+class KeyLease(BaseModel):
+    api_key: str
+    # Set on the one request a half-open key lets through; only its outcome closes or re-opens the circuit
+    probe: bool = False
+
+
+class KeyState:
+    def __init__(self, api_key: str, requests_per_minute: float, burst: int):
+        self.api_key = api_key
+        self.in_flight = 0
+        self.latencies_s: Deque[float] = deque(maxlen=50)
+        self.successes = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        # After its circuit opens, the key takes one probe request at a time until one succeeds
+        self.half_open = False
+        self.probing = False
+        self.refill_per_s = requests_per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+
+    @property
+    def label(self) -> str:
+        return f"...{self.api_key[-8:]}"
+
+    @property
+    def mean_latency_s(self) -> float:
+        return sum(self.latencies_s) / len(self.latencies_s) if self.latencies_s else 0.0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.refill_per_s)
+        self.refilled_at = now
+
+    def seconds_until_token(self) -> float:
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.refill_per_s
+
+    def is_open(self, now: float) -> bool:
+        return now < self.open_until
+
+    def is_available(self, now: float) -> bool:
+        return not self.is_open(now) and not (self.half_open and self.probing)
+
+
+class KeyScheduler:
+    def __init__(
+        self,
+        api_keys: List[str],
+        requests_per_minute: float = 15,
+        burst: int = 3,
+        failure_threshold: int = 3,
+        circuit_open_s: float = 30,
+        rate_limit_cooldown_s: float = 20,
+    ):
+        self.keys: Dict[str, KeyState] = {key: KeyState(key, requests_per_minute, burst) for key in api_keys}
+        self.failure_threshold = failure_threshold
+        self.circuit_open_s = circuit_open_s
+        self.rate_limit_cooldown_s = rate_limit_cooldown_s
+
+    def _pick(self, candidates: List[KeyState]) -> KeyState:
+        # Least loaded first, then fewest recent failures, then fastest
+        return min(candidates, key=lambda s: (s.in_flight, s.consecutive_failures, s.mean_latency_s))
+
+    async def acquire(self, exclude: Optional[Set[str]] = None) -> Optional[KeyLease]:
+        exclude = exclude or set()
+
+        while True:
+            now = time.monotonic()
+            candidates = [state for key, state in self.keys.items() if key not in exclude]
+            if not candidates:
+                return None
+
+            healthy = [state for state in candidates if state.is_available(now)]
+            if not healthy:
+                # A key whose probe is still in flight has open_until in the past, so this polls until it resolves
+                wait_s = min(state.open_until for state in candidates) - now
+                await asyncio.sleep(max(wait_s, 0.05))
+                continue
+
+            for state in healthy:
+                state.refill(now)
+
+            ready = [state for state in healthy if state.tokens >= 1]
+            if not ready:
+                await asyncio.sleep(max(min(state.seconds_until_token() for state in healthy), 0.05))
+                continue
+
+            state = self._pick(ready)
+            state.tokens -= 1
+            state.in_flight += 1
+            probe = state.half_open
+            if probe:
+                state.probing = True
+            return KeyLease(api_key=state.api_key, probe=probe)
+
+    def release(self, lease: KeyLease, outcome: KeyOutcome, latency_s: Optional[float] = None) -> None:
+        state = self.keys[lease.api_key]
+        state.in_flight = max(state.in_flight - 1, 0)
+        now = time.monotonic()
+        # Requests that were already in flight when the circuit opened finish as stale: they are counted,
+        # but only the probe's outcome closes or re-opens a half-open key
+        stale = state.half_open and not lease.probe
+        if lease.probe:
+            state.probing = False
+
+        if outcome in (KeyOutcome.CANCELLED, KeyOutcome.REQUEST_FAILED):
+            # Neither says anything about the key's health; a half-open key simply takes the next probe
+            return
+
+        if outcome == KeyOutcome.SUCCESS:
+            state.successes += 1
+            if latency_s is not None:
+                state.latencies_s.append(latency_s)
+            if not stale:
+                state.consecutive_failures = 0
+                state.half_open = False
+            return
+
+        if outcome == KeyOutcome.RATE_LIMITED:
+            state.rate_limited += 1
+            state.tokens = 0
+            state.open_until = max(state.open_until, now + self.rate_limit_cooldown_s)
+            logfire.warn(f"API key {state.label} rate limited, cooling down for {self.rate_limit_cooldown_s}s")
+            return
+
+        state.errors += 1
+        if stale:
+            return
+        state.consecutive_failures += 1
+        if lease.probe or state.consecutive_failures >= self.failure_threshold:
+            # After the open period the key is half-open: one probe either closes or re-opens it
+            state.open_until = now + self.circuit_open_s
+            state.half_open = True
+            logfire.warn(f"Circuit opened for API key {state.label} for {self.circuit_open_s}s")
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        now = time.monotonic()
+        return [
+            {
+                "key": state.label,
+                "in_flight": state.in_flight,
+                "mean_latency_s": round(state.mean_latency_s, 3),
+                "successes": state.successes,
+                "errors": state.errors,
+                "rate_limited": state.rate_limited,
+                "circuit_open": state.is_open(now),
+            }
+            for state in self.keys.values()
+        ]
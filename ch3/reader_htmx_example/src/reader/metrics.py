@@ -0,0 +1,256 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created in-process counters, gauges and histograms rendered in the Prometheus text format
+- 002 - AI - Added chunk byte counters to track upload size reduction
+- 003 - AI - Added a counter of cancelled tasks
+- 004 - AI - Added a counter of documents turned away by admission control
+- 005 - AI - Returned the metric already registered under a name, so importing a module twice does not fail
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+GaugeReading = Union[float, Dict[LabelValues, float]]
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if math.isinf(value) else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help, label_names)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = dict(self.values)
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        function: Optional[Callable[[], GaugeReading]] = None,
+    ):
+        super().__init__(name, help, label_names)
+        self.values: Dict[LabelValues, float] = {}
+        # Read at scrape time, for values that already live elsewhere such as queue lengths
+        self.function = function
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def render(self) -> List[str]:
+        if self.function is not None:
+            reading = self.function()
+            values = reading if isinstance(reading, dict) else {(): reading}
+        else:
+            with self.lock:
+                values = dict(self.values)
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self.lock:
+            counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sums[key] = self.sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started_at, **labels)
+
+    def render(self) -> List[str]:
+        with self.lock:
+            counts = {key: list(value) for key, value in self.counts.items()}
+            sums = dict(self.sums)
+
+        lines = self.header()
+        for key in sorted(counts):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[key]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def _existing(self, name: str, kind: type, label_names: Sequence[str]) -> Optional[Metric]:
+        # serve() imports main.py twice in the same process, as __mp_main__ and as main, and both register
+        metric = self.metrics.get(name)
+        if metric is None:
+            return None
+        if type(metric) is not kind or metric.label_names != tuple(label_names):
+            raise ValueError(f"Metric {name} is already registered as a different {metric.kind}")
+        return metric
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        existing = self._existing(name, Counter, label_names)
+        if isinstance(existing, Counter):
+            return existing
+        counter = Counter(name, help, label_names)
+        self.register(counter)
+        return counter
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        function: Optional[Callable[[], GaugeReading]] = None,
+    ) -> Gauge:
+        existing = self._existing(name, Gauge, label_names)
+        if isinstance(existing, Gauge):
+            # The latest import is the one serving requests, so read from its objects
+            existing.function = function or existing.function
+            return existing
+        gauge = Gauge(name, help, label_names, function)
+        self.register(gauge)
+        return gauge
+
+    def histogram(
+        self, name: str, help: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        existing = self._existing(name, Histogram, label_names)
+        if isinstance(existing, Histogram):
+            return existing
+        histogram = Histogram(name, help, label_names, buckets)
+        self.register(histogram)
+        return histogram
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "reader_stage_duration_seconds",
+    "Time spent in each extraction stage",
+    ["stage"],
+)
+KEY_REQUEST_SECONDS = REGISTRY.histogram(
+    "reader_key_request_duration_seconds",
+    "Upload plus generate time per API key attempt, by outcome",
+    ["key", "outcome"],
+)
+DOCUMENT_SECONDS = REGISTRY.histogram(
+    "reader_document_duration_seconds",
+    "End-to-end extraction time per document",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800),
+)
+CHUNKS_TOTAL = REGISTRY.counter(
+    "reader_chunks_total",
+    "Chunks finished, by how they were resolved",
+    ["result"],
+)
+CHUNK_BYTES_TOTAL = REGISTRY.counter(
+    "reader_chunk_bytes_total",
+    "Rendered chunk bytes before (plain) and after (sent) optimization",
+    ["kind"],
+)
+TASKS_CANCELLED_TOTAL = REGISTRY.counter(
+    "reader_tasks_cancelled_total",
+    "Tasks cancelled before finishing, by the user or because nobody was watching",
+    ["reason"],
+)
+ADMISSION_REJECTED_TOTAL = REGISTRY.counter(
+    "reader_admission_rejected_total",
+    "Documents turned away with a 429 because the backlog would not drain in time",
+)
@@ -9,18 +9,63 @@
 - 006 - AI - Added short delay before retrying with next API key
 - 007 - AI - Added timeout mechanism for individual chunk processing
 - 008 - AI - Fixed chunk ordering issue by properly tracking task results with their original indices
+- 009 - AI - Added content-addressed chunk result cache so unchanged pages skip the API
+- 010 - AI - Added in-memory chunk splitting with a memory ceiling that spills to temp files
+- 011 - AI - Added streaming mode that yields chunk results as soon as the in-order prefix completes
+- 012 - AI - Added content-aware adaptive chunk sizing and fixed chunks overlapping by one page
+- 013 - AI - Replaced random key shuffling with a key-aware scheduler with rate limiting and circuit breaking
+- 014 - AI - Added optional hedged requests for straggler chunks with a per-document hedge budget
+- 015 - AI - Added process-wide shared processor so every task shares one client pool and concurrency budget
+- 016 - AI - Replaced the semaphore with a fair-share scheduler so small documents are not starved by large ones
+- 017 - AI - Added local text-layer fast path so simple born-digital pages skip the LLM
+- 018 - AI - Moved splitting into a process pool and started chunks as soon as each one is rendered
+- 019 - AI - Named the complete-failure result so callers can recognise it
+- 020 - AI - Added re-extraction of explicit page ranges so failed chunks can be retried on their own
+- 021 - AI - Moved prompt selection here so extraction workers can share it
+- 022 - AI - Allowed injecting API keys and a client factory, made retry backoff configurable and added close()
+- 023 - AI - Recorded per-stage, per-key and per-document latency metrics and exposed scheduler gauges
+- 024 - AI - Sent small chunks inline with the generate request instead of uploading them through the Files API
+- 025 - AI - Optimized rendered chunks before sending them and reported the bytes saved per document
+- 026 - AI - Planned chunks under output and input token limits, calibrated with count_tokens, and flagged truncation
+- 027 - AI - Counted only rate limits, server and auth errors against a key and stopped retrying rejected requests
+- 028 - AI - Hedged only into a free concurrency slot so hedging cannot exceed READER_MAX_CONCURRENCY
+- 029 - AI - Parsed READER_FORCE_LLM as a boolean instead of checking only that it is set
+- 030 - AI - Removed the unused split_pdf and capped each document's renders queued in the split pool
+- 031 - AI - Let worker processes that share API keys each take an equal share of the concurrency and rate limits
+- 032 - AI - Sent count_tokens through the key scheduler and parsed the READER_* switches as booleans
+- 033 - AI - Released API keys with the lease the key scheduler handed out
 """
 
 import asyncio
+import multiprocessing
 import os
-import random
 import tempfile
-from typing import Any, AsyncGenerator, Dict, List, Tuple, Union
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
 
-import fitz
 import logfire
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+from pydantic import BaseModel
+
+from reader.cache import ChunkCache, make_cache_key
+from reader.config import env_flag
+from reader.hedging import HedgeBudget, LatencyTracker
+from reader.keys import KeyOutcome, KeyScheduler
+from reader.metrics import (
+    CHUNK_BYTES_TOTAL,
+    CHUNKS_TOTAL,
+    DOCUMENT_SECONDS,
+    KEY_REQUEST_SECONDS,
+    REGISTRY,
+    STAGE_SECONDS,
+    Registry,
+)
+from reader.scheduler import FairScheduler
+from reader.split import PDFChunk, PDFSource, RenderOptions, SplitOptions, plan_document, render_chunk, sample_text
 
 DEFAULT_PROMPT_CN = """
 请尽可能提取 PDF 中的信息，并遵守以下规则：
@@ -48,17 +93,128 @@ You will directly output the extracted information after deeply contemplating th
 """
 
 
+def get_prompt(language: str) -> str:
+    return DEFAULT_PROMPT_EN if language == "en" else DEFAULT_PROMPT_CN
+
+
+FAILED_ALL_KEYS = "All API Keys Failed"
+PROCESSING_TIMEOUT = "Processing timeout"
+PROCESSING_FAILED = "Processing failed completely"
+PROCESSING_ERROR = "Processing error"
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+
+def is_failed_chunk(text: str) -> bool:
+    return text in (FAILED_ALL_KEYS, PROCESSING_TIMEOUT) or text.startswith(f"{PROCESSING_ERROR}:")
+
+
+def merge_chunk_results(texts: List[str]) -> str:
+    ordered_results = [text for text in texts if text and text.strip()]
+    if not ordered_results:
+        return PROCESSING_FAILED
+    return CHUNK_SEPARATOR.join(ordered_results)
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    if isinstance(error, errors.APIError) and error.code == 429:
+        return True
+    return "RESOURCE_EXHAUSTED" in str(error)
+
+
+def _key_outcome(error: Exception) -> KeyOutcome:
+    if _is_rate_limited(error):
+        return KeyOutcome.RATE_LIMITED
+    if isinstance(error, errors.APIError) and (error.code in (401, 403) or error.code >= 500):
+        return KeyOutcome.ERROR
+    # Bad requests, network errors and the like would fail the same way on any key
+    return KeyOutcome.REQUEST_FAILED
+
+
+class ChunkResult(BaseModel):
+    index: int
+    start_page: int
+    end_page: int
+    text: str
+
+
 class PDFProcessor:
-    def __init__(self):
-        self.api_keys = self._collect_api_keys()
+    def __init__(
+        self,
+        api_keys: Optional[List[str]] = None,
+        client_factory: Optional[Callable[[str], genai.Client]] = None,
+    ):
+        self.api_keys = api_keys or self._collect_api_keys()
+        # Lets benchmarks swap in a local stand-in for the Gemini API
+        self.client_factory = client_factory or (lambda api_key: genai.Client(api_key=api_key))
         self.clients = self._initialize_clients()
         self.model_id = "gemini-2.0-flash-thinking-exp-01-21"
         self.max_tokens = 60000
         self.chunk_size = 2
-        self.max_concurrent_tasks = max(int(len(self.api_keys) * 1.6), 1)
-        self.semaphore = asyncio.Semaphore(self.max_concurrent_tasks)
+        self.adaptive_chunking = True
+        self.chunk_token_budget = 16000
+        self.input_token_budget = 100000
+        # Measure each document's text with count_tokens before planning instead of trusting the local estimate alone
+        self.count_tokens = env_flag("READER_COUNT_TOKENS")
+        self.token_sample_chars = 20000
+        self.max_chunk_pages = 10
+        self.text_fast_path = not env_flag("READER_FORCE_LLM")
+        self.max_concurrent_tasks = int(
+            os.environ.get("READER_MAX_CONCURRENCY") or max(int(len(self.api_keys) * 1.6), 1)
+        )
+        self.chunk_scheduler = FairScheduler(self.max_concurrent_tasks)
+        self.key_requests_per_minute = float(os.environ.get("READER_KEY_RPM", "15"))
+        self.key_burst = 3
+        self.key_scheduler = KeyScheduler(
+            self.api_keys, requests_per_minute=self.key_requests_per_minute, burst=self.key_burst
+        )
+        self.hedge_requests = env_flag("READER_HEDGE_REQUESTS")
+        self.hedge_percentile = 0.9
+        self.hedge_budget_ratio = 0.1
+        self.latency_tracker = LatencyTracker()
         self.chunk_timeout_s = 180
         self.api_call_timeout_s = 60
+        self.retry_delay_s = 0.5
+        self.retry_backoff = 1.5
+        self.max_retry_delay_s = 5.0
+        # Chunks up to this size go inline as request bytes; larger ones, or all of them at 0, use the Files API
+        self.inline_max_bytes = int(os.environ.get("READER_INLINE_MAX_BYTES", "4194304"))
+        self.render_options = (
+            RenderOptions(garbage=0, deflate=False, subset_fonts=False)
+            if env_flag("READER_CHUNK_OPTIMIZE_DISABLED")
+            else RenderOptions(
+                image_dpi=int(os.environ.get("READER_IMAGE_DPI", "0")),
+                image_quality=int(os.environ.get("READER_IMAGE_QUALITY", "80")),
+            )
+        )
+        self.cache = None if env_flag("READER_CACHE_DISABLED") else ChunkCache()
+        self.in_memory_chunks = True
+        self.max_in_memory_bytes = 256 * 1024 * 1024
+        self.in_memory_bytes = 0
+        self.split_workers = int(os.environ.get("READER_SPLIT_WORKERS") or min(os.cpu_count() or 1, 4))
+        # Renders one document may have queued in the pool at once, so other documents' renders are not stuck behind it
+        self.renders_per_document = max(self.split_workers, 1)
+        self._split_executor: Optional[Executor] = None
+
+    def share_budget(self, processes: int) -> None:
+        """
+        Take 1/processes of the concurrency and per-key rate limits.
+
+        Limits are tracked in memory, so several processes using the same keys would each apply them in
+        full. Call this before any request is made; circuit breaker state is still per process.
+        """
+        if processes <= 1:
+            return
+        self.max_concurrent_tasks = max(self.max_concurrent_tasks // processes, 1)
+        self.chunk_scheduler = FairScheduler(self.max_concurrent_tasks)
+        self.key_requests_per_minute /= processes
+        self.key_burst = max(self.key_burst // processes, 1)
+        self.key_scheduler = KeyScheduler(
+            self.api_keys, requests_per_minute=self.key_requests_per_minute, burst=self.key_burst
+        )
+        logfire.info(
+            f"Sharing limits with {processes - 1} other processes: {self.max_concurrent_tasks} concurrent chunks, "
+            f"{self.key_requests_per_minute:.1f} requests per minute per key"
+        )
 
     def _collect_api_keys(self) -> List[str]:
         keys = []
@@ -80,163 +236,453 @@ class PDFProcessor:
         return keys
 
     def _initialize_clients(self) -> Dict[str, genai.Client]:
-        return {key: genai.Client(api_key=key) for key in self.api_keys}
+        return {key: self.client_factory(key) for key in self.api_keys}
+
+    def _get_split_executor(self) -> Executor:
+        if self._split_executor is None:
+            if self.split_workers > 0:
+                # fork avoids re-importing the web app's __main__ in every worker
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("fork" if "fork" in methods else None)
+                self._split_executor = ProcessPoolExecutor(max_workers=self.split_workers, mp_context=context)
+            else:
+                # A single thread keeps fitz off the event loop without sharing documents across threads
+                self._split_executor = ThreadPoolExecutor(max_workers=1)
+        return self._split_executor
+
+    def close(self) -> None:
+        if self._split_executor is not None:
+            self._split_executor.shutdown(wait=False, cancel_futures=True)
+            self._split_executor = None
+
+    def register_metrics(self, registry: Registry) -> None:
+        registry.gauge(
+            "reader_chunks_queued",
+            "Chunks waiting for a concurrency slot",
+            function=lambda: self.chunk_scheduler.queued_total(),
+        )
+        registry.gauge(
+            "reader_chunks_running",
+            "Chunks holding a concurrency slot",
+            function=lambda: self.chunk_scheduler.in_use,
+        )
+        registry.gauge(
+            "reader_key_in_flight",
+            "Requests in flight per API key",
+            ["key"],
+            function=lambda: {(state["key"],): state["in_flight"] for state in self.key_scheduler.snapshot()},
+        )
+        registry.gauge(
+            "reader_key_circuit_open",
+            "Whether an API key is cooling down after failures or rate limiting",
+            ["key"],
+            function=lambda: {(state["key"],): float(state["circuit_open"]) for state in self.key_scheduler.snapshot()},
+        )
+
+    def _split_options(self, token_scale: float = 1.0) -> SplitOptions:
+        return SplitOptions(
+            chunk_size=self.chunk_size,
+            adaptive_chunking=self.adaptive_chunking,
+            # A chunk planned past max_output_tokens would come back cut off
+            chunk_token_budget=min(self.chunk_token_budget, self.max_tokens),
+            max_chunk_pages=self.max_chunk_pages,
+            text_fast_path=self.text_fast_path,
+            input_token_budget=self.input_token_budget,
+            token_scale=token_scale,
+        )
+
+    async def _measure_token_scale(self, source: PDFSource, executor: Executor) -> float:
+        """Ratio of count_tokens to the planner's estimate on a sample of the document's text."""
+        loop = asyncio.get_running_loop()
+        sample, estimate = await loop.run_in_executor(executor, sample_text, source, self.token_sample_chars)
+        if estimate < 100:
+            # Scans and image-only documents have too little text to measure
+            return 1.0
+
+        # Counted against a key's rate limit and circuit like any other request
+        lease = await self.key_scheduler.acquire()
+        if lease is None:
+            return 1.0
+
+        started_at = time.monotonic()
+        outcome = KeyOutcome.REQUEST_FAILED
+        try:
+            count_task = self.clients[lease.api_key].aio.models.count_tokens(model=self.model_id, contents=sample)
+            response = await asyncio.wait_for(count_task, timeout=self.api_call_timeout_s)
+            outcome = KeyOutcome.SUCCESS
+        except asyncio.CancelledError:
+            outcome = KeyOutcome.CANCELLED
+            raise
+        except Exception as e:
+            outcome = _key_outcome(e)
+            logfire.warn(f"count_tokens failed, planning with the local estimate: {str(e)}")
+            return 1.0
+        finally:
+            self.key_scheduler.release(lease, outcome, time.monotonic() - started_at)
+
+        # Clamp so one odd sample cannot collapse chunks to single pages or blow past the budget
+        scale = min(max((response.total_tokens or 0) / estimate, 0.5), 3.0)
+        logfire.info(f"Measured token scale {scale:.2f} ({response.total_tokens} tokens vs {estimate:.0f} estimated)")
+        return scale
 
-    def _create_temp_pdf(self, doc: fitz.Document, start: int, end: int) -> str:
-        temp_chunk = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        new_doc = fitz.open()
+    def _source(self, pdf_file: Any, need_path: bool) -> Tuple[PDFSource, Optional[str]]:
+        # Open uploads that already live on disk in place instead of copying them
+        source_path = pdf_file if isinstance(pdf_file, str) else getattr(pdf_file, "name", None)
+        if isinstance(source_path, str) and os.path.isfile(source_path):
+            return source_path, None
 
-        new_doc.insert_pdf(doc, from_page=start, to_page=end)
-        new_doc.save(temp_chunk.name)
-        new_doc.close()
-        return temp_chunk.name
+        data = pdf_file.read()
+        if not need_path and self.in_memory_chunks and len(data) <= self.max_in_memory_bytes:
+            return data, None
 
-    def split_pdf(self, pdf_file: Any) -> List[Tuple[str, int, int]]:
         temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        temp_input.write(pdf_file.read())
+        temp_input.write(data)
         temp_input.close()
-
-        doc = fitz.open(temp_input.name)
-        total_pages = len(doc)
-        chunks = []
-
-        for start in range(0, total_pages, self.chunk_size):
-            end = min(start + self.chunk_size, total_pages)
-            temp_path = self._create_temp_pdf(doc, start, end)
-
-            # end - 1 because we want inclusive end page number for logging
-            chunks.append((temp_path, start, end - 1))
-
-        doc.close()
-        os.remove(temp_input.name)
-
-        return chunks
-
-    async def _process_with_fallback(self, temp_pdf_path: str, start_page: int, end_page: int, prompt: str) -> str:
-        available_keys = list(self.api_keys)
-        random.shuffle(available_keys)
-
-        retry_delay_s = 0.5
-        max_retry_delay_s = 5.0
-
-        for i, api_key in enumerate(available_keys):
+        return temp_input.name, temp_input.name
+
+    def _hold_chunk_bytes(self, chunk: PDFChunk, data: bytes) -> None:
+        if self.in_memory_chunks and self.in_memory_bytes + len(data) <= self.max_in_memory_bytes:
+            chunk.data = data
+            self.in_memory_bytes += len(data)
+            return
+
+        logfire.info(f"Chunk memory ceiling reached, spilling pages {chunk.start_page}-{chunk.end_page} to disk")
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_chunk:
+            temp_chunk.write(data)
+        chunk.path = temp_chunk.name
+
+    def _release_chunk(self, chunk: PDFChunk) -> None:
+        if chunk.data is not None:
+            self.in_memory_bytes -= len(chunk.data)
+        chunk.release()
+
+    def _report_bytes_saved(self, renders: List[asyncio.Future]) -> None:
+        sizes = [
+            render.result() for render in renders if render.done() and not render.cancelled() and not render.exception()
+        ]
+        if not sizes:
+            return
+        sent = sum(len(data) for data, _ in sizes)
+        plain = sum(plain_size for _, plain_size in sizes)
+        CHUNK_BYTES_TOTAL.inc(plain, kind="plain")
+        CHUNK_BYTES_TOTAL.inc(sent, kind="sent")
+        logfire.info(
+            f"Chunk optimization saved {plain - sent} bytes ({plain} -> {sent}) across {len(sizes)} rendered chunks"
+        )
+
+    async def _chunk_part(self, async_client: Any, chunk: PDFChunk) -> Optional[Union[types.Part, types.File]]:
+        if chunk.size_bytes() <= self.inline_max_bytes:
+            # Small chunks ride along in the generate request, saving the upload round trip
+            return types.Part.from_bytes(data=chunk.read_bytes(), mime_type="application/pdf")
+
+        upload_config = types.UploadFileConfig(mime_type="application/pdf")
+        with chunk.open() as f:
             try:
-                client = self.clients[api_key]
-                async_client = client.aio
-                upload_config = types.UploadFileConfig(mime_type="application/pdf")
-
-                with open(temp_pdf_path, "rb") as f:
-                    try:
-                        upload_task = async_client.files.upload(file=f, config=upload_config)
-                        uploaded_file = await asyncio.wait_for(upload_task, timeout=self.api_call_timeout_s)
-                    except asyncio.TimeoutError:
-                        logfire.warn(f"File upload timed out for pages {start_page}-{end_page}")
-                        if i < len(available_keys) - 1:
-                            await asyncio.sleep(retry_delay_s)
-                            retry_delay_s = min(retry_delay_s * 1.5, max_retry_delay_s)
-                        continue
-
-                with logfire.span(f"Processing pages {start_page}-{end_page}"):
-                    try:
-                        generate_task = async_client.models.generate_content(
-                            model=self.model_id,
-                            config=types.GenerateContentConfig(
-                                system_instruction=prompt,
-                                max_output_tokens=self.max_tokens,
-                            ),
-                            contents=[uploaded_file],
-                        )
-                        response = await asyncio.wait_for(generate_task, timeout=self.api_call_timeout_s)
-                    except asyncio.TimeoutError:
-                        logfire.warn(f"Content generation timed out for pages {start_page}-{end_page}")
-                        if i < len(available_keys) - 1:
-                            await asyncio.sleep(retry_delay_s)
-                            retry_delay_s = min(retry_delay_s * 1.5, max_retry_delay_s)
-                        continue
-
-                    if not response.text:
-                        logfire.warn(f"Received empty response from API for pages {start_page}-{end_page}")
-                        if i < len(available_keys) - 1:
-                            await asyncio.sleep(retry_delay_s)
-                            retry_delay_s = min(retry_delay_s * 1.5, max_retry_delay_s)
-                        continue
-
-                    logfire.info(
-                        f"Successfully processed pages {start_page}-{end_page} with {len(response.text)} characters"
-                    )
-                    return response.text
+                upload_task = async_client.files.upload(file=f, config=upload_config)
+                with STAGE_SECONDS.time(stage="upload"):
+                    return await asyncio.wait_for(upload_task, timeout=self.api_call_timeout_s)
+            except asyncio.TimeoutError:
+                logfire.warn(f"File upload timed out for pages {chunk.start_page}-{chunk.end_page}")
+                return None
+
+    async def _generate_with_key(self, api_key: str, chunk: PDFChunk, prompt: str) -> Optional[str]:
+        start_page, end_page = chunk.start_page, chunk.end_page
+        async_client = self.clients[api_key].aio
+
+        document = await self._chunk_part(async_client, chunk)
+        if document is None:
+            return None
+
+        with logfire.span(f"Processing pages {start_page}-{end_page}"):
+            try:
+                generate_task = async_client.models.generate_content(
+                    model=self.model_id,
+                    config=types.GenerateContentConfig(
+                        system_instruction=prompt,
+                        max_output_tokens=self.max_tokens,
+                    ),
+                    contents=[document],
+                )
+                with STAGE_SECONDS.time(stage="generate"):
+                    response = await asyncio.wait_for(generate_task, timeout=self.api_call_timeout_s)
+            except asyncio.TimeoutError:
+                logfire.warn(f"Content generation timed out for pages {start_page}-{end_page}")
+                return None
+
+            if not response.text:
+                logfire.warn(f"Received empty response from API for pages {start_page}-{end_page}")
+                return None
+
+            candidates = getattr(response, "candidates", None)
+            if candidates and candidates[0].finish_reason == types.FinishReason.MAX_TOKENS:
+                # Still usable, but the planner's budget was too loose for these pages
+                logfire.warn(f"Output for pages {start_page}-{end_page} hit max_output_tokens and was truncated")
+                CHUNKS_TOTAL.inc(result="truncated")
+
+            return response.text
+
+    async def _process_with_fallback(self, chunk: PDFChunk, prompt: str, tried_keys: Optional[Set[str]] = None) -> str:
+        start_page, end_page = chunk.start_page, chunk.end_page
+        # Shared with a hedged duplicate so it can steer clear of the keys this attempt already uses
+        tried_keys = set() if tried_keys is None else tried_keys
+
+        retry_delay_s = self.retry_delay_s
+
+        for attempt in range(len(self.api_keys)):
+            with STAGE_SECONDS.time(stage="key_wait"):
+                lease = await self.key_scheduler.acquire(exclude=tried_keys)
+            if lease is None:
+                break
+
+            api_key = lease.api_key
+            tried_keys.add(api_key)
+            started_at = time.monotonic()
+            # Timeouts and empty responses return None and are not held against the key
+            outcome = KeyOutcome.REQUEST_FAILED
+            rejected = False
 
-            except Exception:
-                logfire.warn(f"Failed to process pages {start_page}-{end_page}")
-                if i < len(available_keys) - 1:
+            try:
+                text = await self._generate_with_key(api_key, chunk, prompt)
+                if text:
+                    outcome = KeyOutcome.SUCCESS
+                    logfire.info(f"Successfully processed pages {start_page}-{end_page} with {len(text)} characters")
+                    return text
+            except asyncio.CancelledError:
+                outcome = KeyOutcome.CANCELLED
+                raise
+            except Exception as e:
+                outcome = _key_outcome(e)
+                # Any other 4xx is about this chunk's request, and another key would reject it too
+                rejected = outcome == KeyOutcome.REQUEST_FAILED and isinstance(e, errors.ClientError)
+                logfire.warn(f"Failed to process pages {start_page}-{end_page}: {str(e)}")
+            finally:
+                latency_s = time.monotonic() - started_at
+                self.key_scheduler.release(lease, outcome, latency_s)
+                KEY_REQUEST_SECONDS.observe(
+                    latency_s, key=self.key_scheduler.keys[api_key].label, outcome=outcome.value
+                )
+
+            if rejected:
+                break
+
+            if attempt < len(self.api_keys) - 1:
+                with STAGE_SECONDS.time(stage="retry_wait"):
                     await asyncio.sleep(retry_delay_s)
-                    retry_delay_s = min(retry_delay_s * 1.5, max_retry_delay_s)
-                continue
+                retry_delay_s = min(retry_delay_s * self.retry_backoff, self.max_retry_delay_s)
 
         logfire.error(f"Processing failed with all API keys for pages {start_page}-{end_page}")
-        return "All API Keys Failed"
+        return FAILED_ALL_KEYS
+
+    def _start_hedge(self, chunk: PDFChunk, prompt: str, tried_keys: Set[str], owner: str) -> asyncio.Task:
+        hedge = asyncio.create_task(self._process_with_fallback(chunk, prompt, tried_keys))
+        # Released on completion rather than in a finally, which never runs if the task is cancelled before it starts
+        hedge.add_done_callback(lambda _: self.chunk_scheduler.release(owner))
+        return hedge
+
+    async def _process_with_hedging(
+        self, chunk: PDFChunk, prompt: str, hedge_budget: Optional[HedgeBudget], owner: str
+    ) -> str:
+        start_page, end_page = chunk.start_page, chunk.end_page
+        started_at = time.monotonic()
+        primary_keys: Set[str] = set()
+        tasks = [asyncio.create_task(self._process_with_fallback(chunk, prompt, primary_keys))]
 
-    async def process_pdf_chunk(self, temp_pdf_path: str, start_page: int, end_page: int, prompt: str) -> str:
         try:
-            async with self.semaphore:
+            hedge_after_s = self.latency_tracker.percentile(self.hedge_percentile) if hedge_budget else None
+            if hedge_after_s is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_after_s)
+                # The duplicate needs a concurrency slot of its own, and only takes one nobody is queued for
+                if not done and hedge_budget and self.chunk_scheduler.try_acquire(owner):
+                    if hedge_budget.try_acquire():
+                        logfire.info(f"Hedging pages {start_page}-{end_page} after {hedge_after_s:.1f}s")
+                        tasks.append(self._start_hedge(chunk, prompt, set(primary_keys), owner))
+                    else:
+                        self.chunk_scheduler.release(owner)
+
+            # First good response wins; a failed attempt only counts once every attempt has failed
+            result = FAILED_ALL_KEYS
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result != FAILED_ALL_KEYS:
+                        self.latency_tracker.observe(time.monotonic() - started_at)
+                        return result
+            return result
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def process_pdf_chunk(
+        self,
+        chunk: PDFChunk,
+        prompt: str,
+        hedge_budget: Optional[HedgeBudget] = None,
+        owner: str = "default",
+        render: Optional[Callable[[], Awaitable[Tuple[bytes, int]]]] = None,
+    ) -> str:
+        start_page, end_page = chunk.start_page, chunk.end_page
+        if chunk.local_text is not None:
+            CHUNKS_TOTAL.inc(result="local")
+            return chunk.local_text
+
+        try:
+            if render is not None:
+                with STAGE_SECONDS.time(stage="render"):
+                    data, _ = await render()
+                self._hold_chunk_bytes(chunk, data)
+
+            cache_key = None
+            if self.cache is not None:
+                cache_key = make_cache_key(chunk.read_bytes(), prompt, self.model_id)
+
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    logfire.info(f"Cache hit for pages {start_page}-{end_page}")
+                    CHUNKS_TOTAL.inc(result="cached")
+                    return cached
+
+            queued_at = time.monotonic()
+            async with self.chunk_scheduler.slot(owner):
+                STAGE_SECONDS.observe(time.monotonic() - queued_at, stage="queue_wait")
                 try:
                     result = await asyncio.wait_for(
-                        self._process_with_fallback(temp_pdf_path, start_page, end_page, prompt),
+                        self._process_with_hedging(chunk, prompt, hedge_budget, owner),
                         timeout=self.chunk_timeout_s,
                     )
-                    return result
                 except asyncio.TimeoutError:
                     logfire.error(f"PDF chunk processing timed out for pages {start_page}-{end_page}")
-                    return "Processing timeout"
-        finally:
-            if os.path.exists(temp_pdf_path):
-                os.remove(temp_pdf_path)
+                    CHUNKS_TOTAL.inc(result="timeout")
+                    return PROCESSING_TIMEOUT
 
-    async def extract(self, pdf_file: Any, prompt) -> AsyncGenerator[Union[int, str], None]:
-        chunks = self.split_pdf(pdf_file)
-        total_chunks = len(chunks)
+            CHUNKS_TOTAL.inc(result="failed" if result == FAILED_ALL_KEYS else "extracted")
 
-        # Create tasks and store them with their indices
+            if self.cache is not None and cache_key is not None and result != FAILED_ALL_KEYS:
+                self.cache.set(cache_key, result)
+            return result
+        finally:
+            self._release_chunk(chunk)
+
+    async def extract(
+        self,
+        pdf_file: Any,
+        prompt,
+        stream: bool = False,
+        owner: Optional[str] = None,
+        ranges: Optional[List[Tuple[int, int]]] = None,
+    ) -> AsyncGenerator[Union[int, str, ChunkResult], None]:
+        # Chunks from the same owner share one fair-share queue in the chunk scheduler
+        owner = owner or str(uuid.uuid4())
+        started_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        executor = self._get_split_executor()
+        source, temp_input_path = self._source(pdf_file, need_path=self.split_workers > 0)
         pending_tasks = {}
-        for i, (temp_path, start, end) in enumerate(chunks):
-            task = asyncio.create_task(self.process_pdf_chunk(temp_path, start, end, prompt))
-            pending_tasks[task] = i
+        renders: List[asyncio.Future] = []
+        render_slots = asyncio.Semaphore(self.renders_per_document)
+
+        async def render(chunk: PDFChunk) -> Tuple[bytes, int]:
+            # The pool runs renders first come, first served, so each document only queues a few at a time
+            async with render_slots:
+                rendering = loop.run_in_executor(
+                    executor, render_chunk, source, chunk.start_page, chunk.end_page, self.render_options
+                )
+                renders.append(rendering)
+                return await rendering
 
-        results_by_index = {}
-        completed_chunks = 0
-
-        # Process tasks as they complete
-        while pending_tasks:
-            done, _ = await asyncio.wait(pending_tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
-
-            for task in done:
-                # Get the original index for this task
-                original_index = pending_tasks.pop(task)
-
-                try:
-                    result = task.result()
-                    # Store result with its original index
-                    results_by_index[original_index] = result
-                except Exception as e:
-                    logfire.error(f"Task error: {e}")
-                    results_by_index[original_index] = f"Processing error: {str(e)}"
-
-                completed_chunks += 1
-                progress = int((completed_chunks / total_chunks) * 100)
+        try:
+            if ranges is None:
+                token_scale = 1.0
+                if self.count_tokens and self.adaptive_chunking:
+                    with STAGE_SECONDS.time(stage="count_tokens"):
+                        token_scale = await self._measure_token_scale(source, executor)
+                with STAGE_SECONDS.time(stage="split"):
+                    chunks = await loop.run_in_executor(
+                        executor, plan_document, source, self._split_options(token_scale)
+                    )
+            else:
+                # Explicit ranges are retries of chunks that already failed once at the API
+                chunks = [PDFChunk(start_page=start, end_page=end) for start, end in ranges]
+            total_chunks = len(chunks)
+            hedge_budget = (
+                HedgeBudget(max(int(total_chunks * self.hedge_budget_ratio), 1)) if self.hedge_requests else None
+            )
+
+            # Each chunk is rendered in the pool and goes to the API as soon as its own pages are ready
+            for i, chunk in enumerate(chunks):
+                chunk_render = None if chunk.local_text is not None else partial(render, chunk)
+                task = asyncio.create_task(self.process_pdf_chunk(chunk, prompt, hedge_budget, owner, chunk_render))
+                pending_tasks[task] = i
+
+            results_by_index = {}
+            completed_chunks = 0
+            next_stream_index = 0
+
+            # Process tasks as they complete
+            while pending_tasks:
+                done, _ = await asyncio.wait(pending_tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    # Get the original index for this task
+                    original_index = pending_tasks.pop(task)
 
-                # Log progress
-                logfire.info(f"Processing progress: {progress}% ({completed_chunks}/{total_chunks} chunks)")
-                yield progress
+                    try:
+                        result = task.result()
+                        # Store result with its original index
+                        results_by_index[original_index] = result
+                    except Exception as e:
+                        logfire.error(f"Task error: {e}")
+                        results_by_index[original_index] = f"{PROCESSING_ERROR}: {str(e)}"
+
+                    completed_chunks += 1
+                    progress = int((completed_chunks / total_chunks) * 100)
+
+                    # Log progress
+                    logfire.info(f"Processing progress: {progress}% ({completed_chunks}/{total_chunks} chunks)")
+                    yield progress
+
+                if stream:
+                    # Only release results once every earlier chunk is done so readers see pages in order
+                    while next_stream_index in results_by_index:
+                        chunk = chunks[next_stream_index]
+                        yield ChunkResult(
+                            index=next_stream_index,
+                            start_page=chunk.start_page,
+                            end_page=chunk.end_page,
+                            text=results_by_index[next_stream_index],
+                        )
+                        next_stream_index += 1
+        finally:
+            # Stop queued chunks if the consumer goes away before the document finishes
+            for task in pending_tasks:
+                task.cancel()
+            self.chunk_scheduler.forget(owner)
+            if temp_input_path:
+                os.remove(temp_input_path)
 
         # Get results in the original order
-        ordered_results = [
-            results_by_index[i]
-            for i in range(total_chunks)
-            if i in results_by_index and results_by_index[i] and results_by_index[i].strip()
-        ]
-
-        if not ordered_results:
-            logfire.error(f"PDF processing failed completely. Total chunks: {len(ordered_results)}/{len(chunks)}")
-            yield "Processing failed completely"
-        else:
-            yield "\n\n---\n\n".join(ordered_results)
+        with STAGE_SECONDS.time(stage="merge"):
+            result = merge_chunk_results([results_by_index.get(i, "") for i in range(total_chunks)])
+        if result == PROCESSING_FAILED:
+            logfire.error(f"PDF processing failed completely. Total chunks: {len(chunks)}")
+        self._report_bytes_saved(renders)
+        DOCUMENT_SECONDS.observe(time.monotonic() - started_at)
+        yield result
+
+
+_shared_processor: Optional[PDFProcessor] = None
+
+
+def get_pdf_processor() -> PDFProcessor:
+    # One processor per process so all tasks share the clients, key scheduler, cache and semaphore
+    global _shared_processor
+    if _shared_processor is None:
+        _shared_processor = PDFProcessor()
+        _shared_processor.register_metrics(REGISTRY)
+        logfire.info(
+            f"Created shared PDFProcessor with {len(_shared_processor.api_keys)} API keys "
+            f"and {_shared_processor.max_concurrent_tasks} concurrent chunks"
+        )
+    return _shared_processor
@@ -0,0 +1,149 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created page profiler and token-budget chunk planner for adaptive chunk sizing
+- 002 - AI - Counted undecodable characters per page and allowed planning runs that start mid-document
+- 003 - AI - Estimated CJK text separately, added input-token estimates and a calibration scale to the planner
+- 004 - AI - Anchored chunk boundaries at content-defined pages so an edit only moves the chunks around it
+- 005 - AI - Removed the unused estimated_output_tokens property
+"""
+
+import re
+import zlib
+from typing import List, Optional, Tuple
+
+import fitz
+from pydantic import BaseModel
+
+# Tokenizer prior: about four Latin characters per token, while CJK characters are close to one token each
+TOKENS_PER_LATIN_CHAR = 0.25
+TOKENS_PER_CJK_CHAR = 0.8
+# Rough output cost per page element, tuned against typical Gemini markdown output
+OUTPUT_TEXT_OVERHEAD = 2.0
+TOKENS_PER_IMAGE = 250
+TOKENS_PER_DRAWING = 2
+MAX_DRAWING_TOKENS = 2000
+BASE_TOKENS_PER_PAGE = 150
+# Gemini bills every PDF page as one image of this size, on top of any text it extracts from the page
+INPUT_TOKENS_PER_PAGE = 258
+
+# Chunks never span a content-defined anchor page, so an edit only re-plans the pages up to the next anchor
+# and the chunks after it keep their exact page ranges, and with them their cache keys
+ANCHOR_EVERY_PAGES = 12
+MIN_SEGMENT_PAGES = 4
+# Forced anchors for documents with no text to anchor on, such as scans
+MAX_SEGMENT_PAGES = 32
+
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def count_cjk_chars(text: str) -> int:
+    return len(CJK_PATTERN.findall(text))
+
+
+def estimate_text_tokens(text_chars: int, cjk_chars: int) -> float:
+    return (text_chars - cjk_chars) * TOKENS_PER_LATIN_CHAR + cjk_chars * TOKENS_PER_CJK_CHAR
+
+
+class PageProfile(BaseModel):
+    index: int
+    text_chars: int
+    image_count: int
+    drawing_count: int
+    replacement_chars: int = 0
+    cjk_chars: int = 0
+    # Checksum of the page content, independent of the page's position in the document
+    fingerprint: int = 0
+
+    @property
+    def is_anchor(self) -> bool:
+        return self.text_chars > 0 and self.fingerprint % ANCHOR_EVERY_PAGES == 0
+
+    def text_tokens(self, token_scale: float = 1.0) -> float:
+        # token_scale corrects the tokenizer prior for a document, measured with count_tokens when enabled
+        return estimate_text_tokens(self.text_chars, self.cjk_chars) * token_scale
+
+    def output_tokens(self, token_scale: float = 1.0) -> int:
+        # Vector drawings become mermaid or tables, but huge counts are usually hatching or decoration
+        drawing_tokens = min(self.drawing_count * TOKENS_PER_DRAWING, MAX_DRAWING_TOKENS)
+        return int(
+            BASE_TOKENS_PER_PAGE
+            + self.text_tokens(token_scale) * OUTPUT_TEXT_OVERHEAD
+            + self.image_count * TOKENS_PER_IMAGE
+            + drawing_tokens
+        )
+
+    def input_tokens(self, token_scale: float = 1.0) -> int:
+        return int(INPUT_TOKENS_PER_PAGE + self.text_tokens(token_scale))
+
+
+def profile_page(page: fitz.Page) -> PageProfile:
+    text = page.get_text("text").strip()
+    return PageProfile(
+        index=page.number or 0,
+        text_chars=len(text),
+        image_count=len(page.get_images(full=False)),
+        drawing_count=len(page.get_cdrawings()),
+        # Fonts without a usable ToUnicode map come out as U+FFFD
+        replacement_chars=text.count("\ufffd"),
+        cjk_chars=count_cjk_chars(text),
+        fingerprint=zlib.crc32(text.encode("utf-8")),
+    )
+
+
+def profile_pages(doc: fitz.Document) -> List[PageProfile]:
+    return [profile_page(page) for page in doc]
+
+
+def plan_chunks(
+    profiles: List[PageProfile],
+    token_budget: int,
+    max_pages: int,
+    input_token_budget: Optional[int] = None,
+    token_scale: float = 1.0,
+) -> List[Tuple[int, int]]:
+    """
+    Group consecutive pages into chunks whose estimated output stays near the token budget.
+
+    When input_token_budget is set, the estimated input of a chunk is kept under it as well.
+    Chunks also break at anchor pages, which depend only on page content, so editing a page
+    leaves the ranges after the next anchor unchanged. Returns inclusive (start_page, end_page)
+    ranges. A single page that exceeds a budget on its own still gets a chunk of its own.
+    """
+    ranges: List[Tuple[int, int]] = []
+    start = profiles[0].index if profiles else 0
+    segment_start = start
+    chunk_tokens = 0
+    chunk_input_tokens = 0
+
+    for profile in profiles:
+        page_tokens = profile.output_tokens(token_scale)
+        page_input_tokens = profile.input_tokens(token_scale)
+        pages_in_chunk = profile.index - start
+        over_input = input_token_budget is not None and chunk_input_tokens + page_input_tokens > input_token_budget
+
+        pages_in_segment = profile.index - segment_start
+        at_anchor = pages_in_segment >= MAX_SEGMENT_PAGES or (
+            pages_in_segment >= MIN_SEGMENT_PAGES and profile.is_anchor
+        )
+        if at_anchor:
+            segment_start = profile.index
+
+        over_budget = chunk_tokens + page_tokens > token_budget or over_input or pages_in_chunk >= max_pages
+        if pages_in_chunk and (at_anchor or over_budget):
+            ranges.append((start, profile.index - 1))
+            start = profile.index
+            chunk_tokens = 0
+            chunk_input_tokens = 0
+
+        chunk_tokens += page_tokens
+        chunk_input_tokens += page_input_tokens
+
+    if profiles:
+        ranges.append((start, profiles[-1].index))
+
+    return ranges
+
+
+def plan_fixed_chunks(total_pages: int, chunk_size: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + chunk_size, total_pages) - 1) for start in range(0, total_pages, chunk_size)]
@@ -0,0 +1,98 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created fair-share chunk scheduler that shares concurrency slots across documents
+- 002 - AI - Added total queue length for metrics
+- 003 - AI - Added a non-blocking acquire for extra work that should only use spare capacity
+"""
+
+import asyncio
+import itertools
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict
+
+
+class FairScheduler:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {}
+        self.running: Dict[str, int] = defaultdict(int)
+        self.last_granted: Dict[str, int] = {}
+        self._grants = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, owner: str) -> AsyncIterator[None]:
+        await self.acquire(owner)
+        try:
+            yield
+        finally:
+            self.release(owner)
+
+    async def acquire(self, owner: str) -> None:
+        if self.try_acquire(owner):
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(owner, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted right as we were cancelled, so hand it on
+                self.release(owner)
+            else:
+                self._discard(owner, waiter)
+            raise
+
+    def try_acquire(self, owner: str) -> bool:
+        """Take a slot only if one is free and nobody is waiting for it."""
+        if self.in_use < self.capacity and not self.waiters:
+            self._grant(owner)
+            return True
+        return False
+
+    def release(self, owner: str) -> None:
+        self.in_use -= 1
+        self.running[owner] -= 1
+        if self.running[owner] <= 0:
+            del self.running[owner]
+        self._dispatch()
+
+    def _grant(self, owner: str) -> None:
+        self.in_use += 1
+        self.running[owner] += 1
+        self.last_granted[owner] = next(self._grants)
+
+    def _dispatch(self) -> None:
+        while self.in_use < self.capacity and self.waiters:
+            # Owners with the fewest running chunks go first; ties go to whoever was served longest ago
+            owner = min(self.waiters, key=lambda o: (self.running.get(o, 0), self.last_granted.get(o, -1)))
+            waiter = self.waiters[owner].popleft()
+            if not self.waiters[owner]:
+                del self.waiters[owner]
+            if waiter.done():
+                continue
+            self._grant(owner)
+            waiter.set_result(None)
+
+    def _discard(self, owner: str, waiter: asyncio.Future) -> None:
+        queue = self.waiters.get(owner)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        if not queue:
+            del self.waiters[owner]
+
+    def queue_depth(self, owner: str) -> int:
+        return len(self.waiters.get(owner, ()))
+
+    def queued_total(self) -> int:
+        return sum(len(queue) for queue in self.waiters.values())
+
+    def forget(self, owner: str) -> None:
+        self.last_granted.pop(owner, None)
@@ -0,0 +1,203 @@
+"""
+## ChangeLog
+
+- 001 - AI - Moved chunk planning and rendering into picklable functions that can run in a process pool
+- 002 - AI - Added chunk size lookup so small chunks can be sent inline
+- 003 - AI - Shrank rendered chunks with garbage collection, deflate, font subsetting and optional image downsampling
+- 004 - AI - Passed input budget and token calibration to the planner and added text sampling for count_tokens
+- 005 - AI - Sent pages with tables to the LLM even when their profile looks like simple text
+- 006 - AI - Split runs of locally rendered pages into chunks the same way as pages sent to the LLM
+- 007 - AI - Passed page profiles to has_table so pages without drawings skip find_tables
+"""
+
+import io
+import os
+import threading
+from typing import IO, List, Optional, Tuple, Union
+
+import fitz
+from pydantic import BaseModel
+
+from reader.planner import (
+    PageProfile,
+    count_cjk_chars,
+    estimate_text_tokens,
+    plan_chunks,
+    plan_fixed_chunks,
+    profile_pages,
+)
+from reader.textlayer import has_table, is_simple_text_page, render_page_markdown
+
+PDFSource = Union[str, bytes]
+
+
+class PDFChunk(BaseModel):
+    start_page: int
+    end_page: int
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+    local_text: Optional[str] = None
+
+    def read_bytes(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path or "", "rb") as f:
+            return f.read()
+
+    def size_bytes(self) -> int:
+        if self.data is not None:
+            return len(self.data)
+        return os.path.getsize(self.path or "")
+
+    def open(self) -> IO[bytes]:
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return open(self.path or "", "rb")
+
+    def release(self) -> None:
+        self.data = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class SplitOptions(BaseModel):
+    chunk_size: int
+    adaptive_chunking: bool
+    chunk_token_budget: int
+    max_chunk_pages: int
+    text_fast_path: bool
+    input_token_budget: Optional[int] = None
+    token_scale: float = 1.0
+
+
+class RenderOptions(BaseModel):
+    # Defaults are lossless; image_dpi above 0 also downsamples and recompresses larger images
+    garbage: int = 3
+    deflate: bool = True
+    subset_fonts: bool = True
+    image_dpi: int = 0
+    image_quality: int = 80
+
+
+# Worker processes render many chunks of the same document in a row, so keep the last one open
+_open_doc: Optional[Tuple[Tuple[str, int, int], fitz.Document]] = None
+# fitz documents are not thread-safe, which matters when the splitter runs on threads instead of processes
+_doc_lock = threading.Lock()
+
+
+def _open(source: PDFSource) -> fitz.Document:
+    global _open_doc
+    if isinstance(source, bytes):
+        return fitz.open(stream=source, filetype="pdf")
+
+    stat = os.stat(source)
+    key = (source, stat.st_mtime_ns, stat.st_size)
+    if _open_doc is None or _open_doc[0] != key:
+        if _open_doc is not None:
+            _open_doc[1].close()
+        _open_doc = (key, fitz.open(source))
+    return _open_doc[1]
+
+
+def _plan_ranges(profiles: List[PageProfile], options: SplitOptions) -> List[Tuple[int, int]]:
+    if not options.adaptive_chunking:
+        offset = profiles[0].index
+        return [(start + offset, end + offset) for start, end in plan_fixed_chunks(len(profiles), options.chunk_size)]
+    return plan_chunks(
+        profiles,
+        options.chunk_token_budget,
+        options.max_chunk_pages,
+        input_token_budget=options.input_token_budget,
+        token_scale=options.token_scale,
+    )
+
+
+def sample_text(source: PDFSource, max_chars: int) -> Tuple[str, float]:
+    """Return up to max_chars of the document's text and the planner's prior token estimate for it."""
+    with _doc_lock:
+        doc = _open(source)
+        parts = []
+        total = 0
+        # Spread the sample over the document so one dense front matter page does not decide the scale
+        step = max(len(doc) // 20, 1)
+        for index in range(0, len(doc), step):
+            text = doc[index].get_text("text").strip()
+            parts.append(text[: max_chars - total])
+            total += len(parts[-1])
+            if total >= max_chars:
+                break
+
+    sample = "\n\n".join(part for part in parts if part)
+    return sample, estimate_text_tokens(len(sample), count_cjk_chars(sample))
+
+
+def plan_document(source: PDFSource, options: SplitOptions) -> List[PDFChunk]:
+    with _doc_lock:
+        return _plan_document(_open(source), options)
+
+
+def _plan_document(doc: fitz.Document, options: SplitOptions) -> List[PDFChunk]:
+    if not options.adaptive_chunking and not options.text_fast_path:
+        ranges = plan_fixed_chunks(len(doc), options.chunk_size)
+        return [PDFChunk(start_page=start, end_page=end) for start, end in ranges]
+
+    profiles = profile_pages(doc)
+
+    # Split the document into runs of simple text pages and runs of pages that need the LLM
+    runs: List[Tuple[bool, List[PageProfile]]] = []
+    for profile in profiles:
+        is_local = (
+            options.text_fast_path and is_simple_text_page(profile) and not has_table(doc[profile.index], profile)
+        )
+        if runs and runs[-1][0] == is_local:
+            runs[-1][1].append(profile)
+        else:
+            runs.append((is_local, [profile]))
+
+    chunks = []
+    for is_local, run in runs:
+        # Local runs are cut like LLM runs too, so a long text-only document still streams and pages in chunks
+        for start, end in _plan_ranges(run, options):
+            if is_local:
+                text = "\n\n".join(render_page_markdown(doc[index]) for index in range(start, end + 1))
+                chunks.append(PDFChunk(start_page=start, end_page=end, local_text=text))
+            else:
+                chunks.append(PDFChunk(start_page=start, end_page=end))
+
+    return chunks
+
+
+def _optimize(doc: fitz.Document, options: RenderOptions) -> None:
+    if options.subset_fonts:
+        try:
+            doc.subset_fonts()
+        except Exception:
+            # Some embedded fonts cannot be subset; the chunk is still valid with them whole
+            pass
+    if options.image_dpi > 0:
+        doc.rewrite_images(
+            dpi_threshold=int(options.image_dpi * 1.2),
+            dpi_target=options.image_dpi,
+            quality=options.image_quality,
+        )
+
+
+def render_chunk(source: PDFSource, start: int, end: int, options: Optional[RenderOptions] = None) -> Tuple[bytes, int]:
+    """
+    Copy pages start..end into a standalone PDF.
+
+    Returns the optimized bytes and the size the plain copy would have had, so callers can report the savings.
+    """
+    options = options or RenderOptions()
+    new_doc = fitz.open()
+
+    with _doc_lock:
+        # Page ranges are inclusive on both ends, matching insert_pdf's from_page/to_page
+        new_doc.insert_pdf(_open(source), from_page=start, to_page=end)
+
+    # no_new_id keeps the saved bytes identical across runs so they can be used as a cache key
+    plain_size = len(new_doc.tobytes(no_new_id=True))
+    _optimize(new_doc, options)
+    data = new_doc.tobytes(garbage=options.garbage, deflate=options.deflate, no_new_id=True)
+    new_doc.close()
+    return data, plain_size
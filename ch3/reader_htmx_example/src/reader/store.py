@@ -0,0 +1,519 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created pluggable task store with in-memory and SQLite (WAL) backends
+- 002 - AI - Kept per-chunk results for every task so failed chunks can be retried and spliced back in
+- 003 - AI - Bumped a task's updated_at on every chunk so other processes can see it changed
+- 004 - AI - Added a count of processing tasks for metrics
+- 005 - AI - Kept results only as zlib-compressed chunks read in pages, recording the merged size instead of the text
+- 006 - AI - Added a cancelled status and last-seen times for finding tasks nobody is waiting for
+- 007 - AI - Stored page counts and summed queued and completed pages for admission control
+- 008 - AI - Stopped loading chunk bodies with the task; partial results are read with get_chunks
+- 009 - AI - Exposed the configured backend so callers can check it before opening the store
+- 010 - AI - Folded the added columns into one schema and dropped the unused task_results table
+- 011 - AI - Stored when each client following a task was last seen, so every process sees the same subscribers
+- 012 - AI - Counted only the pages the current run extracts in page stats, so a retry adds just its failed pages
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field
+
+from reader.pdf import ChunkResult
+
+
+class TaskStatus(Enum):
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    ERROR = "error"
+    CANCELLED = "cancelled"
+
+
+class Task(BaseModel):
+    status: TaskStatus = Field(default=TaskStatus.PROCESSING)
+    original_filename: str
+    temp_filename: str
+    content_hash: Optional[str] = None
+    dedup_key: Optional[str] = None
+    language: str = "cn"
+    pages: int = 0
+    # Pages the current or latest run extracts: all of them at first, only the failed chunks' on a retry
+    run_pages: int = 0
+    # Size of the merged markdown; the text itself is read from the chunks
+    result_bytes: int = 0
+    error: Optional[str] = None
+    progress: int = Field(default=0)
+    failed_chunks: int = 0
+    created_at: float = Field(default_factory=time.time)
+    updated_at: float = Field(default_factory=time.time)
+    completed_at: Optional[float] = None
+    # Last time a client polled or streamed this task
+    last_seen_at: float = Field(default_factory=time.time)
+
+
+class TaskStore(ABC):
+    @abstractmethod
+    def insert(self, task_id: str, task: Task) -> None: ...
+
+    @abstractmethod
+    def update(self, task_id: str, **fields: Any) -> None: ...
+
+    @abstractmethod
+    def put_chunk(self, task_id: str, chunk: ChunkResult) -> None: ...
+
+    @abstractmethod
+    def get_chunks(self, task_id: str, start: int = 0, limit: Optional[int] = None) -> List[ChunkResult]:
+        """Chunks with index >= start in order, at most limit of them."""
+
+    @abstractmethod
+    def set_result(self, task_id: str, result_bytes: int, completed_at: float) -> None: ...
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Task]: ...
+
+    @abstractmethod
+    def find_id_by_dedup_key(self, dedup_key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    def has_processing_temp_file(self, temp_filename: str) -> bool: ...
+
+    @abstractmethod
+    def processing_count(self) -> int: ...
+
+    @abstractmethod
+    def touch(self, task_id: str, seen_at: float) -> None:
+        """Record that a client is still watching, without counting as a change to the task."""
+
+    @abstractmethod
+    def abandoned_ids(self, seen_before: float) -> List[str]:
+        """Processing tasks no client has looked at since seen_before."""
+
+    @abstractmethod
+    def touch_subscriber(self, task_id: str, subscriber: str, seen_at: float) -> None:
+        """Record that one client following a processing task is still there."""
+
+    @abstractmethod
+    def remove_subscribers(self, task_id: str, subscriber: Optional[str] = None) -> None:
+        """Forget one client following the task, or all of them."""
+
+    @abstractmethod
+    def has_subscribers(self, task_id: str, seen_after: float) -> bool:
+        """Whether any client following the task was seen after seen_after."""
+
+    @abstractmethod
+    def page_stats(self, completed_after: float) -> Tuple[float, int]:
+        """Pages still to extract across processing tasks, and pages of tasks completed after completed_after."""
+
+    @abstractmethod
+    def temp_filenames(self) -> Set[str]: ...
+
+    @abstractmethod
+    def evict(self, older_than: float, max_result_bytes: int) -> List[str]:
+        """Drop finished tasks past the TTL, then the oldest ones over the size budget; return their temp files."""
+
+    @abstractmethod
+    def fail_interrupted(self, error: str) -> int:
+        """Mark tasks left PROCESSING by a previous process as failed."""
+
+
+class MemoryTaskStore(TaskStore):
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+        self.by_dedup_key: Dict[str, str] = {}
+        self.chunks: Dict[str, Dict[int, ChunkResult]] = {}
+        self.subscribers: Dict[str, Dict[str, float]] = {}
+
+    def insert(self, task_id: str, task: Task) -> None:
+        self.tasks[task_id] = task
+        if task.dedup_key:
+            self.by_dedup_key[task.dedup_key] = task_id
+
+    def update(self, task_id: str, **fields: Any) -> None:
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        for name, value in fields.items():
+            setattr(task, name, value)
+        task.updated_at = time.time()
+        if "dedup_key" in fields and fields["dedup_key"] is None:
+            self.by_dedup_key = {k: v for k, v in self.by_dedup_key.items() if v != task_id}
+
+    def put_chunk(self, task_id: str, chunk: ChunkResult) -> None:
+        if task_id in self.tasks:
+            self.chunks.setdefault(task_id, {})[chunk.index] = chunk
+            self.tasks[task_id].updated_at = time.time()
+
+    def get_chunks(self, task_id: str, start: int = 0, limit: Optional[int] = None) -> List[ChunkResult]:
+        chunks = sorted(
+            (chunk for chunk in self.chunks.get(task_id, {}).values() if chunk.index >= start),
+            key=lambda chunk: chunk.index,
+        )
+        return chunks if limit is None else chunks[:limit]
+
+    def set_result(self, task_id: str, result_bytes: int, completed_at: float) -> None:
+        self.update(
+            task_id,
+            status=TaskStatus.COMPLETED,
+            result_bytes=result_bytes,
+            progress=100,
+            completed_at=completed_at,
+        )
+
+    def get(self, task_id: str) -> Optional[Task]:
+        return self.tasks.get(task_id)
+
+    def find_id_by_dedup_key(self, dedup_key: str) -> Optional[str]:
+        return self.by_dedup_key.get(dedup_key)
+
+    def has_processing_temp_file(self, temp_filename: str) -> bool:
+        return any(
+            task.status == TaskStatus.PROCESSING and task.temp_filename == temp_filename for task in self.tasks.values()
+        )
+
+    def processing_count(self) -> int:
+        return sum(1 for task in self.tasks.values() if task.status == TaskStatus.PROCESSING)
+
+    def touch(self, task_id: str, seen_at: float) -> None:
+        task = self.tasks.get(task_id)
+        if task is not None:
+            task.last_seen_at = seen_at
+
+    def abandoned_ids(self, seen_before: float) -> List[str]:
+        return [
+            task_id
+            for task_id, task in self.tasks.items()
+            if task.status == TaskStatus.PROCESSING and task.last_seen_at < seen_before
+        ]
+
+    def touch_subscriber(self, task_id: str, subscriber: str, seen_at: float) -> None:
+        task = self.tasks.get(task_id)
+        if task is not None and task.status == TaskStatus.PROCESSING:
+            self.subscribers.setdefault(task_id, {})[subscriber] = seen_at
+
+    def remove_subscribers(self, task_id: str, subscriber: Optional[str] = None) -> None:
+        followers = self.subscribers.get(task_id)
+        if followers is not None and subscriber is not None:
+            followers.pop(subscriber, None)
+        if not followers or subscriber is None:
+            self.subscribers.pop(task_id, None)
+
+    def has_subscribers(self, task_id: str, seen_after: float) -> bool:
+        return any(seen_at > seen_after for seen_at in self.subscribers.get(task_id, {}).values())
+
+    def page_stats(self, completed_after: float) -> Tuple[float, int]:
+        backlog_pages = 0.0
+        completed_pages = 0
+        for task in self.tasks.values():
+            if task.status == TaskStatus.PROCESSING:
+                backlog_pages += task.run_pages * (100 - task.progress) / 100
+            elif task.status == TaskStatus.COMPLETED and (task.completed_at or 0) > completed_after:
+                completed_pages += task.run_pages
+        return backlog_pages, completed_pages
+
+    def temp_filenames(self) -> Set[str]:
+        return {task.temp_filename for task in self.tasks.values()}
+
+    def evict(self, older_than: float, max_result_bytes: int) -> List[str]:
+        finished = sorted(
+            (task.updated_at, task_id, task)
+            for task_id, task in self.tasks.items()
+            if task.status != TaskStatus.PROCESSING
+        )
+        total_bytes = sum(task.result_bytes for _, _, task in finished)
+
+        evicted = []
+        for updated_at, task_id, task in finished:
+            if updated_at >= older_than and total_bytes <= max_result_bytes:
+                break
+            total_bytes -= task.result_bytes
+            evicted.append(task_id)
+
+        temp_filenames = []
+        for task_id in evicted:
+            task = self.tasks.pop(task_id)
+            self.chunks.pop(task_id, None)
+            self.subscribers.pop(task_id, None)
+            if task.dedup_key and self.by_dedup_key.get(task.dedup_key) == task_id:
+                del self.by_dedup_key[task.dedup_key]
+            temp_filenames.append(task.temp_filename)
+        return temp_filenames
+
+    def fail_interrupted(self, error: str) -> int:
+        # Nothing survives a restart in memory
+        return 0
+
+
+class SQLiteTaskStore(TaskStore):
+    # Chunk results live in their own table, zlib-compressed, so status polls only touch the small hot row
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tasks (
+        task_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        original_filename TEXT NOT NULL,
+        temp_filename TEXT NOT NULL,
+        content_hash TEXT,
+        dedup_key TEXT,
+        language TEXT NOT NULL DEFAULT 'cn',
+        pages INTEGER NOT NULL DEFAULT 0,
+        run_pages INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        progress INTEGER NOT NULL DEFAULT 0,
+        result_bytes INTEGER NOT NULL DEFAULT 0,
+        failed_chunks INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        completed_at REAL,
+        last_seen_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_temp_filename ON tasks (temp_filename, status);
+    CREATE INDEX IF NOT EXISTS idx_tasks_content_hash ON tasks (content_hash);
+    CREATE INDEX IF NOT EXISTS idx_tasks_dedup_key ON tasks (dedup_key, created_at);
+    CREATE INDEX IF NOT EXISTS idx_tasks_status_updated_at ON tasks (status, updated_at);
+    CREATE INDEX IF NOT EXISTS idx_tasks_status_completed_at ON tasks (status, completed_at);
+    CREATE TABLE IF NOT EXISTS task_chunks (
+        task_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        start_page INTEGER NOT NULL,
+        end_page INTEGER NOT NULL,
+        body BLOB NOT NULL,
+        PRIMARY KEY (task_id, idx)
+    );
+    CREATE TABLE IF NOT EXISTS task_subscribers (
+        task_id TEXT NOT NULL,
+        subscriber TEXT NOT NULL,
+        seen_at REAL NOT NULL,
+        PRIMARY KEY (task_id, subscriber)
+    );
+    """
+
+    COLUMNS = {"status", "error", "progress", "dedup_key", "completed_at", "failed_chunks", "last_seen_at", "run_pages"}
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def insert(self, task_id: str, task: Task) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO tasks (task_id, status, original_filename, temp_filename, content_hash, dedup_key, "
+            "language, pages, run_pages, error, progress, created_at, updated_at, completed_at, last_seen_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                task_id,
+                task.status.value,
+                task.original_filename,
+                task.temp_filename,
+                task.content_hash,
+                task.dedup_key,
+                task.language,
+                task.pages,
+                task.run_pages,
+                task.error,
+                task.progress,
+                task.created_at,
+                task.updated_at,
+                task.completed_at,
+                task.last_seen_at,
+            ),
+        )
+
+    def update(self, task_id: str, **fields: Any) -> None:
+        unknown = set(fields) - self.COLUMNS
+        if unknown:
+            raise ValueError(f"Unknown task fields: {', '.join(sorted(unknown))}")
+
+        values = {name: value.value if isinstance(value, Enum) else value for name, value in fields.items()}
+        values["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in values)
+        self._execute(f"UPDATE tasks SET {assignments} WHERE task_id = ?", (*values.values(), task_id))
+
+    def put_chunk(self, task_id: str, chunk: ChunkResult) -> None:
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO task_chunks (task_id, idx, start_page, end_page, body) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (task_id, chunk.index, chunk.start_page, chunk.end_page, zlib.compress(chunk.text.encode("utf-8"))),
+                )
+                self.conn.execute("UPDATE tasks SET updated_at = ? WHERE task_id = ?", (time.time(), task_id))
+
+    def get_chunks(self, task_id: str, start: int = 0, limit: Optional[int] = None) -> List[ChunkResult]:
+        rows = self._execute(
+            "SELECT idx, start_page, end_page, body FROM task_chunks "
+            "WHERE task_id = ? AND idx >= ? ORDER BY idx LIMIT ?",
+            (task_id, start, -1 if limit is None else limit),
+        ).fetchall()
+        return [
+            ChunkResult(
+                index=row["idx"],
+                start_page=row["start_page"],
+                end_page=row["end_page"],
+                text=zlib.decompress(row["body"]).decode("utf-8"),
+            )
+            for row in rows
+        ]
+
+    def set_result(self, task_id: str, result_bytes: int, completed_at: float) -> None:
+        self._execute(
+            "UPDATE tasks SET status = ?, progress = 100, result_bytes = ?, completed_at = ?, updated_at = ? "
+            "WHERE task_id = ?",
+            (TaskStatus.COMPLETED.value, result_bytes, completed_at, time.time(), task_id),
+        )
+
+    def get(self, task_id: str) -> Optional[Task]:
+        row = self._execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+
+        return Task(
+            status=TaskStatus(row["status"]),
+            original_filename=row["original_filename"],
+            temp_filename=row["temp_filename"],
+            content_hash=row["content_hash"],
+            dedup_key=row["dedup_key"],
+            language=row["language"],
+            pages=row["pages"],
+            run_pages=row["run_pages"],
+            error=row["error"],
+            progress=row["progress"],
+            result_bytes=row["result_bytes"],
+            failed_chunks=row["failed_chunks"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            completed_at=row["completed_at"],
+            last_seen_at=row["last_seen_at"],
+        )
+
+    def find_id_by_dedup_key(self, dedup_key: str) -> Optional[str]:
+        row = self._execute(
+            "SELECT task_id FROM tasks WHERE dedup_key = ? ORDER BY created_at DESC LIMIT 1", (dedup_key,)
+        ).fetchone()
+        return row["task_id"] if row else None
+
+    def has_processing_temp_file(self, temp_filename: str) -> bool:
+        row = self._execute(
+            "SELECT 1 FROM tasks WHERE temp_filename = ? AND status = ? LIMIT 1",
+            (temp_filename, TaskStatus.PROCESSING.value),
+        ).fetchone()
+        return row is not None
+
+    def processing_count(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (TaskStatus.PROCESSING.value,)).fetchone()[
+            0
+        ]
+
+    def touch(self, task_id: str, seen_at: float) -> None:
+        self._execute("UPDATE tasks SET last_seen_at = ? WHERE task_id = ?", (seen_at, task_id))
+
+    def abandoned_ids(self, seen_before: float) -> List[str]:
+        rows = self._execute(
+            "SELECT task_id FROM tasks WHERE status = ? AND last_seen_at < ?",
+            (TaskStatus.PROCESSING.value, seen_before),
+        ).fetchall()
+        return [row["task_id"] for row in rows]
+
+    def touch_subscriber(self, task_id: str, subscriber: str, seen_at: float) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO task_subscribers (task_id, subscriber, seen_at) "
+            "SELECT task_id, ?, ? FROM tasks WHERE task_id = ? AND status = ?",
+            (subscriber, seen_at, task_id, TaskStatus.PROCESSING.value),
+        )
+
+    def remove_subscribers(self, task_id: str, subscriber: Optional[str] = None) -> None:
+        if subscriber is None:
+            self._execute("DELETE FROM task_subscribers WHERE task_id = ?", (task_id,))
+        else:
+            self._execute("DELETE FROM task_subscribers WHERE task_id = ? AND subscriber = ?", (task_id, subscriber))
+
+    def has_subscribers(self, task_id: str, seen_after: float) -> bool:
+        row = self._execute(
+            "SELECT 1 FROM task_subscribers WHERE task_id = ? AND seen_at > ? LIMIT 1", (task_id, seen_after)
+        ).fetchone()
+        return row is not None
+
+    def page_stats(self, completed_after: float) -> Tuple[float, int]:
+        row = self._execute(
+            "SELECT "
+            "COALESCE(SUM(CASE WHEN status = ? THEN run_pages * (100 - progress) / 100.0 END), 0) AS backlog_pages, "
+            "COALESCE(SUM(CASE WHEN status = ? THEN run_pages END), 0) AS completed_pages "
+            "FROM tasks WHERE status = ? OR (status = ? AND completed_at > ?)",
+            (
+                TaskStatus.PROCESSING.value,
+                TaskStatus.COMPLETED.value,
+                TaskStatus.PROCESSING.value,
+                TaskStatus.COMPLETED.value,
+                completed_after,
+            ),
+        ).fetchone()
+        return row["backlog_pages"], row["completed_pages"]
+
+    def temp_filenames(self) -> Set[str]:
+        return {row["temp_filename"] for row in self._execute("SELECT DISTINCT temp_filename FROM tasks").fetchall()}
+
+    def evict(self, older_than: float, max_result_bytes: int) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT task_id, temp_filename, result_bytes, updated_at FROM tasks "
+                "WHERE status != ? ORDER BY updated_at",
+                (TaskStatus.PROCESSING.value,),
+            ).fetchall()
+            total_bytes = sum(row["result_bytes"] for row in rows)
+
+            evicted = []
+            for row in rows:
+                if row["updated_at"] >= older_than and total_bytes <= max_result_bytes:
+                    break
+                total_bytes -= row["result_bytes"]
+                evicted.append(row)
+
+            if evicted:
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    for table in ("tasks", "task_chunks", "task_subscribers"):
+                        self.conn.executemany(
+                            f"DELETE FROM {table} WHERE task_id = ?", [(row["task_id"],) for row in evicted]
+                        )
+
+        return [row["temp_filename"] for row in evicted]
+
+    def fail_interrupted(self, error: str) -> int:
+        cursor = self._execute(
+            "UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE status = ?",
+            (TaskStatus.ERROR.value, error, time.time(), TaskStatus.PROCESSING.value),
+        )
+        return cursor.rowcount
+
+
+def task_db_path() -> str:
+    return os.environ.get("READER_TASK_DB", "data/reader.db")
+
+
+def task_store_backend() -> str:
+    return os.environ.get("READER_TASK_STORE", "sqlite")
+
+
+def create_task_store() -> TaskStore:
+    backend = task_store_backend()
+    if backend == "memory":
+        return MemoryTaskStore()
+    if backend == "sqlite":
+        return SQLiteTaskStore(task_db_path())
+    raise ValueError(f"Unknown READER_TASK_STORE backend: {backend}")
@@ -0,0 +1,427 @@
+"""
+## ChangeLog
+
+- 001 - AI - Moved TaskManager out of main.py onto a pluggable task store with TTL/size eviction and orphan cleanup
+- 002 - AI - Added per-task change notifications for pushing updates over Server-Sent Events
+- 003 - AI - Recorded every chunk result and added retrying just the failed chunks of a finished task
+- 004 - AI - Let watchers poll the store for changes made by extraction workers in other processes
+- 005 - AI - Exposed the number of processing tasks for metrics
+- 006 - AI - Served results in chunk pages and as a stream instead of one stored string
+- 007 - AI - Cancelled tasks on request or once no client has polled or streamed them for a while
+- 008 - AI - Recorded page counts and exposed page backlog and completions for admission control
+- 009 - AI - Kept the hash computed at upload for each upload file
+- 010 - AI - Accepted only files inside the upload directory and never removed anything outside it
+- 011 - AI - Cancelled only once no client follows a task, restored retried tasks on cancel and forgot finished tasks
+- 012 - AI - Kept the earlier result when a retry of failed chunks fails
+- 013 - AI - Kept subscribers in the task store so a cancel in any process sees clients following elsewhere
+- 014 - AI - Put only the pages of the failed chunks back in the page backlog when retrying
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+import logfire
+
+from reader.metrics import TASKS_CANCELLED_TOTAL
+from reader.pdf import CHUNK_SEPARATOR, PROCESSING_FAILED, ChunkResult, is_failed_chunk, merge_chunk_results
+from reader.store import Task, TaskStatus, TaskStore
+
+UPLOAD_DIR = os.environ.get("READER_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "reader-uploads"))
+
+
+class TaskManager:
+    def __init__(
+        self,
+        store: TaskStore,
+        upload_dir: str,
+        reuse_ttl_s: int = 3600,
+        task_ttl_s: int = 24 * 3600,
+        max_result_bytes: int = 1024 * 1024 * 1024,
+        orphan_grace_s: int = 3600,
+        poll_interval_s: Optional[float] = None,
+        abandon_after_s: float = 0,
+    ):
+        self.store = store
+        self.upload_dir = upload_dir
+        self.reuse_ttl_s = reuse_ttl_s
+        self.task_ttl_s = task_ttl_s
+        self.max_result_bytes = max_result_bytes
+        # Uploads sit unreferenced between /api/pdf/upload and /api/pdf/process, so give them time
+        self.orphan_grace_s = orphan_grace_s
+        # Set when tasks are updated by other processes, whose changes never reach _notify here
+        self.poll_interval_s = poll_interval_s
+        # Processing tasks nobody has polled or streamed for this long are cancelled; 0 keeps them running
+        self.abandon_after_s = abandon_after_s
+        # Last-seen writes are throttled so a 1s poll does not mean a write per second
+        self.touch_interval_s = 5.0
+        # A client that has not polled or streamed for this long no longer keeps a task from being cancelled
+        self.subscriber_timeout_s = abandon_after_s or 60.0
+
+        self.watchers: Dict[str, Set[asyncio.Event]] = {}
+        # Extractions running in this process, so cancelling a task can stop its chunks
+        self.runs: Dict[str, asyncio.Task] = {}
+        # Only processing tasks have entries; they are dropped once a task is seen to have finished
+        self.last_touched: Dict[str, float] = {}
+        # When this process last wrote each subscriber's last-seen time, throttled like last_touched
+        self.subscribers_touched: Dict[str, Dict[str, float]] = {}
+        # SHA-256 of each upload as computed while it was received, keyed by its path
+        self.upload_hashes: Dict[str, str] = {}
+
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def fail_interrupted(self) -> None:
+        # Only valid when this process runs every extraction itself; queued jobs are recovered by the workers
+        interrupted = self.store.fail_interrupted("Processing was interrupted by a server restart")
+        if interrupted:
+            logfire.warn(f"Marked {interrupted} interrupted tasks as failed")
+
+    def resolve_upload(self, temp_filename: str) -> Optional[str]:
+        """Return the real path of an upload, or None if the name points anywhere outside the upload directory."""
+        upload_dir = os.path.realpath(self.upload_dir)
+        path = os.path.realpath(temp_filename)
+        if path == upload_dir or os.path.commonpath([upload_dir, path]) != upload_dir:
+            return None
+        return path
+
+    def remember_upload(self, temp_filename: str, content_hash: str) -> None:
+        self.upload_hashes[os.path.realpath(temp_filename)] = content_hash
+
+    def upload_hash(self, temp_filename: str) -> Optional[str]:
+        return self.upload_hashes.get(os.path.realpath(temp_filename))
+
+    def add_task(
+        self,
+        task_id: str,
+        original_filename: str,
+        temp_filename: str,
+        content_hash: Optional[str] = None,
+        dedup_key: Optional[str] = None,
+        language: str = "cn",
+        pages: int = 0,
+    ) -> Task:
+        # Clean up previous temp file if it exists
+        previous = self.store.get(task_id)
+        if previous and os.path.exists(previous.temp_filename):
+            try:
+                os.remove(previous.temp_filename)
+            except Exception as e:
+                logfire.error(f"Failed to remove old temp file: {str(e)}")
+
+        task = Task(
+            original_filename=original_filename,
+            temp_filename=temp_filename,
+            content_hash=content_hash,
+            dedup_key=dedup_key,
+            language=language,
+            pages=pages,
+            run_pages=pages,
+            progress=0,
+        )
+        self.store.insert(task_id, task)
+        return task
+
+    def track(self, task_id: str, run: asyncio.Task) -> None:
+        self.runs[task_id] = run
+
+        def forget(_: asyncio.Task) -> None:
+            if self.runs.get(task_id) is run:
+                del self.runs[task_id]
+            self._forget(task_id)
+
+        run.add_done_callback(forget)
+
+    def subscribe(self, task_id: str) -> str:
+        """Register a client following a task; it sends the id back with its status, event and cancel requests."""
+        subscriber = uuid.uuid4().hex
+        self._touch_subscriber(task_id, subscriber, time.time())
+        return subscriber
+
+    def unsubscribe(self, task_id: str, subscriber: str) -> None:
+        touched = self.subscribers_touched.get(task_id)
+        if touched is not None:
+            touched.pop(subscriber, None)
+            if not touched:
+                del self.subscribers_touched[task_id]
+        self.store.remove_subscribers(task_id, subscriber)
+
+    def has_subscribers(self, task_id: str) -> bool:
+        # Clients may follow the task through another web process, so only the store knows them all
+        return self.store.has_subscribers(task_id, time.time() - self.subscriber_timeout_s)
+
+    def _touch_subscriber(self, task_id: str, subscriber: str, now: float) -> None:
+        self.subscribers_touched.setdefault(task_id, {})[subscriber] = now
+        self.store.touch_subscriber(task_id, subscriber, now)
+
+    def touch(self, task_id: str, subscriber: Optional[str] = None) -> None:
+        now = time.time()
+        if subscriber:
+            # Written often enough that a client still polling never looks gone
+            interval_s = min(self.touch_interval_s, self.subscriber_timeout_s / 2)
+            if now - self.subscribers_touched.get(task_id, {}).get(subscriber, 0) >= interval_s:
+                self._touch_subscriber(task_id, subscriber, now)
+        if now - self.last_touched.get(task_id, 0) >= self.touch_interval_s:
+            self.last_touched[task_id] = now
+            self.store.touch(task_id, now)
+
+    def poll(self, task_id: str, subscriber: Optional[str] = None) -> Optional[Task]:
+        """Record that a client is still following the task and return it."""
+        self.touch(task_id, subscriber)
+        task = self.store.get(task_id)
+        if task is None or task.status != TaskStatus.PROCESSING:
+            # Tasks finished by a worker process never pass through set_completed here
+            self._forget(task_id)
+        return task
+
+    def is_running(self, task_id: str) -> bool:
+        task = self.store.get(task_id)
+        return task is not None and task.status == TaskStatus.PROCESSING
+
+    def cancel(self, task_id: str, reason: str = "user", subscriber: Optional[str] = None) -> bool:
+        """
+        Detach subscriber from a processing task, and stop the task once no other client follows it.
+
+        Chunks still waiting for a concurrency slot never reach the API. Runs in this process are
+        cancelled directly; workers notice the status on their next heartbeat. Cancelling a retry of
+        failed chunks puts back the completed result the task had before it.
+        """
+        task = self.store.get(task_id)
+        if task is None or task.status != TaskStatus.PROCESSING:
+            return False
+
+        if subscriber:
+            self.unsubscribe(task_id, subscriber)
+        if self.has_subscribers(task_id):
+            # Requests coalesced onto this task are still waiting for it
+            return False
+
+        if task.completed_at is not None:
+            self.complete_from_chunks(task_id)
+        else:
+            error = (
+                "Cancelled by the user" if reason == "user" else "Cancelled because nobody was waiting for the result"
+            )
+            self.store.update(task_id, status=TaskStatus.CANCELLED, error=error, dedup_key=None)
+        run = self.runs.get(task_id)
+        if run is not None:
+            run.cancel()
+        TASKS_CANCELLED_TOTAL.inc(reason=reason)
+        self.store.remove_subscribers(task_id)
+        self._forget(task_id)
+        self._notify(task_id)
+        return True
+
+    def cancel_abandoned(self) -> None:
+        for task_id in self.store.abandoned_ids(time.time() - self.abandon_after_s):
+            if self.cancel(task_id, reason="abandoned"):
+                logfire.info(f"Cancelled task {task_id}: no client for {self.abandon_after_s:.0f}s")
+
+    async def run_reaper(self, interval_s: float = 10) -> None:
+        while True:
+            try:
+                self.cancel_abandoned()
+            except Exception as e:
+                logfire.error(f"Abandoned task check failed: {str(e)}")
+            await asyncio.sleep(interval_s)
+
+    # Writes from a run are dropped once its task is no longer processing, e.g. after a cancel that another
+    # process made or that restored a retried task, so a late chunk cannot change a settled result
+
+    def update_progress(self, task_id: str, progress: int) -> None:
+        if not self.is_running(task_id):
+            return
+        self.store.update(task_id, progress=progress)
+        self._notify(task_id)
+
+    def add_chunk_result(self, task_id: str, chunk: ChunkResult) -> None:
+        if not self.is_running(task_id):
+            return
+        self.store.put_chunk(task_id, chunk)
+        self._notify(task_id)
+
+    def set_completed(self, task_id: str, result: str) -> None:
+        if not self.is_running(task_id):
+            return
+        failed_chunks = sum(1 for chunk in self.store.get_chunks(task_id) if is_failed_chunk(chunk.text))
+        self.store.set_result(task_id, len(result.encode("utf-8")), time.time())
+        self.store.update(task_id, failed_chunks=failed_chunks)
+        if result == PROCESSING_FAILED:
+            # A failed extraction must not be handed out to later identical requests
+            self.store.update(task_id, dedup_key=None)
+        self.store.remove_subscribers(task_id)
+        self._forget(task_id)
+        self._notify(task_id)
+
+    def set_error(self, task_id: str, error: str) -> None:
+        task = self.store.get(task_id)
+        if task is None or task.status != TaskStatus.PROCESSING:
+            return
+        if task.completed_at is not None:
+            # A failed retry keeps the result from before it, with the chunks that failed again still marked
+            logfire.warn(f"Retry of task {task_id} failed, keeping its earlier result: {error}")
+            self.complete_from_chunks(task_id)
+            return
+        self.store.update(task_id, status=TaskStatus.ERROR, error=error, dedup_key=None)
+        self.store.remove_subscribers(task_id)
+        self._forget(task_id)
+        self._notify(task_id)
+
+    def get_task(self, task_id: str) -> Optional[Task]:
+        return self.store.get(task_id)
+
+    def get_chunks(self, task_id: str, start: int = 0, limit: Optional[int] = None) -> List[ChunkResult]:
+        return self.store.get_chunks(task_id, start, limit)
+
+    def iter_result(self, task_id: str, page_chunks: int = 20) -> Iterator[str]:
+        """Yield the merged result piece by piece, matching merge_chunk_results without holding it all."""
+        start = 0
+        first = True
+        while chunks := self.store.get_chunks(task_id, start, page_chunks):
+            for chunk in chunks:
+                if chunk.text.strip():
+                    yield chunk.text if first else CHUNK_SEPARATOR + chunk.text
+                    first = False
+            start = chunks[-1].index + 1
+        if first:
+            yield PROCESSING_FAILED
+
+    def start_retry(self, task_id: str) -> List[ChunkResult]:
+        """Put a finished task back into processing and return the chunks that need another attempt."""
+        task = self.store.get(task_id)
+        if task is None or task.status != TaskStatus.COMPLETED:
+            return []
+
+        failed = [chunk for chunk in self.store.get_chunks(task_id) if is_failed_chunk(chunk.text)]
+        if failed:
+            run_pages = sum(chunk.end_page - chunk.start_page + 1 for chunk in failed)
+            self.store.update(
+                task_id, status=TaskStatus.PROCESSING, progress=0, run_pages=run_pages, last_seen_at=time.time()
+            )
+            self._notify(task_id)
+        return failed
+
+    def complete_from_chunks(self, task_id: str) -> None:
+        # Rebuild the result from every recorded chunk so retried text lands where the failure was
+        self.set_completed(task_id, merge_chunk_results([chunk.text for chunk in self.store.get_chunks(task_id)]))
+
+    def find_reusable(self, dedup_key: str) -> Optional[str]:
+        task_id = self.store.find_id_by_dedup_key(dedup_key)
+        task = self.store.get(task_id) if task_id else None
+        if task_id is None or task is None:
+            return None
+
+        if task.status == TaskStatus.PROCESSING:
+            return task_id
+
+        if task.status == TaskStatus.COMPLETED and time.time() - (task.completed_at or 0) < self.reuse_ttl_s:
+            return task_id
+
+        return None
+
+    def _forget(self, task_id: str) -> None:
+        self.last_touched.pop(task_id, None)
+        self.subscribers_touched.pop(task_id, None)
+
+    def _notify(self, task_id: str) -> None:
+        for event in self.watchers.get(task_id, ()):
+            event.set()
+
+    async def watch(
+        self, task_id: str, subscriber: Optional[str] = None, heartbeat_s: float = 15
+    ) -> AsyncIterator[Optional[Task]]:
+        """
+        Yield the task now and again after each change until it finishes.
+
+        Changes that land while the consumer is busy collapse into one wakeup. The task is
+        re-sent every heartbeat_s even without changes so proxies keep the stream open. With
+        poll_interval_s set, the store is also re-read on that interval and only changes are sent.
+        """
+        event = asyncio.Event()
+        self.watchers.setdefault(task_id, set()).add(event)
+        last_updated_at: Optional[float] = None
+        last_sent_at = 0.0
+        try:
+            while True:
+                task = self.poll(task_id, subscriber)
+                now = time.monotonic()
+                if task is None or task.updated_at != last_updated_at or now - last_sent_at >= heartbeat_s:
+                    yield task
+                    last_updated_at = task.updated_at if task else None
+                    last_sent_at = now
+                if task is None or task.status != TaskStatus.PROCESSING:
+                    return
+
+                try:
+                    await asyncio.wait_for(event.wait(), self.poll_interval_s or heartbeat_s)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            watchers = self.watchers.get(task_id)
+            if watchers is not None:
+                watchers.discard(event)
+                if not watchers:
+                    del self.watchers[task_id]
+            # A closed stream is a client gone; if it reconnects or falls back to polling it is seen again
+            if subscriber:
+                self.unsubscribe(task_id, subscriber)
+
+    def is_processing(self, temp_filename: str) -> bool:
+        return self.store.has_processing_temp_file(temp_filename)
+
+    def processing_count(self) -> int:
+        return self.store.processing_count()
+
+    def page_stats(self, completed_after: float) -> Tuple[float, int]:
+        return self.store.page_stats(completed_after)
+
+    def evict(self) -> None:
+        now = time.time()
+        evicted_files = set(self.store.evict(now - self.task_ttl_s, self.max_result_bytes))
+        live_files = self.store.temp_filenames()
+
+        removed = 0
+        for temp_filename in evicted_files - live_files:
+            removed += self._remove_file(temp_filename)
+
+        # Uploads that never became a task, or whose task vanished with a crash
+        for entry in os.scandir(self.upload_dir):
+            # Tasks record the real path, which differs from entry.path when the upload dir is behind a symlink
+            if os.path.realpath(entry.path) in live_files or not entry.is_file():
+                continue
+            if now - entry.stat().st_mtime > self.orphan_grace_s:
+                removed += self._remove_file(entry.path)
+
+        self.upload_hashes = {path: digest for path, digest in self.upload_hashes.items() if os.path.exists(path)}
+        # Tasks nobody polled after they finished in another process still have entries here
+        for task_id in set(self.last_touched) | set(self.subscribers_touched):
+            if not self.is_running(task_id):
+                self._forget(task_id)
+
+        if evicted_files or removed:
+            logfire.info(f"Evicted {len(evicted_files)} tasks and removed {removed} temp files")
+
+    def _remove_file(self, path: str) -> int:
+        if self.resolve_upload(path) is None:
+            # Tasks only ever point into the upload directory; anything else is left alone
+            logfire.warn(f"Not removing {path}: it is outside the upload directory")
+            return 0
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logfire.error(f"Failed to remove temp file {path}: {str(e)}")
+            return 0
+
+    async def run_eviction(self, interval_s: int = 300) -> None:
+        while True:
+            try:
+                self.evict()
+            except Exception as e:
+                logfire.error(f"Task eviction failed: {str(e)}")
+            await asyncio.sleep(interval_s)
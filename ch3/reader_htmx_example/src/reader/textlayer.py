@@ -0,0 +1,136 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created text-layer fast path that renders simple born-digital pages to markdown locally
+- 002 - AI - Kept pages with ruled or borderless tables off the fast path
+- 003 - AI - Ran find_tables only on pages that have vector drawings to rule a table with
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import fitz
+
+from reader.planner import PageProfile
+
+# Hairlines, underlines and page rules are fine; anything busier may be a table or chart
+MAX_SIMPLE_DRAWINGS = 4
+MIN_SIMPLE_TEXT_CHARS = 200
+HEADING_SIZE_RATIO = 1.2
+# Borderless tables: rows of at least this many cells, where a cell gap is wider than any word space,
+# and at least this many such rows whose cells line up on shared left or right edges
+MIN_TABLE_COLUMNS = 3
+MIN_TABLE_ROWS = 3
+CELL_GAP = 12.0
+EDGE_TOLERANCE = 3.0
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uff00-\uffef]")
+
+
+def is_simple_text_page(profile: PageProfile) -> bool:
+    """Cheap check on the page profile; pages that pass still need has_table() before taking the fast path."""
+    return (
+        profile.image_count == 0
+        and profile.drawing_count <= MAX_SIMPLE_DRAWINGS
+        and profile.text_chars >= MIN_SIMPLE_TEXT_CHARS
+        and profile.replacement_chars == 0
+    )
+
+
+def _table_rows(page: fitz.Page) -> List[List[Tuple[float, float]]]:
+    """Group the page's words into visual rows and split each row into (x0, x1) cells at wide gaps."""
+    rows: Dict[int, List[Tuple[float, float]]] = {}
+    for x0, _, x1, y1, *_ in page.get_text("words"):
+        rows.setdefault(round(y1 / 2), []).append((x0, x1))
+
+    table_rows = []
+    for words in rows.values():
+        words.sort()
+        cells = [list(words[0])]
+        for x0, x1 in words[1:]:
+            if x0 - cells[-1][1] > CELL_GAP:
+                cells.append([x0, x1])
+            else:
+                cells[-1][1] = max(cells[-1][1], x1)
+        if len(cells) >= MIN_TABLE_COLUMNS:
+            table_rows.append([(x0, x1) for x0, x1 in cells])
+    return table_rows
+
+
+def has_aligned_columns(page: fitz.Page) -> bool:
+    rows = _table_rows(page)
+    if len(rows) < MIN_TABLE_ROWS:
+        return False
+
+    # Text columns start at the same x, numeric columns usually end at the same x
+    edge_rows: Counter = Counter()
+    for cells in rows:
+        edges = {("left", round(x0 / EDGE_TOLERANCE)) for x0, _ in cells}
+        edges |= {("right", round(x1 / EDGE_TOLERANCE)) for _, x1 in cells}
+        edge_rows.update(edges)
+
+    def is_aligned(side: str, x: float) -> bool:
+        bucket = round(x / EDGE_TOLERANCE)
+        return any(edge_rows[(side, b)] >= MIN_TABLE_ROWS for b in (bucket - 1, bucket, bucket + 1))
+
+    aligned_rows = sum(
+        1
+        for cells in rows
+        if sum(1 for x0, x1 in cells if is_aligned("left", x0) or is_aligned("right", x1)) >= MIN_TABLE_COLUMNS
+    )
+    return aligned_rows >= MIN_TABLE_ROWS
+
+
+def has_table(page: fitz.Page, profile: PageProfile) -> bool:
+    # Flattening a table into paragraphs loses its structure, so these pages go to the LLM
+    if has_aligned_columns(page):
+        return True
+    # find_tables looks for ruling lines and is slow, so pages without any drawings skip it
+    return profile.drawing_count > 0 and bool(page.find_tables().tables)
+
+
+def _join_lines(lines: List[str]) -> str:
+    text = ""
+    for line in lines:
+        if not text:
+            text = line
+        elif text.endswith("-") and line[:1].islower():
+            text = text[:-1] + line
+        elif _CJK.match(text[-1]) or _CJK.match(line[0]):
+            text += line
+        else:
+            text += " " + line
+    return text
+
+
+def render_page_markdown(page: fitz.Page) -> str:
+    blocks = [block for block in page.get_text("dict", sort=True)["blocks"] if block.get("type") == 0]
+
+    size_weights: Counter = Counter()
+    for block in blocks:
+        for line in block["lines"]:
+            for span in line["spans"]:
+                size_weights[round(span["size"])] += len(span["text"].strip())
+    if not size_weights:
+        return ""
+    body_size = size_weights.most_common(1)[0][0]
+
+    paragraphs = []
+    for block in blocks:
+        lines = []
+        max_size = 0.0
+        for line in block["lines"]:
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                lines.append(text)
+                max_size = max(max_size, *(span["size"] for span in line["spans"]))
+        if not lines:
+            continue
+
+        paragraph = _join_lines(lines)
+        if max_size >= body_size * HEADING_SIZE_RATIO and len(paragraph) < 120:
+            paragraph = f"### {paragraph}"
+        paragraphs.append(paragraph)
+
+    return "\n\n".join(paragraphs)
@@ -0,0 +1,241 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created extraction worker that runs queued jobs in its own process, sharing task state through SQLite
+- 002 - AI - Served the worker's metrics over HTTP on an optional port
+- 003 - AI - Stopped jobs whose task was cancelled, checking on each heartbeat
+- 004 - AI - Split the concurrency and per-key rate budget across the worker processes sharing the keys
+- 005 - AI - Stopped jobs whose task left processing for any reason, not only cancellation
+- 006 - AI - Retried only chunks that are still failed, so a requeued retry job skips the ones already done
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import logfire
+
+from reader.config import configure_logfire
+from reader.jobs import Job, JobKind, JobQueue
+from reader.metrics import REGISTRY
+from reader.pdf import ChunkResult, get_pdf_processor, get_prompt, is_failed_chunk
+from reader.store import Task, TaskStatus, create_task_store, task_db_path, task_store_backend
+from reader.tasks import UPLOAD_DIR, TaskManager
+
+
+async def run_extraction(
+    task_manager: TaskManager,
+    task_id: str,
+    temp_filename: str,
+    original_filename: str,
+    language: str = "cn",
+) -> None:
+    with logfire.span(f"/process-pdf: {original_filename}"):
+        try:
+            pdf_processor = get_pdf_processor()
+            prompt = get_prompt(language)
+
+            with open(temp_filename, "rb") as pdf_file:
+                async for progress in pdf_processor.extract(pdf_file, prompt, stream=True, owner=task_id):
+                    if isinstance(progress, int):
+                        task_manager.update_progress(task_id, progress)
+                    elif isinstance(progress, ChunkResult):
+                        task_manager.add_chunk_result(task_id, progress)
+                    else:
+                        task_manager.set_completed(task_id, progress)
+
+        except Exception as e:
+            logfire.error(f"/process-pdf: {str(e)}")
+            task_manager.set_error(task_id, str(e))
+
+
+async def run_retry(task_manager: TaskManager, task_id: str, failed: List[ChunkResult], task: Task) -> None:
+    with logfire.span(f"/retry-chunks: {task.original_filename}"):
+        try:
+            if not failed:
+                task_manager.complete_from_chunks(task_id)
+                return
+            ranges = [(chunk.start_page, chunk.end_page) for chunk in failed]
+            prompt = get_prompt(task.language)
+
+            with open(task.temp_filename, "rb") as pdf_file:
+                async for progress in get_pdf_processor().extract(
+                    pdf_file, prompt, stream=True, owner=task_id, ranges=ranges
+                ):
+                    if isinstance(progress, int):
+                        task_manager.update_progress(task_id, progress)
+                    elif isinstance(progress, ChunkResult):
+                        # Results come back indexed by position in the retry, so map them onto the original chunk
+                        original = failed[progress.index]
+                        task_manager.add_chunk_result(task_id, original.model_copy(update={"text": progress.text}))
+
+            task_manager.complete_from_chunks(task_id)
+
+        except Exception as e:
+            logfire.error(f"/retry-chunks: {str(e)}")
+            task_manager.set_error(task_id, str(e))
+
+
+class Worker:
+    def __init__(
+        self,
+        task_manager: TaskManager,
+        queue: JobQueue,
+        concurrency: int = 4,
+        poll_interval_s: float = 1.0,
+        heartbeat_s: float = 10.0,
+        stale_after_s: float = 60.0,
+        max_attempts: int = 3,
+    ):
+        self.task_manager = task_manager
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval_s = poll_interval_s
+        self.heartbeat_s = heartbeat_s
+        self.stale_after_s = stale_after_s
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.running_jobs = 0
+
+    async def run(self) -> None:
+        logfire.info(f"Worker {self.worker_id} started with {self.concurrency} concurrent jobs")
+        slots = asyncio.Semaphore(self.concurrency)
+
+        while True:
+            self._requeue_stale()
+            await slots.acquire()
+
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                slots.release()
+                await asyncio.sleep(self.poll_interval_s)
+                continue
+
+            asyncio.create_task(self._run_job(job, slots))
+
+    def _requeue_stale(self) -> None:
+        requeued, dropped = self.queue.requeue_stale(self.stale_after_s, self.max_attempts)
+        if requeued:
+            logfire.warn(f"Requeued {len(requeued)} jobs from unresponsive workers")
+        for task_id in dropped:
+            self.task_manager.set_error(task_id, "Extraction worker stopped responding")
+
+    async def _run_job(self, job: Job, slots: asyncio.Semaphore) -> None:
+        run = asyncio.create_task(self.execute(job))
+        heartbeat = asyncio.create_task(self._heartbeat(job, run))
+        self.running_jobs += 1
+        try:
+            await run
+        except asyncio.CancelledError:
+            if not run.cancelled():
+                raise
+            logfire.info(f"Job {job.job_id} for task {job.task_id} stopped: the task was cancelled")
+        except Exception as e:
+            logfire.error(f"Job {job.job_id} for task {job.task_id} failed: {str(e)}")
+            self.task_manager.set_error(job.task_id, str(e))
+        finally:
+            heartbeat.cancel()
+            self.running_jobs -= 1
+            self.queue.finish(job.job_id)
+            slots.release()
+
+    async def _heartbeat(self, job: Job, run: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_s)
+            self.queue.heartbeat(job.job_id)
+            # Cancellation is recorded in the shared store by the web process; a cancelled retry is completed again
+            if not self.task_manager.is_running(job.task_id):
+                run.cancel()
+                return
+
+    async def execute(self, job: Job) -> None:
+        task = self.task_manager.get_task(job.task_id)
+        if task is None:
+            logfire.warn(f"Job {job.job_id} refers to missing task {job.task_id}")
+            return
+        if task.status != TaskStatus.PROCESSING:
+            # Cancelled while the job was still queued
+            return
+
+        if job.kind == JobKind.EXTRACT:
+            await run_extraction(
+                self.task_manager, job.task_id, task.temp_filename, task.original_filename, task.language
+            )
+        else:
+            indices = set(job.payload.get("chunks", []))
+            # A job requeued after a worker died may find some of its chunks already retried successfully
+            failed = [
+                chunk
+                for chunk in self.task_manager.get_chunks(job.task_id)
+                if chunk.index in indices and is_failed_chunk(chunk.text)
+            ]
+            await run_retry(self.task_manager, job.task_id, failed, task)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serve_metrics(port: int) -> None:
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logfire.info(f"Serving worker metrics on :{port}/metrics")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run queued PDF extraction jobs")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.environ.get("READER_WORKER_JOBS", "4")),
+        help="documents processed at once by this worker",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.environ.get("READER_WORKER_METRICS_PORT", "0")),
+        help="serve Prometheus metrics on this port; 0 disables it",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("READER_WORKERS", "1")),
+        help="worker processes sharing the same API keys; each takes an equal share of the rate limits",
+    )
+    args = parser.parse_args()
+
+    configure_logfire()
+
+    if task_store_backend() != "sqlite":
+        raise ValueError("Extraction workers need READER_TASK_STORE=sqlite to share tasks with the web process")
+
+    store = create_task_store()
+    worker = Worker(TaskManager(store, UPLOAD_DIR), JobQueue(task_db_path()), concurrency=args.concurrency)
+
+    # Create the processor up front so its gauges are registered before the first scrape
+    get_pdf_processor().share_budget(args.workers)
+    REGISTRY.gauge("reader_worker_jobs_running", "Jobs this worker is running", function=lambda: worker.running_jobs)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    asyncio.run(worker.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -67,4 +67,36 @@ function updateCopyButtonText(buttonId) {
   setTimeout(() => {
     btn.innerText = originalText;
   }, 2000);
-} 
+}
+
+/**
+ * Copy text fetched from a URL to the clipboard, for results only partly rendered on the page
+ * @param {string} url - The URL that returns the text to copy
+ * @param {string} buttonId - The ID of the button to update
+ */
+function copyFromUrl(url, buttonId) {
+  fetch(url)
+    .then(response => {
+      if (!response.ok) {
+        throw new Error('HTTP ' + response.status);
+      }
+      return response.text();
+    })
+    .then(text => {
+      if (navigator.clipboard && navigator.clipboard.writeText) {
+        return navigator.clipboard.writeText(text)
+          .then(() => {
+            updateCopyButtonText(buttonId);
+          })
+          .catch(err => {
+            console.error('Failed to copy using navigator.clipboard:', err);
+            fallbackCopyMethod(text, buttonId);
+          });
+      }
+      fallbackCopyMethod(text, buttonId);
+    })
+    .catch(err => {
+      console.error('Failed to fetch text to copy:', err);
+      alert('Copy failed, please copy manually');
+    });
+}
@@ -100,7 +100,7 @@ function uploadPDF(file) {
         extractButton.disabled = false;
       }
     } else {
-      uploadStatusElement.textContent = '上传失败';
+      uploadStatusElement.textContent = xhr.status === 413 ? '文件过大' : '上传失败';
       uploadStatusElement.className = 'upload-status error';
       uploadStatusElement.style.display = 'flex';
       // Enable extract button on error to allow retry
@@ -173,3 +173,11 @@ function enableExtractButton() {
     extractButton.innerHTML = '<div class="button-text">提取</div>';
   }
 } 
+
+// htmx drops error responses by default; a 429 carries the busy notice and its own delayed retry
+document.addEventListener('htmx:beforeSwap', (event) => {
+  if (event.detail.xhr.status === 429) {
+    event.detail.shouldSwap = true;
+    event.detail.isError = false;
+  }
+});
@@ -0,0 +1,12 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created shared pytest setup that keeps logfire local and skips the live API key script
+"""
+
+import logfire
+
+# test_key.py calls the real Gemini API with keys from .env; run it directly instead
+collect_ignore = ["test_key.py"]
+
+logfire.configure(send_to_logfire=False, console=False)
@@ -0,0 +1,76 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for admission decisions, Retry-After and aging of documents that keep retrying
+"""
+
+from types import SimpleNamespace
+from typing import Tuple
+
+import pytest
+
+import reader.admission
+from reader.admission import AdmissionController
+
+
+class Service:
+    """A backlog that stays put, as with small documents arriving as fast as they finish, drained at 1 page/s."""
+
+    def __init__(self, backlog_pages: float):
+        self.backlog_pages = backlog_pages
+        self.now = 0.0
+
+    def page_stats(self, completed_after: float) -> Tuple[float, int]:
+        return self.backlog_pages, int(self.now - completed_after)
+
+
+@pytest.fixture
+def service(monkeypatch) -> Service:
+    service = Service(backlog_pages=80)
+    monkeypatch.setattr(reader.admission, "time", SimpleNamespace(time=lambda: service.now))
+    return service
+
+
+@pytest.fixture
+def admission(service: Service) -> AdmissionController:
+    return AdmissionController(service.page_stats, max_wait_s=100, initial_pages_per_s=1.0)
+
+
+def test_idle_service_admits_any_size(service: Service, admission: AdmissionController):
+    service.backlog_pages = 0
+    assert admission.check(10_000) is None
+
+
+def test_documents_are_admitted_while_the_backlog_drains_in_time(admission: AdmissionController):
+    assert admission.check(20) is None
+    # 80 queued + 50 pages at 1 page/s is 30s over the limit
+    assert admission.check(50) == 30
+    # Retry-After never goes past the backlog draining, after which anything gets in
+    assert admission.check(500) == 80
+
+
+def test_large_documents_age_in_instead_of_starving(service: Service, admission: AdmissionController):
+    tries = 0
+    retry_after_s = admission.check(500, key="big")
+    while retry_after_s is not None:
+        tries += 1
+        service.now += retry_after_s
+        retry_after_s = admission.check(500, key="big")
+
+    # It needs 580s with the backlog ahead of it, 480s more than max_wait_s allows
+    assert service.now == 480
+    assert tries == 6
+    assert admission.waiting == {}
+    # Without a key, or coming back for the first time, it is still turned away
+    assert admission.check(500) is not None
+    assert admission.check(500, key="other") is not None
+
+
+def test_documents_that_stop_retrying_lose_their_place(service: Service, admission: AdmissionController):
+    assert admission.check(500, key="big") == 80
+    service.now = 1000
+
+    assert admission.check(500, key="big") == 80
+    assert admission.waiting["big"][0] == 1000
+    assert admission.check(50, key="other") == 30
+    assert set(admission.waiting) == {"big", "other"}
@@ -0,0 +1,70 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for ChunkCache LRU and age eviction
+"""
+
+import os
+import time
+from pathlib import Path
+
+from reader.cache import ChunkCache, make_cache_key
+
+
+def key(name: str) -> str:
+    return make_cache_key(name.encode("utf-8"), "prompt", "model")
+
+
+def age(cache: ChunkCache, name: str, accessed_s_ago: float, modified_s_ago: float = 0) -> None:
+    now = time.time()
+    os.utime(cache._path(key(name)), (now - accessed_s_ago, now - modified_s_ago))
+
+
+def test_round_trip_and_key_inputs(tmp_path: Path):
+    cache = ChunkCache(str(tmp_path))
+    cache.set(key("a"), "text a")
+
+    assert cache.get(key("a")) == "text a"
+    assert cache.get(key("b")) is None
+    assert make_cache_key(b"a", "prompt", "model") != make_cache_key(b"a", "other prompt", "model")
+    assert make_cache_key(b"a", "prompt", "model") != make_cache_key(b"a", "prompt", "other model")
+
+
+def test_entries_past_max_age_are_dropped(tmp_path: Path):
+    cache = ChunkCache(str(tmp_path), max_age_s=60)
+    cache.set(key("old"), "old")
+    cache.set(key("new"), "new")
+    age(cache, "old", accessed_s_ago=120, modified_s_ago=120)
+
+    assert cache.get(key("old")) is None
+    assert not cache._path(key("old")).exists()
+    assert cache.get(key("new")) == "new"
+
+
+def test_eviction_drops_least_recently_used_first(tmp_path: Path):
+    # Each entry is 100 bytes, so the fourth write goes over the ceiling
+    cache = ChunkCache(str(tmp_path), max_bytes=350)
+    for index, name in enumerate(["a", "b", "c"]):
+        cache.set(key(name), name * 100)
+        age(cache, name, accessed_s_ago=100 - index * 10)
+
+    # Reading "a" makes it the most recently used
+    assert cache.get(key("a")) == "a" * 100
+    cache.set(key("d"), "d" * 100)
+
+    # Dropping "b", now the least recently used, gets back under 90% of the ceiling
+    assert cache.get(key("b")) is None
+    assert cache.get(key("a")) == "a" * 100
+    assert cache.get(key("c")) == "c" * 100
+    assert cache.get(key("d")) == "d" * 100
+
+
+def test_eviction_removes_expired_entries_before_lru(tmp_path: Path):
+    cache = ChunkCache(str(tmp_path), max_bytes=10**6, max_age_s=60)
+    cache.set(key("stale"), "x")
+    cache.set(key("fresh"), "y")
+    age(cache, "stale", accessed_s_ago=0, modified_s_ago=120)
+
+    cache.evict()
+    assert not cache._path(key("stale")).exists()
+    assert cache._path(key("fresh")).exists()
@@ -0,0 +1,108 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for bulk extraction inputs, output paths and failure accounting
+"""
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+from typing import List
+
+import fitz
+import pytest
+
+import reader.cli as cli
+from reader.pdf import FAILED_ALL_KEYS, ChunkResult
+
+
+class FakeProcessor:
+    """Stands in for PDFProcessor; fails every chunk of documents whose name contains "bad"."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def extract(self, pdf_file, prompt, stream=False, owner=None):
+        failed = "bad" in Path(owner).name
+        text = FAILED_ALL_KEYS if failed else f"text of {owner}"
+        yield ChunkResult(index=0, start_page=0, end_page=0, text=text)
+        yield text
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def processor(monkeypatch) -> FakeProcessor:
+    fake = FakeProcessor()
+    monkeypatch.setattr(cli, "get_pdf_processor", lambda: fake)
+    return fake
+
+
+def make_pdf(path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with fitz.open() as doc:
+        doc.new_page()
+        doc.save(path)
+    return path
+
+
+def run(tmp_path: Path, inputs: List[str], manifest=None) -> dict:
+    args = argparse.Namespace(
+        inputs=inputs,
+        manifest=manifest,
+        output_dir=str(tmp_path / "out"),
+        journal=None,
+        language="en",
+        documents=2,
+        force=False,
+        json=False,
+    )
+    return asyncio.run(cli.run(args))
+
+
+def journal(tmp_path: Path) -> dict:
+    lines = (tmp_path / "out" / cli.JOURNAL_NAME).read_text().splitlines()
+    return {Path(entry["path"]).name: entry for entry in map(json.loads, lines)}
+
+
+def test_missing_manifest_entries_are_journaled_as_failed(tmp_path: Path, processor: FakeProcessor):
+    make_pdf(tmp_path / "in" / "a.pdf")
+    manifest = tmp_path / "in" / "list.txt"
+    manifest.write_text("a.pdf\nmissing.pdf\n")
+
+    report = run(tmp_path, [], str(manifest))
+    assert (report["done"], report["failed"]) == (1, 1)
+    entries = journal(tmp_path)
+    assert entries["a.pdf"]["status"] == "done"
+    assert entries["missing.pdf"]["status"] == "failed"
+    assert (tmp_path / "out" / "a.md").exists()
+
+
+def test_same_named_pdfs_get_their_own_outputs(tmp_path: Path, processor: FakeProcessor):
+    first = make_pdf(tmp_path / "x" / "report.pdf")
+    second = make_pdf(tmp_path / "y" / "report.pdf")
+
+    report = run(tmp_path, [str(first), str(second)])
+    assert report["done"] == 2
+    outputs = sorted((tmp_path / "out").rglob("*.md"))
+    assert len(outputs) == 2
+    assert {output.read_text() for output in outputs} == {f"text of {first}", f"text of {second}"}
+
+    # A rerun finds both done under the same names
+    assert run(tmp_path, [str(first), str(second)])["skipped"] == 2
+
+
+def test_documents_with_failed_chunks_are_failed_and_not_written(tmp_path: Path, processor: FakeProcessor):
+    make_pdf(tmp_path / "in" / "good.pdf")
+    make_pdf(tmp_path / "in" / "bad.pdf")
+
+    report = run(tmp_path, [str(tmp_path / "in")])
+    assert (report["done"], report["failed"], report["failed_chunks"]) == (1, 1, 1)
+    assert not (tmp_path / "out" / "bad.md").exists()
+    assert journal(tmp_path)["bad.pdf"]["error"] == "1 of 1 chunks failed"
+    assert processor.closed
+
+    # Failed documents are retried on the next run
+    assert run(tmp_path, [str(tmp_path / "in")])["skipped"] == 1
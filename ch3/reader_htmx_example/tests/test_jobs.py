@@ -0,0 +1,74 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for claiming and requeueing jobs in the SQLite job queue
+"""
+
+from pathlib import Path
+
+from reader.jobs import JobKind, JobQueue
+
+
+def make_queue(tmp_path: Path) -> JobQueue:
+    return JobQueue(str(tmp_path / "reader.db"))
+
+
+def expire_heartbeats(queue: JobQueue) -> None:
+    queue.conn.execute("UPDATE jobs SET heartbeat_at = 0")
+
+
+def test_jobs_are_claimed_once_in_order(tmp_path: Path):
+    queue = make_queue(tmp_path)
+    first = queue.enqueue("t1", JobKind.EXTRACT)
+    queue.enqueue("t2", JobKind.RETRY, {"chunks": [3, 5]})
+    assert queue.queued_count() == 2
+
+    job = queue.claim("w1")
+    assert job is not None
+    assert (job.job_id, job.task_id, job.kind, job.attempts) == (first, "t1", JobKind.EXTRACT, 1)
+
+    # A second worker, on its own connection, gets the next job rather than the same one
+    other = make_queue(tmp_path).claim("w2")
+    assert other is not None
+    assert (other.task_id, other.kind, other.payload) == ("t2", JobKind.RETRY, {"chunks": [3, 5]})
+    assert queue.claim("w3") is None
+
+
+def test_finished_jobs_leave_the_queue(tmp_path: Path):
+    queue = make_queue(tmp_path)
+    queue.enqueue("t1", JobKind.EXTRACT)
+    job = queue.claim("w1")
+    queue.finish(job.job_id)
+
+    expire_heartbeats(queue)
+    assert queue.requeue_stale(stale_after_s=60, max_attempts=3) == ([], [])
+    assert queue.claim("w1") is None
+
+
+def test_stale_jobs_are_requeued_until_max_attempts(tmp_path: Path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("t1", JobKind.EXTRACT)
+
+    for attempt in (1, 2):
+        job = queue.claim("w1")
+        assert job.attempts == attempt
+        expire_heartbeats(queue)
+        assert queue.requeue_stale(stale_after_s=60, max_attempts=3) == ([job_id], [])
+        assert queue.queued_count() == 1
+
+    queue.claim("w1")
+    expire_heartbeats(queue)
+    # The third worker to stop responding drops the job and hands back its task to be failed
+    assert queue.requeue_stale(stale_after_s=60, max_attempts=3) == ([], ["t1"])
+    assert queue.claim("w1") is None
+
+
+def test_heartbeats_keep_running_jobs(tmp_path: Path):
+    queue = make_queue(tmp_path)
+    queue.enqueue("t1", JobKind.EXTRACT)
+    job = queue.claim("w1")
+    expire_heartbeats(queue)
+    queue.heartbeat(job.job_id)
+
+    assert queue.requeue_stale(stale_after_s=60, max_attempts=3) == ([], [])
+    assert queue.queued_count() == 0
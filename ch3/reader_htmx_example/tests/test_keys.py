@@ -0,0 +1,127 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for per-key token buckets and circuit breaker transitions
+- 002 - AI - Released keys by lease and added tests for requests that finish while a probe is in flight
+"""
+
+import asyncio
+import time
+
+from reader.keys import KeyOutcome, KeyScheduler
+
+
+def open_now(scheduler: KeyScheduler, api_key: str) -> None:
+    # Let an open circuit's cool-down run out without waiting for it
+    scheduler.keys[api_key].open_until = time.monotonic() - 1
+
+
+def test_token_bucket_spends_burst_then_refills():
+    scheduler = KeyScheduler(["k"], requests_per_minute=60, burst=2)
+    state = scheduler.keys["k"]
+
+    for _ in range(2):
+        lease = asyncio.run(scheduler.acquire())
+        assert lease.api_key == "k"
+        scheduler.release(lease, KeyOutcome.SUCCESS, 0.1)
+    assert state.tokens < 1
+    assert 0 < state.seconds_until_token() <= 1.0
+
+    state.refill(state.refilled_at + 10)
+    assert state.tokens == 2
+
+
+def test_request_failures_do_not_open_the_circuit():
+    scheduler = KeyScheduler(["k"], requests_per_minute=6000, failure_threshold=2)
+    for _ in range(5):
+        scheduler.release(asyncio.run(scheduler.acquire()), KeyOutcome.REQUEST_FAILED)
+
+    state = scheduler.keys["k"]
+    assert state.consecutive_failures == 0
+    assert not state.is_open(time.monotonic())
+
+
+def test_errors_open_the_circuit_at_the_threshold():
+    scheduler = KeyScheduler(["k"], requests_per_minute=6000, failure_threshold=2, circuit_open_s=30)
+    state = scheduler.keys["k"]
+
+    scheduler.release(asyncio.run(scheduler.acquire()), KeyOutcome.ERROR)
+    assert not state.is_open(time.monotonic())
+
+    scheduler.release(asyncio.run(scheduler.acquire()), KeyOutcome.ERROR)
+    assert state.is_open(time.monotonic())
+    assert state.half_open
+
+
+def test_half_open_key_takes_one_probe_and_closes_on_success():
+    scheduler = KeyScheduler(["k"], requests_per_minute=6000, failure_threshold=1)
+    state = scheduler.keys["k"]
+    scheduler.release(asyncio.run(scheduler.acquire()), KeyOutcome.ERROR)
+    open_now(scheduler, "k")
+
+    async def scenario() -> None:
+        probe = await scheduler.acquire()
+        assert probe.probe and state.probing
+        # A second request waits while the probe is in flight
+        second = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0.1)
+        assert not second.done()
+
+        scheduler.release(probe, KeyOutcome.SUCCESS, 0.1)
+        lease = await asyncio.wait_for(second, 1)
+        assert lease.api_key == "k" and not lease.probe
+
+    asyncio.run(scenario())
+    assert not state.half_open
+    assert state.consecutive_failures == 0
+
+
+def test_failed_probe_reopens_the_circuit():
+    scheduler = KeyScheduler(["k"], requests_per_minute=6000, failure_threshold=3, circuit_open_s=30)
+    state = scheduler.keys["k"]
+    for _ in range(3):
+        scheduler.release(asyncio.run(scheduler.acquire()), KeyOutcome.ERROR)
+    open_now(scheduler, "k")
+
+    scheduler.release(asyncio.run(scheduler.acquire()), KeyOutcome.ERROR)
+    assert state.is_open(time.monotonic())
+    assert state.half_open
+
+
+def test_requests_from_before_the_circuit_opened_do_not_settle_the_probe():
+    scheduler = KeyScheduler(["k"], requests_per_minute=6000, failure_threshold=1)
+    state = scheduler.keys["k"]
+
+    async def scenario() -> None:
+        stale_success = await scheduler.acquire()
+        stale_error = await scheduler.acquire()
+        scheduler.release(await scheduler.acquire(), KeyOutcome.ERROR)
+        open_now(scheduler, "k")
+
+        probe = await scheduler.acquire()
+        assert probe.probe
+        # Earlier requests finishing now neither close nor re-open the key, and no second probe goes out
+        scheduler.release(stale_success, KeyOutcome.SUCCESS, 0.1)
+        scheduler.release(stale_error, KeyOutcome.ERROR)
+        assert state.half_open and state.probing
+        assert not state.is_open(time.monotonic())
+        second = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0.1)
+        assert not second.done()
+
+        scheduler.release(probe, KeyOutcome.SUCCESS, 0.1)
+        scheduler.release(await asyncio.wait_for(second, 1), KeyOutcome.SUCCESS, 0.1)
+
+    asyncio.run(scenario())
+    assert not state.half_open
+    assert state.successes == 3
+
+
+def test_rate_limit_cools_the_key_down_and_others_take_over():
+    scheduler = KeyScheduler(["a", "b"], rate_limit_cooldown_s=20)
+    lease = asyncio.run(scheduler.acquire(exclude={"b"}))
+    assert lease.api_key == "a"
+    scheduler.release(lease, KeyOutcome.RATE_LIMITED)
+
+    assert scheduler.keys["a"].is_open(time.monotonic())
+    assert asyncio.run(scheduler.acquire()).api_key == "b"
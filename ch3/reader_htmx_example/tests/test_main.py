@@ -0,0 +1,137 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests that load the web app the way serve() does
+- 002 - AI - Added tests for the upload size limit and the upload hash
+- 003 - AI - Added a test for coalescing requests on the upload hash
+- 004 - AI - Added a test for turning documents away with 429 and Retry-After
+"""
+
+import hashlib
+import importlib.util
+import os
+from pathlib import Path
+from types import ModuleType
+from typing import Callable
+
+import fitz
+import pytest
+from starlette.testclient import TestClient
+
+import reader.config
+import reader.tasks
+
+MAIN_PATH = Path(__file__).resolve().parent.parent / "main.py"
+
+
+@pytest.fixture
+def load_main(monkeypatch, tmp_path: Path) -> Callable[[str], ModuleType]:
+    """Execute main.py as a fresh module, with an in-memory store and uploads under tmp_path."""
+    monkeypatch.setattr(reader.config, "configure_logfire", lambda: None)
+    monkeypatch.setattr(reader.tasks, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setenv("READER_TASK_STORE", "memory")
+    monkeypatch.setenv("READER_EXECUTION", "inline")
+
+    def load(name: str = "main") -> ModuleType:
+        spec = importlib.util.spec_from_file_location(name, MAIN_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return load
+
+
+def test_main_can_be_imported_twice(load_main):
+    # serve() imports main.py as __mp_main__ and then again as main in the same process
+    load_main("__mp_main__")
+    main = load_main("main")
+    main.task_manager.add_task("t", "a.pdf", "/uploads/a.pdf")
+
+    text = TestClient(main.app).get("/metrics").text
+    assert text.count("# TYPE reader_tasks_processing gauge") == 1
+    assert "reader_tasks_processing 1.0" in text.splitlines()
+
+
+def make_pdf(text: str) -> bytes:
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), text)
+        return doc.tobytes()
+
+
+def upload(client: TestClient, data: bytes, name: str = "a.pdf"):
+    return client.post("/api/pdf/upload", files={"pdf_file": (name, data, "application/pdf")})
+
+
+@pytest.fixture
+def app(load_main, monkeypatch) -> ModuleType:
+    monkeypatch.setenv("READER_MAX_UPLOAD_MB", "1")
+    main = load_main()
+
+    async def extract_nothing(*args) -> None:
+        # Leaves the task processing without calling the API
+        return None
+
+    monkeypatch.setattr(main, "run_extraction", extract_nothing)
+    return main
+
+
+def test_upload_is_stored_with_its_hash(app):
+    data = make_pdf("hello")
+    response = upload(TestClient(app.app), data)
+
+    body = response.json()
+    assert body["success"] and body["size_bytes"] == len(data)
+    assert os.path.dirname(body["temp_filename"]) == app.task_manager.upload_dir
+    assert app.task_manager.upload_hash(body["temp_filename"]) == hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("size", [1024 * 1024 + 1, 2 * 1024 * 1024])
+def test_oversized_uploads_are_refused_and_not_kept(app, size: int):
+    # Just over the limit gets past the Content-Length check and is caught on the file size; far over is not read
+    response = upload(TestClient(app.app), b"x" * size)
+
+    assert response.status_code == 413
+    assert os.listdir(app.task_manager.upload_dir) == []
+
+
+def test_malformed_content_length_is_a_bad_request(app):
+    response = TestClient(app.app).post("/api/pdf/upload", content=b"x", headers={"Content-Length": "abc"})
+    assert response.status_code == 400
+
+
+def request_processing(client: TestClient, temp_filename: str):
+    params = {"temp_filename": temp_filename, "original_filename": "a.pdf", "language": "en"}
+    return client.get("/api/pdf/process", params=params, headers={"HX-Request": "1"})
+
+
+def process(client: TestClient, temp_filename: str) -> str:
+    return request_processing(client, temp_filename).text.split("/api/tasks/")[1].split("/")[0]
+
+
+def test_identical_uploads_share_a_task_and_others_do_not(app):
+    client = TestClient(app.app)
+    data = make_pdf("same")
+    first = upload(client, data).json()["temp_filename"]
+    second = upload(client, data).json()["temp_filename"]
+    other = upload(client, make_pdf("other")).json()["temp_filename"]
+
+    task_id = process(client, first)
+    assert process(client, second) == task_id
+    assert process(client, other) != task_id
+
+    # After a restart the hash is computed again from the file, not taken from the request
+    app.task_manager.upload_hashes.clear()
+    assert process(client, second) == task_id
+
+
+def test_busy_service_turns_documents_away_with_retry_after(app):
+    client = TestClient(app.app)
+    temp_filename = upload(client, make_pdf("busy")).json()["temp_filename"]
+    app.admission.page_stats = lambda completed_after: (10_000.0, 0)
+
+    response = request_processing(client, temp_filename)
+    # 10,000 queued pages plus this one at 1 page/s, against the default 600s limit
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "9401"
+    assert 'hx-trigger="load delay:9401s"' in response.text
+    assert app.task_manager.processing_count() == 0
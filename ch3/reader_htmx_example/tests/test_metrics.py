@@ -0,0 +1,68 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for Prometheus text rendering and metric registration
+"""
+
+import pytest
+
+from reader.metrics import Registry
+
+
+def test_counter_renders_labels_sorted_and_escaped():
+    registry = Registry()
+    counter = registry.counter("reader_things_total", "Things", ["kind"])
+    counter.inc(kind="b")
+    counter.inc(2, kind='a "quoted"')
+
+    assert registry.render().splitlines() == [
+        "# HELP reader_things_total Things",
+        "# TYPE reader_things_total counter",
+        'reader_things_total{kind="a \\"quoted\\""} 2.0',
+        'reader_things_total{kind="b"} 1.0',
+    ]
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
+
+
+def test_gauge_reads_its_function_at_scrape_time():
+    registry = Registry()
+    depth = [3]
+    registry.gauge("reader_depth", "Depth", function=lambda: depth[0])
+    registry.gauge("reader_in_flight", "In flight", ["key"], function=lambda: {("...k1",): 2, ("...k0",): 1})
+    depth[0] = 5
+
+    lines = registry.render().splitlines()
+    assert "reader_depth 5.0" in lines
+    assert lines[-2:] == ['reader_in_flight{key="...k0"} 1.0', 'reader_in_flight{key="...k1"} 2.0']
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("reader_seconds", "Seconds", ["stage"], buckets=(1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value, stage="split")
+
+    assert registry.render().splitlines()[2:] == [
+        'reader_seconds_bucket{stage="split",le="1.0"} 2',
+        'reader_seconds_bucket{stage="split",le="5.0"} 3',
+        'reader_seconds_bucket{stage="split",le="+Inf"} 4',
+        'reader_seconds_sum{stage="split"} 14.5',
+        'reader_seconds_count{stage="split"} 4',
+    ]
+
+
+def test_registering_a_name_again_returns_the_same_metric():
+    registry = Registry()
+    counter = registry.counter("reader_things_total", "Things", ["kind"])
+    assert registry.counter("reader_things_total", "Things", ["kind"]) is counter
+
+    gauge = registry.gauge("reader_depth", "Depth", function=lambda: 1)
+    assert registry.gauge("reader_depth", "Depth", function=lambda: 2) is gauge
+    # The newest function wins, since it belongs to the copy of the module that is serving
+    assert "reader_depth 2.0" in registry.render().splitlines()
+
+    with pytest.raises(ValueError):
+        registry.histogram("reader_things_total", "Things", ["kind"])
+    with pytest.raises(ValueError):
+        registry.counter("reader_things_total", "Things", ["other"])
@@ -0,0 +1,209 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for falling back across API keys
+- 002 - AI - Added tests for hedging straggler chunks
+- 003 - AI - Added a test for extracting explicit page ranges
+"""
+
+import asyncio
+import io
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Union
+
+import fitz
+import pytest
+from google.genai import errors
+
+from reader.hedging import HedgeBudget
+from reader.keys import KeyScheduler
+from reader.pdf import CHUNK_SEPARATOR, FAILED_ALL_KEYS, ChunkResult, PDFProcessor
+from reader.scheduler import FairScheduler
+from reader.split import PDFChunk
+
+Reply = Union[str, Exception]
+
+
+def api_error(code: int) -> errors.APIError:
+    response_json = {"error": {"code": code, "status": "ERROR", "message": f"HTTP {code}"}}
+    return errors.ServerError(code, response_json) if code >= 500 else errors.ClientError(code, response_json)
+
+
+class FakeClients:
+    """Answers generate_content per key from a list of replies; the last reply repeats."""
+
+    def __init__(self, replies: Dict[str, List[Reply]]):
+        self.replies = replies
+        self.calls: List[str] = []
+
+    def __call__(self, api_key: str) -> SimpleNamespace:
+        async def generate_content(model: str, contents: List, config=None) -> SimpleNamespace:
+            self.calls.append(api_key)
+            replies = self.replies[api_key]
+            reply = replies.pop(0) if len(replies) > 1 else replies[0]
+            if isinstance(reply, Exception):
+                raise reply
+            return SimpleNamespace(text=reply)
+
+        return SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+
+
+@pytest.fixture
+def make_processor(monkeypatch) -> Callable[[FakeClients], PDFProcessor]:
+    monkeypatch.setenv("READER_CACHE_DISABLED", "1")
+
+    def make(clients: FakeClients) -> PDFProcessor:
+        keys = list(clients.replies)
+        processor = PDFProcessor(api_keys=keys, client_factory=clients)
+        processor.key_scheduler = KeyScheduler(keys, requests_per_minute=6000)
+        processor.retry_delay_s = 0
+        processor.split_workers = 0
+        return processor
+
+    return make
+
+
+def process(processor: PDFProcessor) -> str:
+    chunk = PDFChunk(start_page=0, end_page=1, data=b"%PDF-1.7")
+    return asyncio.run(processor._process_with_fallback(chunk, "prompt"))
+
+
+def test_server_error_falls_back_to_the_next_key(make_processor):
+    clients = FakeClients({"a": [api_error(503)], "b": ["### text"]})
+    processor = make_processor(clients)
+
+    assert process(processor) == "### text"
+    assert clients.calls == ["a", "b"]
+    assert processor.key_scheduler.keys["a"].errors == 1
+
+
+def test_empty_response_tries_the_next_key_without_blaming_the_first(make_processor):
+    clients = FakeClients({"a": [""], "b": ["### text"]})
+    processor = make_processor(clients)
+
+    assert process(processor) == "### text"
+    assert clients.calls == ["a", "b"]
+    assert processor.key_scheduler.keys["a"].errors == 0
+
+
+def test_rejected_request_is_not_retried_on_other_keys(make_processor):
+    clients = FakeClients({"a": [api_error(400)], "b": ["### text"]})
+    processor = make_processor(clients)
+
+    assert process(processor) == FAILED_ALL_KEYS
+    assert clients.calls == ["a"]
+
+
+def test_every_key_failing_gives_the_failure_marker(make_processor):
+    clients = FakeClients({"a": [api_error(503)], "b": [api_error(429)]})
+    processor = make_processor(clients)
+
+    assert process(processor) == FAILED_ALL_KEYS
+    assert clients.calls == ["a", "b"]
+    assert processor.key_scheduler.keys["b"].rate_limited == 1
+
+
+def test_explicit_ranges_extract_only_those_pages(make_processor):
+    clients = FakeClients({"a": ["### text"]})
+    processor = make_processor(clients)
+    with fitz.open() as doc:
+        for number in range(5):
+            doc.new_page().insert_text((72, 72), f"page {number}")
+        data = doc.tobytes()
+
+    async def collect() -> list:
+        return [
+            item async for item in processor.extract(io.BytesIO(data), "prompt", stream=True, ranges=[(1, 1), (3, 4)])
+        ]
+
+    items = asyncio.run(collect())
+    chunks = [item for item in items if isinstance(item, ChunkResult)]
+    assert [(chunk.index, chunk.start_page, chunk.end_page) for chunk in chunks] == [(0, 1, 1), (1, 3, 4)]
+    assert items[-1] == CHUNK_SEPARATOR.join(["### text"] * 2)
+    assert len(clients.calls) == 2
+
+
+class Attempts:
+    """Stands in for _process_with_fallback: each attempt waits its delay and returns its reply."""
+
+    def __init__(self, *replies: tuple):
+        self.replies = list(replies)
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self, chunk: PDFChunk, prompt: str, tried_keys=None) -> str:
+        delay_s, reply = self.replies[self.started]
+        self.started += 1
+        try:
+            await asyncio.sleep(delay_s)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return reply
+
+
+def hedging_processor(make_processor, attempts: Attempts, slots: int = 2) -> PDFProcessor:
+    processor = make_processor(FakeClients({"a": ["unused"]}))
+    processor._process_with_fallback = attempts
+    processor.chunk_scheduler = FairScheduler(slots)
+    # Ten fast chunks so far put the hedge threshold at 50ms
+    for _ in range(10):
+        processor.latency_tracker.observe(0.05)
+    return processor
+
+
+def hedge(processor: PDFProcessor, budget: HedgeBudget) -> str:
+    async def scenario() -> str:
+        chunk = PDFChunk(start_page=0, end_page=0)
+        # The primary attempt holds a slot, as it would inside process_pdf_chunk
+        async with processor.chunk_scheduler.slot("doc"):
+            result = await processor._process_with_hedging(chunk, "prompt", budget, "doc")
+        await asyncio.sleep(0)
+        return result
+
+    return asyncio.run(scenario())
+
+
+def test_hedge_wins_over_a_straggler_and_gives_its_slot_back(make_processor):
+    attempts = Attempts((5, "slow"), (0, "hedged"))
+    processor = hedging_processor(make_processor, attempts)
+    budget = HedgeBudget(1)
+
+    assert hedge(processor, budget) == "hedged"
+    assert (attempts.started, attempts.cancelled, budget.used) == (2, 1, 1)
+    assert processor.chunk_scheduler.in_use == 0
+
+
+def test_failed_attempt_does_not_beat_one_still_running(make_processor):
+    attempts = Attempts((0.2, "slow"), (0, FAILED_ALL_KEYS))
+    processor = hedging_processor(make_processor, attempts)
+
+    assert hedge(processor, HedgeBudget(1)) == "slow"
+    assert processor.chunk_scheduler.in_use == 0
+
+
+def test_no_hedge_without_budget(make_processor):
+    attempts = Attempts((0.2, "slow"), (0, "hedged"))
+    processor = hedging_processor(make_processor, attempts)
+
+    assert hedge(processor, HedgeBudget(0)) == "slow"
+    assert attempts.started == 1
+    assert processor.chunk_scheduler.in_use == 0
+
+
+def test_no_hedge_without_a_free_slot(make_processor):
+    attempts = Attempts((0.2, "slow"), (0, "hedged"))
+    processor = hedging_processor(make_processor, attempts, slots=1)
+    budget = HedgeBudget(1)
+
+    assert hedge(processor, budget) == "slow"
+    assert (attempts.started, budget.used) == (1, 0)
+
+
+def test_no_hedge_before_enough_latency_samples(make_processor):
+    attempts = Attempts((0.2, "slow"), (0, "hedged"))
+    processor = hedging_processor(make_processor, attempts)
+    processor.latency_tracker.samples_s.clear()
+
+    assert hedge(processor, HedgeBudget(1)) == "slow"
+    assert attempts.started == 1
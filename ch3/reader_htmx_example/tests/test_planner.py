@@ -0,0 +1,87 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for token-budget chunk boundaries and content-defined anchors
+- 002 - AI - Added a test for splitting text-heavy pages at the input token budget
+"""
+
+from typing import List
+
+from reader.planner import ANCHOR_EVERY_PAGES, MAX_SEGMENT_PAGES, PageProfile, plan_chunks, plan_fixed_chunks
+
+
+def page(index: int, text_chars: int = 1000, fingerprint: int = 1, image_count: int = 0) -> PageProfile:
+    # fingerprint 1 is never an anchor; multiples of ANCHOR_EVERY_PAGES are
+    return PageProfile(
+        index=index, text_chars=text_chars, image_count=image_count, drawing_count=0, fingerprint=fingerprint
+    )
+
+
+def pages(count: int, start: int = 0) -> List[PageProfile]:
+    return [page(index) for index in range(start, start + count)]
+
+
+def test_chunks_fill_up_to_the_token_budget():
+    page_tokens = page(0).output_tokens()
+    ranges = plan_chunks(pages(10), token_budget=page_tokens * 3, max_pages=100)
+    assert ranges == [(0, 2), (3, 5), (6, 8), (9, 9)]
+
+
+def test_max_pages_caps_each_chunk():
+    assert plan_chunks(pages(5), token_budget=10**9, max_pages=2) == [(0, 1), (2, 3), (4, 4)]
+
+
+def test_page_over_budget_gets_a_chunk_of_its_own():
+    profiles = pages(4)
+    profiles[1] = page(1, image_count=100)
+    ranges = plan_chunks(profiles, token_budget=page(0).output_tokens() * 3, max_pages=100)
+    assert ranges == [(0, 0), (1, 1), (2, 3)]
+
+
+def test_input_budget_splits_text_heavy_pages():
+    profiles = pages(4)
+    ranges = plan_chunks(profiles, token_budget=10**9, max_pages=100, input_token_budget=profiles[0].input_tokens() * 2)
+    assert ranges == [(0, 1), (2, 3)]
+
+
+def test_planning_from_the_middle_keeps_page_numbers():
+    assert plan_chunks(pages(4, start=10), token_budget=10**9, max_pages=2) == [(10, 11), (12, 13)]
+    assert plan_chunks([], token_budget=1, max_pages=1) == []
+
+
+def test_chunks_break_at_anchor_pages():
+    profiles = pages(20)
+    profiles[8] = page(8, fingerprint=ANCHOR_EVERY_PAGES)
+    assert plan_chunks(profiles, token_budget=10**9, max_pages=100) == [(0, 7), (8, 19)]
+
+
+def test_anchor_too_close_to_the_previous_one_is_skipped():
+    profiles = pages(10)
+    profiles[2] = page(2, fingerprint=ANCHOR_EVERY_PAGES)
+    assert plan_chunks(profiles, token_budget=10**9, max_pages=100) == [(0, 9)]
+
+
+def test_pages_without_text_are_cut_at_the_segment_limit():
+    profiles = [page(index, text_chars=0, fingerprint=0) for index in range(MAX_SEGMENT_PAGES + 5)]
+    ranges = plan_chunks(profiles, token_budget=10**9, max_pages=100)
+    assert ranges == [(0, MAX_SEGMENT_PAGES - 1), (MAX_SEGMENT_PAGES, MAX_SEGMENT_PAGES + 4)]
+
+
+def test_editing_a_page_only_moves_chunks_before_the_next_anchor():
+    profiles = pages(60)
+    for index in (10, 25, 40):
+        profiles[index] = page(index, fingerprint=ANCHOR_EVERY_PAGES * index)
+    budget = page(0).output_tokens() * 4
+    before = plan_chunks(profiles, token_budget=budget, max_pages=100)
+
+    # A longer page 3 shifts the budget cuts up to page 10, and nothing after it
+    edited = list(profiles)
+    edited[3] = page(3, text_chars=3000, fingerprint=7)
+    after = plan_chunks(edited, token_budget=budget, max_pages=100)
+
+    assert before != after
+    assert [r for r in before if r[0] >= 10] == [r for r in after if r[0] >= 10]
+
+
+def test_fixed_chunks_cover_every_page():
+    assert plan_fixed_chunks(5, 2) == [(0, 1), (2, 3), (4, 4)]
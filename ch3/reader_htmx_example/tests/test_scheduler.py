@@ -0,0 +1,87 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for fair-share slot ordering in FairScheduler
+"""
+
+import asyncio
+from typing import List
+
+from reader.scheduler import FairScheduler
+
+
+def test_try_acquire_only_takes_free_slots():
+    async def scenario() -> None:
+        scheduler = FairScheduler(1)
+        assert scheduler.try_acquire("a")
+        assert not scheduler.try_acquire("b")
+        scheduler.release("a")
+        assert scheduler.try_acquire("b")
+
+    asyncio.run(scenario())
+
+
+def test_owner_with_fewest_running_chunks_goes_first():
+    async def scenario() -> List[str]:
+        scheduler = FairScheduler(2)
+        order: List[str] = []
+        await scheduler.acquire("big")
+        await scheduler.acquire("big")
+
+        async def wait(owner: str) -> None:
+            await scheduler.acquire(owner)
+            order.append(owner)
+
+        # "big" queued its chunks first, but "small" has nothing running and is served before it
+        waiters = [asyncio.create_task(wait("big")) for _ in range(2)] + [asyncio.create_task(wait("small"))]
+        await asyncio.sleep(0)
+        assert scheduler.queued_total() == 3
+
+        scheduler.release("big")
+        await asyncio.sleep(0)
+        scheduler.release("big")
+        await asyncio.sleep(0)
+        scheduler.release("small")
+        await asyncio.sleep(0)
+        await asyncio.gather(*waiters)
+        return order
+
+    assert asyncio.run(scenario()) == ["small", "big", "big"]
+
+
+def test_ties_go_to_the_owner_served_longest_ago():
+    async def scenario() -> List[str]:
+        scheduler = FairScheduler(1)
+        order: List[str] = []
+        await scheduler.acquire("a")
+        scheduler.release("a")
+        await scheduler.acquire("b")
+
+        async def wait(owner: str) -> None:
+            await scheduler.acquire(owner)
+            order.append(owner)
+            scheduler.release(owner)
+
+        waiters = [asyncio.create_task(wait("b")), asyncio.create_task(wait("a"))]
+        await asyncio.sleep(0)
+        scheduler.release("b")
+        await asyncio.gather(*waiters)
+        return order
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario() -> None:
+        scheduler = FairScheduler(1)
+        await scheduler.acquire("a")
+        waiter = asyncio.create_task(scheduler.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        assert scheduler.queue_depth("b") == 0
+        scheduler.release("a")
+        assert scheduler.in_use == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,103 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for the text fast path, table detection and local chunk sizes
+- 002 - AI - Passed page profiles to has_table
+"""
+
+from typing import Callable, List
+
+import fitz
+import pytest
+
+from reader.planner import profile_page
+from reader.split import SplitOptions, plan_document
+from reader.textlayer import has_table, is_simple_text_page
+
+PARAGRAPH = "The quick brown fox jumps over the lazy dog. " * 12
+
+
+def text_page(doc: fitz.Document) -> fitz.Page:
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(72, 72, 540, 400), PARAGRAPH, fontsize=10)
+    return page
+
+
+def ruled_table_page(doc: fitz.Document) -> fitz.Page:
+    page = text_page(doc)
+    # Two columns are too few for the aligned-column check, so only find_tables sees this one;
+    # one shape holds the whole grid, so the page stays under the fast path's drawing limit
+    grid = page.new_shape()
+    for row in range(4):
+        for column in range(2):
+            cell = fitz.Rect(72 + column * 120, 450 + row * 20, 192 + column * 120, 470 + row * 20)
+            grid.draw_rect(cell)
+            page.insert_text((cell.x0 + 4, cell.y1 - 6), f"r{row}c{column}", fontsize=9)
+    grid.finish(color=(0, 0, 0), width=0.5)
+    grid.commit()
+    return page
+
+
+def borderless_table_page(doc: fitz.Document) -> fitz.Page:
+    page = text_page(doc)
+    for row in range(4):
+        for column, x in enumerate((72, 220, 370)):
+            page.insert_text((x, 460 + row * 16), f"cell {row}.{column}", fontsize=9)
+    return page
+
+
+def image_page(doc: fitz.Document) -> fitz.Page:
+    page = text_page(doc)
+    page.insert_image(fitz.Rect(72, 420, 200, 550), pixmap=fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), 0))
+    return page
+
+
+def make_pdf(*builders: Callable[[fitz.Document], fitz.Page]) -> bytes:
+    with fitz.open() as doc:
+        for build in builders:
+            build(doc)
+        return doc.tobytes()
+
+
+def options(**fields) -> SplitOptions:
+    defaults = dict(
+        chunk_size=2, adaptive_chunking=True, chunk_token_budget=16000, max_chunk_pages=10, text_fast_path=True
+    )
+    return SplitOptions(**{**defaults, **fields})
+
+
+def ranges(chunks) -> List[tuple]:
+    return [(chunk.start_page, chunk.end_page, chunk.local_text is not None) for chunk in chunks]
+
+
+@pytest.mark.parametrize("build", [ruled_table_page, borderless_table_page])
+def test_tables_are_detected(build):
+    with fitz.open(stream=make_pdf(text_page, build), filetype="pdf") as doc:
+        plain, table = profile_page(doc[0]), profile_page(doc[1])
+        assert is_simple_text_page(table)
+        assert not has_table(doc[0], plain)
+        assert has_table(doc[1], table)
+
+
+def test_simple_text_renders_locally_and_the_rest_goes_to_the_llm():
+    data = make_pdf(text_page, text_page, ruled_table_page, image_page, text_page)
+
+    chunks = plan_document(data, options())
+    assert ranges(chunks) == [(0, 1, True), (2, 3, False), (4, 4, True)]
+    assert PARAGRAPH.split(".")[0] in chunks[0].local_text
+
+
+def test_long_local_runs_are_split_into_chunks():
+    data = make_pdf(*[text_page] * 7)
+
+    chunks = plan_document(data, options(max_chunk_pages=3))
+    assert ranges(chunks) == [(0, 2, True), (3, 5, True), (6, 6, True)]
+    assert all(chunk.local_text for chunk in chunks)
+
+
+def test_fast_path_can_be_switched_off():
+    data = make_pdf(text_page, text_page)
+
+    assert ranges(plan_document(data, options(text_fast_path=False))) == [(0, 1, False)]
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        assert is_simple_text_page(profile_page(doc[0]))
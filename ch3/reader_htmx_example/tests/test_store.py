@@ -0,0 +1,140 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created round-trip tests for the in-memory and SQLite task stores
+- 002 - AI - Added a test for reopening an existing SQLite database
+- 003 - AI - Added tests for abandoned and interrupted tasks
+- 004 - AI - Added a test for subscriber last-seen times
+- 005 - AI - Counted the pages of the current run in page stats
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+from reader.pdf import ChunkResult
+from reader.store import MemoryTaskStore, SQLiteTaskStore, Task, TaskStatus, TaskStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path: Path) -> TaskStore:
+    if request.param == "memory":
+        return MemoryTaskStore()
+    return SQLiteTaskStore(str(tmp_path / "reader.db"))
+
+
+def make_task(**fields) -> Task:
+    return Task(**{"original_filename": "a.pdf", "temp_filename": "/uploads/a.pdf", **fields})
+
+
+def test_task_round_trip(store: TaskStore):
+    store.insert("t", make_task(content_hash="h", dedup_key="d", language="en", pages=12, run_pages=10))
+    store.update("t", progress=40, failed_chunks=1)
+
+    task = store.get("t")
+    assert task is not None
+    assert (task.status, task.progress, task.failed_chunks) == (TaskStatus.PROCESSING, 40, 1)
+    assert (task.content_hash, task.language, task.pages) == ("h", "en", 12)
+    assert store.page_stats(time.time()) == (6, 0)
+    assert store.find_id_by_dedup_key("d") == "t"
+    assert store.has_processing_temp_file("/uploads/a.pdf")
+    assert store.processing_count() == 1
+    assert store.get("missing") is None
+
+
+def test_chunks_come_back_in_order_and_pages(store: TaskStore):
+    store.insert("t", make_task())
+    for index in (2, 0, 1):
+        store.put_chunk(
+            "t", ChunkResult(index=index, start_page=index * 2, end_page=index * 2 + 1, text=f"章节 {index}")
+        )
+    # Retrying a chunk replaces it
+    store.put_chunk("t", ChunkResult(index=1, start_page=2, end_page=3, text="retried"))
+
+    assert [chunk.text for chunk in store.get_chunks("t")] == ["章节 0", "retried", "章节 2"]
+    assert [chunk.index for chunk in store.get_chunks("t", start=1, limit=1)] == [1]
+
+
+def test_set_result_completes_the_task(store: TaskStore):
+    store.insert("t", make_task(pages=10, run_pages=4))
+    completed_at = time.time()
+    store.set_result("t", 123, completed_at)
+
+    task = store.get("t")
+    assert task is not None
+    assert (task.status, task.progress, task.result_bytes) == (TaskStatus.COMPLETED, 100, 123)
+    assert store.page_stats(completed_at - 1) == (0, 4)
+
+
+def test_abandoned_and_interrupted_tasks(store: TaskStore):
+    store.insert("watched", make_task())
+    store.insert("left", make_task(last_seen_at=time.time() - 600))
+    store.touch("watched", time.time())
+
+    assert store.abandoned_ids(time.time() - 60) == ["left"]
+    if isinstance(store, SQLiteTaskStore):
+        assert store.fail_interrupted("restarted") == 2
+        assert store.get("left").status == TaskStatus.ERROR
+
+
+def test_subscribers_are_seen_until_they_go_quiet_or_leave(store: TaskStore):
+    store.insert("t", make_task())
+    store.touch_subscriber("t", "quiet", time.time() - 120)
+    assert not store.has_subscribers("t", time.time() - 60)
+
+    store.touch_subscriber("t", "polling", time.time())
+    assert store.has_subscribers("t", time.time() - 60)
+    store.remove_subscribers("t", "polling")
+    assert not store.has_subscribers("t", time.time() - 60)
+
+    store.touch_subscriber("t", "polling", time.time())
+    store.remove_subscribers("t")
+    assert not store.has_subscribers("t", 0)
+    # Finished tasks take no new subscribers
+    store.set_result("t", 4, time.time())
+    store.touch_subscriber("t", "late", time.time())
+    assert not store.has_subscribers("t", 0)
+
+
+def test_evict_drops_expired_then_oversized_tasks(store: TaskStore):
+    cutoff = 0.0
+    for task_id, result_bytes in (("old", 10), ("big", 100), ("small", 10)):
+        store.insert(task_id, make_task(temp_filename=f"/uploads/{task_id}.pdf"))
+        store.put_chunk(task_id, ChunkResult(index=0, start_page=0, end_page=0, text=task_id))
+        store.set_result(task_id, result_bytes, time.time())
+        time.sleep(0.01)
+        cutoff = cutoff or time.time()
+    store.insert("running", make_task(temp_filename="/uploads/running.pdf"))
+
+    # "old" is past the TTL; "big" goes because the rest would still be over the size budget
+    assert sorted(store.evict(older_than=cutoff, max_result_bytes=20)) == ["/uploads/big.pdf", "/uploads/old.pdf"]
+    assert store.get("big") is None and store.get_chunks("big") == []
+    assert store.get("small") is not None
+    assert store.get("running") is not None
+    assert store.temp_filenames() == {"/uploads/small.pdf", "/uploads/running.pdf"}
+
+
+def test_sqlite_update_rejects_unknown_fields(tmp_path: Path):
+    store = SQLiteTaskStore(str(tmp_path / "reader.db"))
+    store.insert("t", make_task())
+    with pytest.raises(ValueError):
+        store.update("t", original_filename="b.pdf")
+
+
+def test_sqlite_reopens_an_existing_database(tmp_path: Path):
+    path = str(tmp_path / "reader.db")
+    store = SQLiteTaskStore(path)
+    store.insert("t", make_task(pages=3))
+    store.put_chunk("t", ChunkResult(index=0, start_page=0, end_page=2, text="text"))
+    store.conn.close()
+
+    reopened = SQLiteTaskStore(path)
+    assert reopened.get("t").pages == 3
+    assert reopened.get_chunks("t")[0].text == "text"
+    columns = {row["name"] for row in reopened.conn.execute("PRAGMA table_info(tasks)")}
+    assert {"language", "pages", "failed_chunks", "last_seen_at"} <= columns
+    # Bodies are stored compressed, not as the plain text
+    body = sqlite3.connect(path).execute("SELECT body FROM task_chunks").fetchone()[0]
+    assert isinstance(body, bytes) and body != b"text"
@@ -0,0 +1,201 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for upload path checks and eviction in TaskManager
+- 002 - AI - Added tests for cancellation, subscribers and bookkeeping
+- 003 - AI - Added a test for subscribers seen by another process
+- 004 - AI - Added a test for the pages a retry puts back in the backlog
+"""
+
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from reader.pdf import FAILED_ALL_KEYS, ChunkResult
+from reader.store import MemoryTaskStore, SQLiteTaskStore, TaskStatus
+from reader.tasks import TaskManager
+
+
+@pytest.fixture
+def upload_dir(tmp_path: Path) -> Path:
+    return tmp_path / "uploads"
+
+
+@pytest.fixture
+def manager(upload_dir: Path) -> TaskManager:
+    return TaskManager(MemoryTaskStore(), str(upload_dir), task_ttl_s=0, orphan_grace_s=0)
+
+
+def start_task(manager: TaskManager, task_id: str = "t", chunks: int = 3) -> None:
+    path = Path(manager.upload_dir) / f"{task_id}.pdf"
+    path.write_bytes(b"%PDF")
+    # Like the process route, record the resolved upload path
+    manager.add_task(task_id, "a.pdf", manager.resolve_upload(str(path)), dedup_key=f"key-{task_id}")
+    for index in range(chunks):
+        manager.add_chunk_result(
+            task_id, ChunkResult(index=index, start_page=index, end_page=index, text=f"text {index}")
+        )
+
+
+def test_resolve_upload_only_accepts_files_in_the_upload_dir(manager: TaskManager, upload_dir: Path, tmp_path: Path):
+    inside = upload_dir / "a.pdf"
+    outside = tmp_path / "secret.txt"
+    outside.write_text("keep me")
+    (upload_dir / "link.pdf").symlink_to(outside)
+
+    assert manager.resolve_upload(str(inside)) == os.path.realpath(inside)
+    assert manager.resolve_upload(str(outside)) is None
+    assert manager.resolve_upload(str(upload_dir / ".." / "secret.txt")) is None
+    assert manager.resolve_upload(str(upload_dir / "link.pdf")) is None
+    assert manager.resolve_upload(str(upload_dir)) is None
+
+
+def test_eviction_never_removes_files_outside_the_upload_dir(manager: TaskManager, tmp_path: Path):
+    outside = tmp_path / "secret.txt"
+    outside.write_text("keep me")
+    # A task recorded before paths were checked, pointing outside the upload directory
+    manager.add_task("t", "a.pdf", str(outside))
+    manager.set_completed("t", "text")
+
+    manager.evict()
+    assert manager.get_task("t") is None
+    assert outside.read_text() == "keep me"
+
+
+def test_eviction_removes_expired_uploads_and_orphans(manager: TaskManager, upload_dir: Path):
+    start_task(manager, "done")
+    manager.set_completed("done", "text")
+    start_task(manager, "running")
+    orphan = upload_dir / "orphan.pdf"
+    orphan.write_bytes(b"%PDF")
+    time.sleep(0.01)
+
+    manager.evict()
+    assert not (upload_dir / "done.pdf").exists()
+    assert not orphan.exists()
+    assert (upload_dir / "running.pdf").exists()
+
+
+def test_orphan_scan_keeps_uploads_reached_through_a_symlink(tmp_path: Path):
+    (tmp_path / "real").mkdir()
+    (tmp_path / "link").symlink_to(tmp_path / "real")
+    manager = TaskManager(MemoryTaskStore(), str(tmp_path / "link"), task_ttl_s=0, orphan_grace_s=0)
+    start_task(manager, "running")
+    time.sleep(0.01)
+
+    manager.evict()
+    assert (tmp_path / "real" / "running.pdf").exists()
+
+
+def test_cancelling_a_retry_restores_the_completed_result(manager: TaskManager):
+    start_task(manager)
+    manager.add_chunk_result("t", ChunkResult(index=1, start_page=1, end_page=1, text=FAILED_ALL_KEYS))
+    manager.complete_from_chunks("t")
+    assert manager.get_task("t").failed_chunks == 1
+
+    assert [chunk.index for chunk in manager.start_retry("t")] == [1]
+    assert manager.cancel("t")
+
+    task = manager.get_task("t")
+    assert task.status == TaskStatus.COMPLETED
+    assert task.failed_chunks == 1
+    # The result is still served, and a chunk landing after the cancel does not change it
+    manager.add_chunk_result("t", ChunkResult(index=1, start_page=1, end_page=1, text="late"))
+    assert "".join(manager.iter_result("t")).count(FAILED_ALL_KEYS) == 1
+
+
+def test_retry_puts_only_the_failed_pages_back_in_the_backlog(manager: TaskManager, upload_dir: Path):
+    path = upload_dir / "t.pdf"
+    path.write_bytes(b"%PDF")
+    manager.add_task("t", "a.pdf", str(path), pages=10)
+    assert manager.page_stats(time.time()) == (10, 0)
+    for index in range(5):
+        text = FAILED_ALL_KEYS if index == 2 else f"text {index}"
+        manager.add_chunk_result("t", ChunkResult(index=index, start_page=index * 2, end_page=index * 2 + 1, text=text))
+    manager.complete_from_chunks("t")
+
+    assert [chunk.index for chunk in manager.start_retry("t")] == [2]
+    assert manager.page_stats(time.time()) == (2, 0)
+    completed_after = time.time()
+    manager.add_chunk_result("t", ChunkResult(index=2, start_page=4, end_page=5, text="text 2"))
+    manager.complete_from_chunks("t")
+    assert manager.page_stats(completed_after - 1) == (0, 2)
+
+
+def test_cancel_waits_for_every_subscriber(manager: TaskManager):
+    start_task(manager)
+    first = manager.subscribe("t")
+    second = manager.subscribe("t")
+
+    assert not manager.cancel("t", subscriber=first)
+    assert manager.get_task("t").status == TaskStatus.PROCESSING
+    assert manager.cancel("t", subscriber=second)
+
+    task = manager.get_task("t")
+    assert task.status == TaskStatus.CANCELLED
+    assert manager.find_reusable("key-t") is None
+
+
+def test_cancel_sees_subscribers_of_another_process(upload_dir: Path, tmp_path: Path):
+    path = str(tmp_path / "reader.db")
+    # Two web processes sharing one database, each with its own manager
+    first = TaskManager(SQLiteTaskStore(path), str(upload_dir))
+    second = TaskManager(SQLiteTaskStore(path), str(upload_dir))
+    start_task(first)
+    following = first.subscribe("t")
+    leaving = second.subscribe("t")
+
+    assert not second.cancel("t", subscriber=leaving)
+    assert second.get_task("t").status == TaskStatus.PROCESSING
+    # A client that stopped polling long ago no longer holds the task
+    first.store.touch_subscriber("t", following, time.time() - 120)
+    assert second.cancel("t")
+    assert first.get_task("t").status == TaskStatus.CANCELLED
+    assert not first.store.has_subscribers("t", 0)
+
+
+def test_reaper_skips_tasks_someone_still_follows(upload_dir: Path):
+    manager = TaskManager(MemoryTaskStore(), str(upload_dir), abandon_after_s=60)
+    start_task(manager, "followed")
+    start_task(manager, "left")
+    for task_id in ("followed", "left"):
+        manager.store.touch(task_id, time.time() - 120)
+    manager.subscribe("followed")
+
+    manager.cancel_abandoned()
+    assert manager.get_task("followed").status == TaskStatus.PROCESSING
+    assert manager.get_task("left").status == TaskStatus.CANCELLED
+
+
+def test_writes_after_a_cancel_are_dropped(manager: TaskManager):
+    start_task(manager)
+    manager.cancel("t")
+
+    manager.update_progress("t", 80)
+    manager.set_completed("t", "text")
+    manager.set_error("t", "boom")
+    task = manager.get_task("t")
+    assert (task.status, task.progress) == (TaskStatus.CANCELLED, 0)
+
+
+def test_bookkeeping_is_dropped_once_tasks_finish(manager: TaskManager):
+    start_task(manager, "a")
+    start_task(manager, "b")
+    start_task(manager, "c")
+    for task_id in ("a", "b", "c"):
+        manager.touch(task_id, manager.subscribe(task_id))
+    assert set(manager.last_touched) == {"a", "b", "c"}
+
+    manager.set_completed("a", "text")
+    # b and c finish in another process, which never calls set_completed here
+    manager.store.set_result("b", 4, time.time())
+    manager.store.set_result("c", 4, time.time())
+    manager.poll("b")
+    assert set(manager.last_touched) == {"c"}
+
+    manager.evict()
+    assert manager.last_touched == {}
+    assert manager.subscribers_touched == {}
+    assert not manager.store.has_subscribers("a", 0)
@@ -0,0 +1,72 @@
+"""
+## ChangeLog
+
+- 001 - AI - Created tests for retry jobs run by the extraction worker
+"""
+
+import asyncio
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pytest
+
+import reader.worker as worker
+from reader.jobs import Job, JobKind, JobQueue
+from reader.pdf import FAILED_ALL_KEYS, ChunkResult
+from reader.store import SQLiteTaskStore, TaskStatus
+from reader.tasks import TaskManager
+
+
+class FakeProcessor:
+    """Answers each retried range with fixed text, or raises once the given number of chunks is out."""
+
+    def __init__(self, fail_after: Optional[int] = None):
+        self.fail_after = fail_after
+        self.ranges: List[Tuple[int, int]] = []
+
+    async def extract(self, pdf_file, prompt, stream=False, owner=None, ranges=None):
+        self.ranges.extend(ranges)
+        for index, (start, end) in enumerate(ranges):
+            if index == self.fail_after:
+                raise RuntimeError("worker lost its connection")
+            yield ChunkResult(index=index, start_page=start, end_page=end, text=f"retried {start}")
+
+
+@pytest.fixture
+def manager(tmp_path: Path) -> TaskManager:
+    manager = TaskManager(SQLiteTaskStore(str(tmp_path / "reader.db")), str(tmp_path / "uploads"))
+    path = tmp_path / "uploads" / "a.pdf"
+    path.write_bytes(b"%PDF")
+    manager.add_task("t", "a.pdf", str(path))
+    for index, text in enumerate(["first", FAILED_ALL_KEYS, FAILED_ALL_KEYS]):
+        manager.add_chunk_result("t", ChunkResult(index=index, start_page=index, end_page=index, text=text))
+    manager.complete_from_chunks("t")
+    return manager
+
+
+def run_retry_job(manager: TaskManager, processor: FakeProcessor, chunks: List[int], monkeypatch) -> None:
+    monkeypatch.setattr(worker, "get_pdf_processor", lambda: processor)
+    job = Job(job_id=1, task_id="t", kind=JobKind.RETRY, payload={"chunks": chunks})
+    asyncio.run(worker.Worker(manager, JobQueue(manager.store.path)).execute(job))
+
+
+def test_requeued_retry_skips_chunks_already_retried(manager: TaskManager, monkeypatch):
+    processor = FakeProcessor()
+    assert [chunk.index for chunk in manager.start_retry("t")] == [1, 2]
+    # The first attempt at the job got chunk 1 through before its worker died
+    manager.add_chunk_result("t", ChunkResult(index=1, start_page=1, end_page=1, text="retried 1"))
+
+    run_retry_job(manager, processor, [1, 2], monkeypatch)
+    assert processor.ranges == [(2, 2)]
+    task = manager.get_task("t")
+    assert (task.status, task.failed_chunks) == (TaskStatus.COMPLETED, 0)
+    assert [chunk.text for chunk in manager.get_chunks("t")] == ["first", "retried 1", "retried 2"]
+
+
+def test_failed_retry_keeps_the_earlier_result(manager: TaskManager, monkeypatch):
+    failed = manager.start_retry("t")
+    run_retry_job(manager, FakeProcessor(fail_after=1), [chunk.index for chunk in failed], monkeypatch)
+
+    task = manager.get_task("t")
+    assert (task.status, task.error, task.failed_chunks) == (TaskStatus.COMPLETED, None, 1)
+    assert [chunk.text for chunk in manager.get_chunks("t")] == ["first", "retried 1", FAILED_ALL_KEYS]